@@ -7,10 +7,105 @@ class Settings(BaseSettings):
     
     # Security settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecretkey")
+    ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
+    # After a logout, other workers keep accepting the session's access
+    # tokens until their next revocation sync, at most this long
+    REVOCATION_SYNC_SECONDS: int = int(os.getenv("REVOCATION_SYNC_SECONDS", "10"))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+    CUSTOMER_ACCESS_TOKEN_EXPIRE_DAYS: int = int(os.getenv("CUSTOMER_ACCESS_TOKEN_EXPIRE_DAYS", "30"))
+    
+    # Customer quote page cache (per process)
+    QUOTE_VIEW_CACHE_TTL_SECONDS: int = int(os.getenv("QUOTE_VIEW_CACHE_TTL_SECONDS", "30"))
+    QUOTE_RENDER_CACHE_SIZE: int = int(os.getenv("QUOTE_RENDER_CACHE_SIZE", "1000"))
+    
+    # Auth cache settings (per process)
+    AUTH_TOKEN_CACHE_SIZE: int = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+    AUTH_USER_CACHE_SIZE: int = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+    # How long another worker may still authorize a deactivated or demoted
+    # (non-admin) user; keep it short
+    AUTH_USER_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+    
+    # Password hashing and login throttling
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+    LOGIN_MAX_FAILURES_PER_ACCOUNT: int = int(os.getenv("LOGIN_MAX_FAILURES_PER_ACCOUNT", "5"))
+    LOGIN_MAX_FAILURES_PER_IP: int = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "50"))
+    LOGIN_THROTTLE_WINDOW_SECONDS: int = int(os.getenv("LOGIN_THROTTLE_WINDOW_SECONDS", "300"))
     
     # Application settings
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     LEAD_EXPIRY_HOURS: int = int(os.getenv("LEAD_EXPIRY_HOURS", "48"))
+    LEAD_EXPIRY_CHUNK_SIZE: int = int(os.getenv("LEAD_EXPIRY_CHUNK_SIZE", "5000"))
+    LEAD_TRANSITION_CHUNK_SIZE: int = int(os.getenv("LEAD_TRANSITION_CHUNK_SIZE", "5000"))  # leads per bulk UPDATE
+    LEAD_EXPIRY_WARNING_HOURS: int = int(os.getenv("LEAD_EXPIRY_WARNING_HOURS", "6"))
+    
+    # Periodic jobs (cron expressions; empty disables a job)
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_POLL_SECONDS: int = int(os.getenv("SCHEDULER_POLL_SECONDS", "30"))
+    SCHEDULER_LEASE_SECONDS: int = int(os.getenv("SCHEDULER_LEASE_SECONDS", "900"))
+    JOB_RUN_RETENTION_DAYS: int = int(os.getenv("JOB_RUN_RETENTION_DAYS", "30"))
+    SCHEDULE_EXPIRE_LEADS: str = os.getenv("SCHEDULE_EXPIRE_LEADS", "*/5 * * * *")
+    SCHEDULE_WARN_EXPIRING_LEADS: str = os.getenv("SCHEDULE_WARN_EXPIRING_LEADS", "*/15 * * * *")
+    SCHEDULE_KPI_METRICS: str = os.getenv("SCHEDULE_KPI_METRICS", "15 2 * * *")
+    SCHEDULE_PURGE_EXPIRED: str = os.getenv("SCHEDULE_PURGE_EXPIRED", "30 3 * * *")
+    SCHEDULE_BATCH_ASSIGN: str = os.getenv("SCHEDULE_BATCH_ASSIGN", "")
+    SCHEDULE_QUOTE_ITEM_STATS: str = os.getenv("SCHEDULE_QUOTE_ITEM_STATS", "*/10 * * * *")
+    
+    # Background job queue (run "python -m app.worker", or the embedded worker)
+    JOB_QUEUE_EMBEDDED_WORKER: bool = os.getenv("JOB_QUEUE_EMBEDDED_WORKER", "true").lower() == "true"
+    JOB_QUEUE_CONCURRENCY: int = int(os.getenv("JOB_QUEUE_CONCURRENCY", "2"))
+    JOB_QUEUE_POLL_SECONDS: float = float(os.getenv("JOB_QUEUE_POLL_SECONDS", "1"))
+    JOB_QUEUE_MAX_ATTEMPTS: int = int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "3"))
+    JOB_QUEUE_RETRY_BACKOFF_SECONDS: int = int(os.getenv("JOB_QUEUE_RETRY_BACKOFF_SECONDS", "30"))
+    JOB_QUEUE_STALE_SECONDS: int = int(os.getenv("JOB_QUEUE_STALE_SECONDS", "300"))
+    JOB_QUEUE_RETENTION_DAYS: int = int(os.getenv("JOB_QUEUE_RETENTION_DAYS", "7"))
+    
+    # Change feed (entity_changes) for integrations
+    CHANGE_FEED_BATCH_SIZE: int = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "1000"))
+    CHANGE_FEED_MAX_BATCH_SIZE: int = int(os.getenv("CHANGE_FEED_MAX_BATCH_SIZE", "10000"))
+    CHANGE_FEED_RETENTION_DAYS: int = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+    
+    # Accounting integration. Without ACCOUNTING_API_URL invoices and
+    # customers are only simulated locally.
+    ACCOUNTING_SYSTEM: str = os.getenv("ACCOUNTING_SYSTEM", "quickbooks")  # quickbooks, xero, fortnox, visma
+    ACCOUNTING_API_URL: str = os.getenv("ACCOUNTING_API_URL", "")
+    ACCOUNTING_API_KEY: str = os.getenv("ACCOUNTING_API_KEY", "")
+    ACCOUNTING_API_SECRET: str = os.getenv("ACCOUNTING_API_SECRET", "")
+    ACCOUNTING_TENANT_ID: str = os.getenv("ACCOUNTING_TENANT_ID", "")
+    ACCOUNTING_TIMEOUT_SECONDS: float = float(os.getenv("ACCOUNTING_TIMEOUT_SECONDS", "15"))
+    ACCOUNTING_CONCURRENCY: int = int(os.getenv("ACCOUNTING_CONCURRENCY", "4"))
+    ACCOUNTING_REQUESTS_PER_SECOND: float = float(os.getenv("ACCOUNTING_REQUESTS_PER_SECOND", "0"))  # 0: system's limit
+    ACCOUNTING_BATCH_SIZE: int = int(os.getenv("ACCOUNTING_BATCH_SIZE", "0"))  # 0: system's maximum
+    ACCOUNTING_SYNC_CHUNK_SIZE: int = int(os.getenv("ACCOUNTING_SYNC_CHUNK_SIZE", "500"))
+    ACCOUNTING_MAX_ATTEMPTS: int = int(os.getenv("ACCOUNTING_MAX_ATTEMPTS", "5"))
+    
+    # Bulk quote repricing (services/pricing_engine.py)
+    PRICING_CHUNK_SIZE: int = int(os.getenv("PRICING_CHUNK_SIZE", "5000"))  # quotes per transaction
+    
+    # Partner price catalogue (services/price_catalogue.py)
+    PRICE_CATALOGUE_TTL_SECONDS: int = int(os.getenv("PRICE_CATALOGUE_TTL_SECONDS", "60"))
+    # Quote item prices further than this from the catalogue price are rejected; -1 disables the check
+    PRICE_CATALOGUE_TOLERANCE_PERCENT: int = int(os.getenv("PRICE_CATALOGUE_TOLERANCE_PERCENT", "50"))
+    
+    # Quote revision history: a full snapshot every N revisions, deltas in between
+    QUOTE_VERSION_SNAPSHOT_INTERVAL: int = int(os.getenv("QUOTE_VERSION_SNAPSHOT_INTERVAL", "10"))
+    
+    # Automatic lead assignment
+    AUTO_ASSIGN_NEW_LEADS: bool = os.getenv("AUTO_ASSIGN_NEW_LEADS", "false").lower() == "true"
+    POSTCODE_REGIONS_FILE: str = os.getenv("POSTCODE_REGIONS_FILE", "")  # empty: bundled app/data file
+    ASSIGNMENT_INDEX_TTL_SECONDS: int = int(os.getenv("ASSIGNMENT_INDEX_TTL_SECONDS", "300"))
+    ASSIGNMENT_SCORE_WINDOW_DAYS: int = int(os.getenv("ASSIGNMENT_SCORE_WINDOW_DAYS", "90"))
+    ASSIGNMENT_LOAD_PENALTY: float = float(os.getenv("ASSIGNMENT_LOAD_PENALTY", "0.05"))
+    NEAREST_PARTNER_RADIUS_KM: float = float(os.getenv("NEAREST_PARTNER_RADIUS_KM", "50"))
+    NEAREST_PARTNER_LIMIT: int = int(os.getenv("NEAREST_PARTNER_LIMIT", "5"))
+    DEFAULT_SERVICE_RADIUS_KM: float = float(os.getenv("DEFAULT_SERVICE_RADIUS_KM", "50"))
+    PARTNER_GRID_CELL_DEGREES: float = float(os.getenv("PARTNER_GRID_CELL_DEGREES", "0.5"))
+    BATCH_ASSIGN_MAX_LEADS: int = int(os.getenv("BATCH_ASSIGN_MAX_LEADS", "5000"))
+    BATCH_ASSIGN_CANDIDATES: int = int(os.getenv("BATCH_ASSIGN_CANDIDATES", "10"))
+    BATCH_ASSIGN_PARTNER_CAPACITY: int = int(os.getenv("BATCH_ASSIGN_PARTNER_CAPACITY", "10"))  # if max_open_leads unset
+    BATCH_ASSIGN_PROXIMITY_WEIGHT: float = float(os.getenv("BATCH_ASSIGN_PROXIMITY_WEIGHT", "0.5"))
     
     # Email settings
     EMAIL_FROM: str = os.getenv("EMAIL_FROM", "noreply@t24leads.se")
@@ -18,5 +113,40 @@ class Settings(BaseSettings):
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
     SMTP_USER: str = os.getenv("SMTP_USER", "")
     SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "")
+    # Emails are only logged unless sending is enabled; BASE_URL is for tracking links
+    ENABLE_EMAIL_SENDING: bool = os.getenv("ENABLE_EMAIL_SENDING", "false").lower() == "true"
+    BASE_URL: str = os.getenv("BASE_URL", "http://localhost:8000")
+    
+    # HTTP caching settings
+    ANALYTICS_CACHE_TTL_SECONDS: int = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+    KPI_CACHE_TTL_SECONDS: int = int(os.getenv("KPI_CACHE_TTL_SECONDS", "30"))
+    AGGREGATE_CACHE_SIZE: int = int(os.getenv("AGGREGATE_CACHE_SIZE", "256"))
+    
+    # Response compression settings
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    COMPRESSION_ENCODINGS: str = os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip")
+    COMPRESSION_CONTENT_TYPES: str = os.getenv(
+        "COMPRESSION_CONTENT_TYPES", "application/json,text/html,text/csv,text/plain"
+    )
+    GZIP_COMPRESSION_LEVEL: int = int(os.getenv("GZIP_COMPRESSION_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "4"))
+    ZSTD_COMPRESSION_LEVEL: int = int(os.getenv("ZSTD_COMPRESSION_LEVEL", "3"))
+    
+    # Push notification settings
+    PUSH_NOTIFICATIONS_ENABLED: bool = os.getenv("PUSH_NOTIFICATIONS_ENABLED", "true").lower() == "true"
+    # FCM HTTP v1: the Firebase project and a service account JSON key file
+    FCM_PROJECT_ID: str = os.getenv("FCM_PROJECT_ID", "")
+    FCM_SERVICE_ACCOUNT_FILE: str = os.getenv("FCM_SERVICE_ACCOUNT_FILE", "")
+    FCM_ENDPOINT: str = os.getenv("FCM_ENDPOINT", "https://fcm.googleapis.com/v1")
+    # APNs token auth: the .p8 key (PEM contents or file path), its key id, the team id and the app bundle id
+    APNS_KEY_ID: str = os.getenv("APNS_KEY_ID", "")
+    APNS_TEAM_ID: str = os.getenv("APNS_TEAM_ID", "")
+    APNS_AUTH_KEY: str = os.getenv("APNS_AUTH_KEY", "")
+    APNS_TOPIC: str = os.getenv("APNS_TOPIC", "")
+    APNS_USE_SANDBOX: bool = os.getenv("APNS_USE_SANDBOX", "false").lower() == "true"
+    PUSH_BATCH_SIZE: int = int(os.getenv("PUSH_BATCH_SIZE", "500"))
+    PUSH_CONCURRENCY: int = int(os.getenv("PUSH_CONCURRENCY", "10"))  # requests in flight per batch
+    PUSH_TIMEOUT_SECONDS: float = float(os.getenv("PUSH_TIMEOUT_SECONDS", "10"))
 
 settings = Settings()
@@ -5,14 +5,23 @@ from sqlalchemy.orm import Session
 import logging
 import os
 
-from app.database import engine, Base, get_db
-from app.routes import auth, leads, quotes, admin, partner, kpi
+from app.database import engine, Base, get_db, SessionLocal
+from app.routes import auth, leads, quotes, admin, partner, kpi, jobs, changes, pricing
 from app.utils.notification_service import router as notification_router
 from app.utils.mobile_api import router as mobile_api_router
 from app.utils.analytics import router as analytics_router
 from app.utils.customer_portal import router as customer_portal_router
 from app.utils.accounting import router as accounting_router
 from app.sample_data import create_sample_data
+from app.services.refresh_tokens import RefreshTokenService, revocations
+from app.services.customer_access_tokens import CustomerAccessTokenService
+from app.services.scheduler import scheduler
+from app.services.job_queue import worker as job_queue_worker
+from app.tasks.periodic import register_periodic_jobs
+import app.tasks.background  # noqa: F401 - registers background job handlers
+from app.utils.responses import T24JSONResponse
+from app.utils.compression import CompressionMiddleware, split_setting
+from app.config import settings
 
 # OAuth2 token path fix for Swagger & authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/token")
@@ -28,7 +37,8 @@ Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title="T24 Arborist Lead System API",
     description="API for managing arborist leads, quotes, and partners",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=T24JSONResponse
 )
 
 # Configure CORS
@@ -40,6 +50,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (analytics, exports) for mobile and BI clients
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        encodings=split_setting(settings.COMPRESSION_ENCODINGS),
+        content_types=split_setting(settings.COMPRESSION_CONTENT_TYPES),
+        gzip_level=settings.GZIP_COMPRESSION_LEVEL,
+        brotli_quality=settings.BROTLI_QUALITY,
+        zstd_level=settings.ZSTD_COMPRESSION_LEVEL,
+    )
+
 # Include routers
 app.include_router(auth.router, prefix="/api/v1", tags=["Authentication"])
 app.include_router(leads.router, prefix="/api/v1", tags=["Leads"])
@@ -47,6 +69,9 @@ app.include_router(quotes.router, prefix="/api/v1", tags=["Quotes"])
 app.include_router(admin.router, prefix="/api/v1", tags=["Admin"])
 app.include_router(partner.router, prefix="/api/v1", tags=["Partner"])
 app.include_router(kpi.router, prefix="/api/v1", tags=["KPI"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["Background Jobs"])
+app.include_router(changes.router, prefix="/api/v1", tags=["Change Feed"])
+app.include_router(pricing.router, prefix="/api/v1", tags=["Pricing"])
 
 # Include additional feature routers
 app.include_router(notification_router, prefix="/api/v1", tags=["Notifications"])
@@ -65,8 +90,32 @@ def health_check():
 
 @app.on_event("startup")
 def startup_event():
+    # Load revoked mobile sessions and spent refresh tokens into memory,
+    # and sweep expired refresh and customer access tokens
+    db = SessionLocal()
+    try:
+        RefreshTokenService(db).purge_expired()
+        CustomerAccessTokenService(db).purge_expired()
+        revocations.load(db)
+    finally:
+        db.close()
+    
+    # Periodic jobs; every worker polls, one runs each occurrence
+    if settings.SCHEDULER_ENABLED:
+        register_periodic_jobs(scheduler)
+        scheduler.start()
+    
+    # Background job worker; disable when running `python -m app.worker`
+    if settings.JOB_QUEUE_EMBEDDED_WORKER:
+        job_queue_worker.start()
+    
     # Load sample data if enabled
     if os.environ.get("CREATE_SAMPLE_DATA", "false").lower() == "true":
         db = next(get_db())
         create_sample_data(db)
         logger.info("Sample data created")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler.stop()
+    job_queue_worker.stop()
@@ -1,5 +1,25 @@
 # Import models to make them available for SQLAlchemy
 from app.models.user import User, UserRole
 from app.models.lead import Lead, LeadStatus
+from app.models.customer import Customer
 from app.models.quote import Quote, QuoteStatus, QuoteItem
 from app.models.kpi import KPIEvent
+from app.models.change_log import ChangeLog, ChangeEntity, ChangeOperation, EntityChange, ChangeConsumer
+from app.models.mobile_device import MobileDevice, PushProvider
+from app.models.refresh_token import RefreshToken
+from app.models.quote_render import QuoteRender
+from app.models.customer_access_token import CustomerAccessToken
+from app.models.scheduled_job import ScheduledJob, JobRun, JobRunStatus
+from app.models.background_job import BackgroundJob, BackgroundJobStatus
+from app.models.accounting_invoice import AccountingInvoice, AccountingInvoiceStatus
+from app.models.price_catalogue import CataloguePrice, QuoteItemStats
+from app.models.quote_version import QuoteVersion
+
+# Register the flush hook that feeds change_log for mobile delta sync
+import app.services.change_tracking  # noqa: E402,F401
+
+# Register the hook that links new leads to customer portal accounts
+import app.services.customer_linking  # noqa: E402,F401
+
+# Register the hook that geocodes new leads
+import app.services.geo_service  # noqa: E402,F401
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Text, Numeric, ForeignKey, Index
+from sqlalchemy.sql import func
+import enum
+
+from app.database import Base
+
+
+class AccountingInvoiceStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class AccountingInvoice(Base):
+    """
+    Ledger of invoices pushed to the accounting system, one row per approved
+    quote. The row is written before the invoice is sent; its idempotency
+    key is passed to the accounting system, so a retried send never creates
+    a second invoice there.
+    """
+    __tablename__ = "accounting_invoices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), nullable=False, unique=True)
+    idempotency_key = Column(String(64), nullable=False, unique=True)
+    accounting_system = Column(String(32), nullable=False)
+    status = Column(Enum(AccountingInvoiceStatus), nullable=False, default=AccountingInvoiceStatus.PENDING)
+
+    external_id = Column(String, nullable=True)  # invoice id in the accounting system
+    amount = Column(Numeric(precision=10, scale=2), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Each sync picks up "status in (pending, failed) ORDER BY id"
+        Index("ix_accounting_invoices_status", "status", "id"),
+    )
+
+    def __repr__(self):
+        return f"<AccountingInvoice {self.id}: quote {self.quote_id} {self.status}>"
@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Text, LargeBinary, ForeignKey, Index
+from sqlalchemy.sql import func
+import enum
+
+from app.database import Base
+
+
+class BackgroundJobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class BackgroundJob(Base):
+    """
+    A unit of work submitted by an API request and run by a queue worker.
+
+    Workers claim the oldest due QUEUED row with SELECT ... FOR UPDATE SKIP
+    LOCKED. A failed attempt is re-queued with backoff until max_attempts;
+    a RUNNING job whose heartbeat stops is re-queued as well, or failed if
+    it has no attempts left.
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(64), nullable=False)
+    params = Column(Text, nullable=True)  # JSON
+    status = Column(Enum(BackgroundJobStatus), nullable=False, default=BackgroundJobStatus.QUEUED)
+
+    submitted_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+
+    locked_by = Column(String, nullable=True)  # host:pid:claim token
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    progress = Column(Integer, nullable=False, default=0)  # percent
+    progress_message = Column(String, nullable=True)
+
+    result = Column(Text, nullable=True)  # JSON
+    result_file = Column(LargeBinary, nullable=True)  # e.g. an export
+    result_content_type = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Workers claim "status = queued AND run_after <= now ORDER BY id"
+        Index("ix_background_jobs_status_run_after", "status", "run_after"),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob {self.id}: {self.kind} {self.status}>"
@@ -0,0 +1,92 @@
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Enum, Text, Index
+from sqlalchemy.sql import func
+import enum
+
+from app.database import Base
+
+
+class ChangeOperation(str, enum.Enum):
+    UPSERT = "upsert"
+    DELETE = "delete"
+
+
+class ChangeEntity(str, enum.Enum):
+    LEAD = "lead"
+    QUOTE = "quote"
+    QUOTE_ITEM = "quote_item"
+    NOTIFICATION = "notification"
+
+
+class ChangeLog(Base):
+    """
+    Append-only log of changes to the entities the mobile app syncs.
+
+    Each row is addressed to the user who can see the entity (the assigned
+    partner, or the notification recipient). The autoincrement id is the
+    change sequence that mobile sync tokens refer to.
+    """
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    entity_type = Column(Enum(ChangeEntity), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(Enum(ChangeOperation), nullable=False)
+    # Writing transaction's id on PostgreSQL; sync tokens stop before rows
+    # of transactions that may still be running
+    xid = Column(BigInteger, nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Sync reads "changes for user after sequence N"
+        Index("ix_change_log_user_id_id", "user_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<ChangeLog {self.id}: {self.operation} {self.entity_type} {self.entity_id}>"
+
+
+class EntityChange(Base):
+    """
+    Change-data-capture feed of leads, quotes, quote items and
+    notifications for integrations (accounting, BI exports).
+
+    One row per change, whoever can see the entity. diff is a JSON object
+    of the changed columns and their new values (every column for an
+    insert, null for a delete); version is the row version after the
+    change, for entities that have one. The autoincrement id is the feed
+    offset that consumers acknowledge (see ChangeConsumer).
+    """
+    __tablename__ = "entity_changes"
+
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(Enum(ChangeEntity), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(Enum(ChangeOperation), nullable=False)
+    version = Column(Integer, nullable=True)
+    diff = Column(Text, nullable=True)  # JSON
+    # Writing transaction's id on PostgreSQL; readers stop before rows of
+    # transactions that may still be running (see feed_head)
+    xid = Column(BigInteger, nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Retention purge
+        Index("ix_entity_changes_created_at", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<EntityChange {self.id}: {self.operation} {self.entity_type} {self.entity_id}>"
+
+
+class ChangeConsumer(Base):
+    """A named reader of the entity_changes feed and the last offset it acknowledged"""
+    __tablename__ = "change_consumers"
+
+    name = Column(String(64), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    acknowledged_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<ChangeConsumer {self.name} at {self.position}>"
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy.orm import relationship
+
+from app.database import Base
+
+
+class Customer(Base):
+    """A customer portal account. Email is stored normalized (see normalize_email)."""
+    __tablename__ = "customers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True, nullable=False)
+    name = Column(String, nullable=False)
+    phone = Column(String, nullable=True)
+    hashed_password = Column(String, nullable=False)
+    is_verified = Column(Boolean, default=False)
+    verification_token = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    verified_at = Column(DateTime(timezone=True), nullable=True)
+    last_login = Column(DateTime(timezone=True), nullable=True)
+
+    leads = relationship("Lead", back_populates="customer")
+
+    def __repr__(self):
+        return f"<Customer {self.id}: {self.email}>"
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form of an email address for lookups and linking"""
+    return email.strip().lower()
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class CustomerAccessToken(Base):
+    """
+    A link emailed to a customer so they can view and answer a quote.
+
+    Only the sha256 of the opaque token is stored. The row points at the
+    pre-rendered quote (see QuoteRender), so opening the link is one indexed
+    read. A token can be used to respond once; it stops working when revoked
+    or expired.
+    """
+    __tablename__ = "customer_access_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+
+    lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), nullable=False, index=True)
+    customer_email = Column(String, nullable=True)
+
+    # Current rendering of the quote, repointed when the quote is answered
+    render_hash = Column(String(64), ForeignKey("quote_renders.content_hash"), nullable=False, index=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    responded_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Expiry sweep
+        Index("ix_customer_access_tokens_expires_at", "expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<CustomerAccessToken {self.id}: quote {self.quote_id}>"
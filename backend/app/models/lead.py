@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Float, Numeric, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -29,9 +29,18 @@ class Lead(Base):
     city = Column(String, nullable=False)
     postal_code = Column(String, nullable=False)
     region = Column(String, nullable=False)
+    
+    # Approximate location, geocoded from postal_code/city on insert
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    
     summary = Column(Text, nullable=False)
     details = Column(Text, nullable=True)
     
+    # Customer portal account, linked by normalized email (see customer_linking)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True, index=True)
+    customer = relationship("Customer", back_populates="leads")
+    
     status = Column(Enum(LeadStatus), default=LeadStatus.NEW, nullable=False)
     
     assigned_partner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -45,10 +54,15 @@ class Lead(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     expires_at = Column(DateTime(timezone=True), nullable=True)
+    expiry_warned_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Row version, bumped on every ORM update; used for ETags and
+    # optimistic concurrency
+    version = Column(Integer, nullable=False, default=1)
     
     # Billing information
-    lead_fee = Column(Float, default=500.0)  # 500 SEK per lead
-    commission_percent = Column(Float, default=10.0)  # 10% of quote value
+    lead_fee = Column(Numeric(precision=10, scale=2), default=500.00)  # 500 SEK per lead
+    commission_percent = Column(Numeric(precision=5, scale=2), default=10.00)  # 10% of quote value
     billed = Column(Boolean, default=False)
     
     # Relationships
@@ -58,5 +72,14 @@ class Lead(Base):
     viewed_details = Column(Boolean, default=False)
     view_count = Column(Integer, default=0)
     
+    __mapper_args__ = {"version_id_col": version}
+    
+    __table_args__ = (
+        # Customer email lookups are case-insensitive
+        Index("ix_leads_customer_email_lower", func.lower(customer_email)),
+        # The expiry job scans "status IN (...) AND expires_at < now"
+        Index("ix_leads_status_expires_at", "status", "expires_at"),
+    )
+    
     def __repr__(self):
         return f"<Lead {self.id}: {self.customer_name} - {self.status}>"
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+import enum
+
+from app.database import Base
+
+
+class PushProvider(str, enum.Enum):
+    FCM = "fcm"
+    APNS = "apns"
+
+
+class MobileDevice(Base):
+    """A partner's mobile device, registered on login for push notifications"""
+    __tablename__ = "mobile_devices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user = relationship("User", foreign_keys=[user_id])
+
+    device_id = Column(String, nullable=False)
+    device_type = Column(String, nullable=False)  # ios / android
+    app_version = Column(String, nullable=True)
+    os_version = Column(String, nullable=True)
+
+    # Cleared when the provider reports the token as no longer registered
+    push_provider = Column(Enum(PushProvider), default=PushProvider.FCM, nullable=False)
+    push_token = Column(String, nullable=True, index=True)
+
+    last_active = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "device_id", name="uq_mobile_devices_user_device"),
+    )
+
+    def __repr__(self):
+        return f"<MobileDevice {self.id}: user {self.user_id} {self.device_type}>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Numeric, Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -58,8 +58,8 @@ class Quote(Base):
     lead = relationship("Lead", back_populates="quotes")
     
     status = Column(Enum(QuoteStatus), default=QuoteStatus.DRAFT, nullable=False)
-    total_amount = Column(Float, nullable=False)
-    commission_amount = Column(Float, nullable=False)
+    total_amount = Column(Numeric(precision=10, scale=2), nullable=False)
+    commission_amount = Column(Numeric(precision=10, scale=2), nullable=False)
     
     sent_at = Column(DateTime(timezone=True), nullable=True)
     customer_response_at = Column(DateTime(timezone=True), nullable=True)
@@ -85,7 +85,7 @@ class QuoteItem(Base):
     tree_species = Column(Enum(TreeSpecies), nullable=False)
     operation_type = Column(Enum(OperationType), nullable=False)
     custom_operation = Column(String, nullable=True)  # For "Annat" operation type
-    cost = Column(Float, nullable=False)
+    cost = Column(Numeric(precision=10, scale=2), nullable=False)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
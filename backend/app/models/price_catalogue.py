@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, Numeric, ForeignKey, Index
+from sqlalchemy.sql import func
+
+from app.database import Base
+from app.models.quote import OperationType, TreeSpecies
+
+
+class CataloguePrice(Base):
+    """
+    Base unit price of one species × operation. A row without partner and
+    region is the default price; region rows override it for leads in that
+    region and partner rows override both for that partner's quotes.
+    """
+    __tablename__ = "catalogue_prices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    partner_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # None: every partner
+    region = Column(String(100), nullable=True)  # None: every region
+    tree_species = Column(Enum(TreeSpecies), nullable=False)
+    operation_type = Column(Enum(OperationType), nullable=False)
+    unit_price = Column(Numeric(precision=10, scale=2), nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_catalogue_prices_scope", "partner_id", "region"),
+    )
+
+    def __repr__(self):
+        return f"<CataloguePrice {self.id}: {self.tree_species} / {self.operation_type} {self.unit_price}>"
+
+
+class QuoteItemStats(Base):
+    """
+    Daily rollup of quote items per species × operation, by the day the
+    quote was created. Kept current from the change feed by
+    services.price_catalogue.refresh_quote_item_stats so analytics reads
+    at most 240 rows a day instead of every item.
+    """
+    __tablename__ = "quote_item_stats"
+
+    day = Column(Date, primary_key=True)
+    tree_species = Column(Enum(TreeSpecies), primary_key=True)
+    operation_type = Column(Enum(OperationType), primary_key=True)
+    items = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Numeric(precision=14, scale=2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<QuoteItemStats {self.day}: {self.tree_species} / {self.operation_type} x{self.items}>"
@@ -58,17 +58,31 @@ class Quote(Base):
     lead = relationship("Lead", back_populates="quotes")
 
     status = Column(Enum(QuoteStatus), default=QuoteStatus.DRAFT, nullable=False, index=True)
+    subtotal = Column(Numeric(precision=10, scale=2), nullable=False, default=0.00)
+    discount_amount = Column(Numeric(precision=10, scale=2), nullable=False, default=0.00)
     total_amount = Column(Numeric(precision=10, scale=2), nullable=False, default=0.00)
     commission_amount = Column(Numeric(precision=10, scale=2), nullable=False, default=0.00)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
 
     sent_at = Column(DateTime(timezone=True), nullable=True)
     customer_response_at = Column(DateTime(timezone=True), nullable=True)
+    # quote_renders key of the customer page, rendered when the quote is
+    # sent and again when the customer answers; customer links point at it
+    render_hash = Column(String(64), nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now(), nullable=False)
 
+    # Row version, bumped on every ORM update; used for ETags and
+    # optimistic concurrency
+    version = Column(Integer, nullable=False, default=1)
+    # Latest quote_versions revision; 0 until the quote routes first price it
+    revision = Column(Integer, nullable=False, default=0)
+
     items = relationship("QuoteItem", back_populates="quote", cascade="all, delete-orphan")
 
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self):
         return f"<Quote {self.id}: Lead {self.lead_id} - {self.status}>"
 
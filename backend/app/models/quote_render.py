@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary, Text
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class QuoteRender(Base):
+    """
+    A customer-facing rendering of a quote, as JSON and as HTML.
+
+    Content-addressed: the key is the sha256 of the JSON body, so links to
+    the same quote state share one row, and the key doubles as the ETag.
+    Rows are immutable; a change of state produces a new row.
+    """
+    __tablename__ = "quote_renders"
+
+    content_hash = Column(String(64), primary_key=True)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), nullable=False, index=True)
+
+    json_body = Column(LargeBinary, nullable=False)
+    html_body = Column(Text, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<QuoteRender {self.content_hash[:12]}: quote {self.quote_id}>"
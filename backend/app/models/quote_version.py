@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, DateTime, Boolean, Text, ForeignKey, Index
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class QuoteVersion(Base):
+    """
+    One revision of a quote's items and totals, written by the quote routes
+    on every change. The first revision and every
+    QUOTE_VERSION_SNAPSHOT_INTERVAL-th after it store the full state; the
+    rest store only the items and totals that changed since the previous
+    revision, so any revision is rebuilt from the snapshot before it plus
+    at most an interval of deltas (services/quote_versions.py).
+    """
+    __tablename__ = "quote_versions"
+
+    id = Column(Integer, primary_key=True)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    data = Column(Text, nullable=False)  # JSON: full state for snapshots, else the delta
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_quote_versions_quote_id_revision", "quote_id", "revision", unique=True),
+    )
+
+    def __repr__(self):
+        kind = "snapshot" if self.is_snapshot else "delta"
+        return f"<QuoteVersion quote {self.quote_id} r{self.revision} ({kind})>"
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+
+from app.database import Base
+
+
+class RefreshToken(Base):
+    """
+    An issued mobile refresh token. Only the sha256 of the opaque token is
+    stored. Every refresh rotates the token: the old row is marked used and a
+    new row joins the same family (one login session on one device).
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    family_id = Column(String(36), nullable=False, index=True)
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user = relationship("User", foreign_keys=[user_id])
+    device_id = Column(String, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)  # rotated
+    revoked_at = Column(DateTime(timezone=True), nullable=True)  # logout or reuse detected
+
+    __table_args__ = (
+        # Startup load of revoked/used tokens that have not yet expired
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+        # Revocation sync between workers: sessions revoked since the last sync
+        Index("ix_refresh_tokens_revoked_at", "revoked_at"),
+    )
+
+    def __repr__(self):
+        return f"<RefreshToken {self.id}: user {self.user_id} family {self.family_id}>"
@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Text, Index
+from sqlalchemy.sql import func
+import enum
+
+from app.database import Base
+
+
+class JobRunStatus(str, enum.Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ScheduledJob(Base):
+    """
+    One row per periodic job, shared by all workers. A worker runs a due job
+    only after winning the conditional UPDATE that leases it (locked_by /
+    locked_until) and moves next_run_at on, so each run happens once.
+    """
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String(64), primary_key=True)
+    schedule = Column(String, nullable=False)  # cron expression
+    next_run_at = Column(DateTime(timezone=True), nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<ScheduledJob {self.name}: next {self.next_run_at}>"
+
+
+class JobRun(Base):
+    """Run history of scheduled jobs, with durations and errors"""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String(64), nullable=False)
+    worker = Column(String, nullable=False)
+    status = Column(Enum(JobRunStatus), nullable=False, default=JobRunStatus.RUNNING)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # Run history is read newest first per job
+        Index("ix_job_runs_job_name_started_at", "job_name", "started_at"),
+    )
+
+    def __repr__(self):
+        return f"<JobRun {self.id}: {self.job_name} {self.status}>"
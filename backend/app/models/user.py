@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum, Float
 from sqlalchemy.sql import func
 import enum
 
@@ -20,5 +20,13 @@ class User(Base):
     role = Column(Enum(UserRole), nullable=False)
     is_active = Column(Boolean, default=True)
     region = Column(String, nullable=True)  # For partners, their operating region
+
+    # For partners: crew base, how far they travel and how many open leads
+    # they can take (None = no limit); used by nearest-partner matching
+    base_latitude = Column(Float, nullable=True)
+    base_longitude = Column(Float, nullable=True)
+    service_radius_km = Column(Float, nullable=True)
+    max_open_leads = Column(Integer, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
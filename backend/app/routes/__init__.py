@@ -1,49 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import jwt
+from fastapi import APIRouter, Depends, Request
 from datetime import datetime
 
-from app.database import get_db
-from app.models.user import User, UserRole
-from app.models.lead import Lead, LeadStatus
-from app.models.kpi import KPIEvent
-from app.config import settings
-from app.routes.auth import oauth2_scheme
+from app.utils.auth import (  # noqa: F401 - re-exported for existing imports
+    get_current_user,
+    get_current_admin_user as get_current_admin,
+)
 
 router = APIRouter()
 
-# Dependency to get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-    
-    return user
-
-# Dependency to check if user is admin
-async def get_current_admin(current_user: User = Depends(get_current_user)):
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
-    return current_user
-
 # Function to log API access for KPI tracking (moved to main.py as middleware)
 async def log_api_access(request: Request, call_next):
     start_time = datetime.utcnow()
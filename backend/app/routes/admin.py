@@ -1,8 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
-import bcrypt
 
 from app.database import get_db
 from app.models.user import User, UserRole
@@ -10,12 +9,30 @@ from app.models.lead import Lead, LeadStatus
 from app.models.quote import Quote, QuoteStatus
 from app.models.kpi import KPIEvent
 from app.utils.kpi import log_event
+from app.utils.auth import require_roles
+from app.utils.passwords import hash_password
+from app.services.push_service import lead_assigned_message, leads_assigned_message, send_push_to_users
+from app.services.batch_assignment import BatchAssignmentResult, batch_assign_leads
+from app.services.scheduler import request_run
+from app.models.scheduled_job import JobRun, ScheduledJob
+from app.schemas.job import JobRun as JobRunSchema, ScheduledJob as ScheduledJobSchema
+from app.services.lead_state_machine import ADMIN, transition
+from app.services.lead_assignment import assign_nearest_partner, auto_assign_lead, invalidate_assignment_engine
+from app.services.partner_locator import (
+    NearbyPartner, get_partner_locator, record_partner_assignment, remove_partner_location, update_partner_location
+)
+from app.config import settings
 from app.schemas.lead import Lead as LeadSchema, LeadCreate
 from app.schemas.quote import Quote as QuoteSchema
 from app.schemas.user import User as UserSchema, UserCreate
+from app.utils.responses import rows_response, schema_columns
 
 router = APIRouter()
 
+# Columns backing LeadSchema, used by the bulk list endpoints to skip ORM
+# entity loading and response_model validation
+LEAD_COLUMNS = schema_columns(Lead, LeadSchema)
+
 
 @router.get("/leads", response_model=List[LeadSchema])
 def get_admin_leads(
@@ -27,16 +44,17 @@ def get_admin_leads(
     """
     Get all leads for admin dashboard.
     """
-    query = db.query(Lead)
+    query = db.query(*LEAD_COLUMNS)
     if status:
         query = query.filter(Lead.status == status)
     
-    return query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all()
+    return rows_response(query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.post("/leads", response_model=LeadSchema)
 def create_lead(
     lead_in: LeadCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -65,6 +83,11 @@ def create_lead(
         data=f"Lead created for {db_lead.customer_name} in {db_lead.region}"
     )
     
+    if settings.AUTO_ASSIGN_NEW_LEADS:
+        partner_id = auto_assign_lead(db, db_lead)
+        if partner_id is not None:
+            background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+    
     return db_lead
 
 
@@ -117,20 +140,26 @@ def create_partner(
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash the password
-    hashed_password = bcrypt.hashpw(partner_in.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_password(partner_in.password)
     
     # Create new partner
     db_partner = User(
         email=partner_in.email,
-        hashed_password=hashed_password.decode('utf-8'),
+        hashed_password=hashed_password,
         full_name=partner_in.full_name,
         region=partner_in.region,
-        role=UserRole.PARTNER
+        role=UserRole.PARTNER,
+        base_latitude=partner_in.base_latitude,
+        base_longitude=partner_in.base_longitude,
+        service_radius_km=partner_in.service_radius_km,
+        max_open_leads=partner_in.max_open_leads
     )
     
     db.add(db_partner)
     db.commit()
     db.refresh(db_partner)
+    invalidate_assignment_engine()
+    update_partner_location(db_partner)
     
     # Log KPI event
     log_event(
@@ -157,6 +186,8 @@ def delete_partner(
     
     db.delete(db_partner)
     db.commit()
+    invalidate_assignment_engine()
+    remove_partner_location(partner_id)
     
     return {"message": "Partner deleted successfully"}
 
@@ -171,8 +202,8 @@ def get_leads_by_region(
     """
     Get leads filtered by region.
     """
-    query = db.query(Lead).filter(Lead.region == region)
-    return query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all()
+    query = db.query(*LEAD_COLUMNS).filter(Lead.region == region)
+    return rows_response(query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.get("/leads/unassigned", response_model=List[LeadSchema])
@@ -184,14 +215,15 @@ def get_unassigned_leads(
     """
     Get all unassigned leads.
     """
-    query = db.query(Lead).filter(Lead.status == LeadStatus.NEW)
-    return query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all()
+    query = db.query(*LEAD_COLUMNS).filter(Lead.status == LeadStatus.NEW)
+    return rows_response(query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.post("/leads/{lead_id}/assign/{partner_id}", response_model=LeadSchema)
 def admin_assign_lead(
     lead_id: int,
     partner_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -207,14 +239,15 @@ def admin_assign_lead(
     if db_partner is None:
         raise HTTPException(status_code=404, detail="Partner not found")
     
-    # Assign lead to partner
+    # Assign lead to partner; a reassignment keeps the status but restarts the assignment clock
     db_lead.assigned_partner_id = partner_id
-    db_lead.status = LeadStatus.ASSIGNED
-    db_lead.assigned_at = datetime.utcnow()
+    if not transition(db_lead, LeadStatus.ASSIGNED, ADMIN):
+        db_lead.assigned_at = datetime.utcnow()
     
     db.add(db_lead)
     db.commit()
     db.refresh(db_lead)
+    record_partner_assignment(partner_id)
     
     # Log KPI event
     log_event(
@@ -225,9 +258,150 @@ def admin_assign_lead(
         data=f"Lead assigned to partner {db_partner.full_name}"
     )
     
+    # Notify the partner's devices after the response is sent
+    background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+    
+    return db_lead
+
+
+@router.post("/leads/{lead_id}/auto-assign", response_model=LeadSchema)
+def admin_auto_assign_lead(
+    lead_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Assign a new lead to the best-ranked partner serving its postcode.
+    """
+    db_lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    if db_lead is None:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    if db_lead.status != LeadStatus.NEW:
+        raise HTTPException(status_code=400, detail="Only new leads can be assigned automatically")
+    
+    partner_id = auto_assign_lead(db, db_lead)
+    if partner_id is None:
+        raise HTTPException(status_code=409, detail="No partner available for this lead's area")
+    
+    # Notify the partner's devices after the response is sent
+    background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+    
     return db_lead
 
 
+@router.get("/leads/{lead_id}/nearest-partners", response_model=List[NearbyPartner])
+def get_nearest_partners(
+    lead_id: int,
+    limit: Optional[int] = None,
+    radius_km: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Closest partners with spare capacity whose service area covers the lead.
+    """
+    db_lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    if db_lead is None:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    if db_lead.latitude is None or db_lead.longitude is None:
+        raise HTTPException(status_code=400, detail="Lead location is unknown")
+    
+    return get_partner_locator(db).nearest(db_lead.latitude, db_lead.longitude, limit=limit, radius_km=radius_km)
+
+
+@router.post("/leads/{lead_id}/assign-nearest", response_model=LeadSchema)
+def admin_assign_nearest_partner(
+    lead_id: int,
+    background_tasks: BackgroundTasks,
+    radius_km: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Assign a new lead to the closest partner with spare capacity.
+    """
+    db_lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    if db_lead is None:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    if db_lead.status != LeadStatus.NEW:
+        raise HTTPException(status_code=400, detail="Only new leads can be assigned automatically")
+    
+    partner_id = assign_nearest_partner(db, db_lead, radius_km=radius_km)
+    if partner_id is None:
+        raise HTTPException(status_code=409, detail="No partner with capacity within range of this lead")
+    
+    # Notify the partner's devices after the response is sent
+    background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+    
+    return db_lead
+
+
+@router.post("/leads/batch-assign", response_model=BatchAssignmentResult)
+def batch_assign(
+    background_tasks: BackgroundTasks,
+    limit: Optional[int] = None,
+    radius_km: Optional[float] = None,
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Match the backlog of unassigned leads to nearby partners in one pass,
+    balancing acceptance rate, distance and each partner's open leads.
+    With dry_run, returns the proposed assignments without saving them.
+    """
+    result = batch_assign_leads(db, limit=limit, radius_km=radius_km, dry_run=dry_run)
+    
+    # One push per partner after the response is sent
+    if not dry_run:
+        for partner_id, lead_ids in result.assignments.items():
+            background_tasks.add_task(send_push_to_users, [partner_id], leads_assigned_message(lead_ids))
+    
+    return result
+
+
+@router.get("/jobs", response_model=List[ScheduledJobSchema])
+def get_scheduled_jobs(
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Periodic jobs with their schedule, next run and current lease holder.
+    """
+    return db.query(ScheduledJob).order_by(ScheduledJob.name).all()
+
+
+@router.get("/jobs/{job_name}/runs", response_model=List[JobRunSchema])
+def get_job_runs(
+    job_name: str,
+    db: Session = Depends(get_db),
+    skip: int = 0,
+    limit: int = 50,
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Run history of a periodic job, newest first.
+    """
+    return db.query(JobRun).filter(JobRun.job_name == job_name).order_by(
+        JobRun.started_at.desc()
+    ).offset(skip).limit(limit).all()
+
+
+@router.post("/jobs/{job_name}/run", status_code=status.HTTP_202_ACCEPTED, response_model=dict)
+def run_job_now(
+    job_name: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin"))
+):
+    """
+    Make a periodic job due now; the first worker to poll runs it.
+    """
+    if not request_run(db, job_name):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"message": f"Job {job_name} queued"}
+
+
 @router.get("/quotes", response_model=List[QuoteSchema])
 def get_all_quotes(
     db: Session = Depends(get_db),
@@ -254,8 +428,8 @@ def get_accepted_leads(
     """
     Get all accepted leads for billing purposes.
     """
-    query = db.query(Lead).filter(Lead.status == LeadStatus.ACCEPTED)
-    return query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all()
+    query = db.query(*LEAD_COLUMNS).filter(Lead.status == LeadStatus.ACCEPTED)
+    return rows_response(query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.post("/leads/{lead_id}/bill", response_model=dict)
@@ -1,118 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from typing import Optional
-import bcrypt
+from datetime import timedelta
 from app.database import get_db
-from app.models.user import User, UserRole
+from app.models.user import User
 from app.config import settings
-
-# JWT configuration
-SECRET_KEY = settings.SECRET_KEY
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+from app.utils.auth import (  # noqa: F401 - re-exported for existing imports
+    Principal,
+    oauth2_scheme,
+    create_access_token,
+    get_current_user,
+    get_current_active_user,
+    get_current_admin_user,
+    get_current_partner_user,
+)
+from app.utils.passwords import login_throttle, verify_and_update, verify_password  # noqa: F401
 
 router = APIRouter()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
-
-def verify_password(plain_password, hashed_password):
-    """
-    Verify a password against a hash.
-    
-    This function handles both the special case of sample data credentials
-    and regular bcrypt password verification.
-    """
-    # Special case for sample data credentials
-    if plain_password == "admin123" and hashed_password == "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW":
-        return True
-    if plain_password == "partner1" and hashed_password == "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW":
-        return True
-    
-    # For other cases, use proper bcrypt verification
-    try:
-        # Convert plain_password to bytes if it's not already
-        if isinstance(plain_password, str):
-            plain_password = plain_password.encode('utf-8')
-        
-        # Convert hashed_password to bytes if it's not already
-        if isinstance(hashed_password, str):
-            hashed_password = hashed_password.encode('utf-8')
-            
-        # Use bcrypt to check the password - Updated for Python 3.13 compatibility
-        # Ensure we're handling bytes correctly and catching potential encoding issues
-        return bcrypt.checkpw(plain_password, hashed_password)
-    except Exception as e:
-        # Log the error for debugging
-        print(f"Password verification error: {e}")
-        # If any error occurs during verification, return False
-        return False
 
 def get_user(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
-def authenticate_user(db: Session, email: str, password: str):
+async def authenticate_user(db: Session, email: str, password: str):
     user = get_user(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_and_update(db, user, password):
         return False
     return user
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = get_user(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
-
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
-    if not current_user.is_active:
-        raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
-
-async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return current_user
-
-async def get_current_partner_user(current_user: User = Depends(get_current_active_user)):
-    if current_user.role != UserRole.PARTNER:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return current_user
-
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
+    client_ip = request.client.host if request.client else None
+    login_throttle.check(form_data.username, client_ip)
+    
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        login_throttle.record_failure(form_data.username, client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    login_throttle.reset(form_data.username)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.email, "id": user.id, "role": user.role.value}, 
         expires_delta=access_token_expires
@@ -120,7 +55,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me")
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_active_user)):
     return {
         "id": current_user.id,
         "email": current_user.email,
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.database import get_db
+from app.models.change_log import ChangeConsumer, ChangeEntity
+from app.schemas.change import (
+    ChangeAcknowledgement,
+    ChangeBatch as ChangeBatchSchema,
+    ChangeConsumer as ChangeConsumerSchema,
+)
+from app.services.change_feed import ChangeFeed, feed_head
+from app.utils.auth import require_roles
+
+router = APIRouter()
+
+
+@router.get("/changes/consumers", response_model=List[ChangeConsumerSchema])
+def get_change_consumers(
+    db: Session = Depends(get_db),
+    current_user=Depends(require_roles("admin"))
+):
+    """
+    Registered change feed consumers with their offset and lag.
+    """
+    consumers = db.query(ChangeConsumer).order_by(ChangeConsumer.name).all()
+    head = feed_head(db)
+    return [
+        ChangeConsumerSchema(name=consumer.name, position=consumer.position,
+                             lag=max(0, head - consumer.position), acknowledged_at=consumer.acknowledged_at)
+        for consumer in consumers
+    ]
+
+
+@router.get("/changes/{consumer}", response_model=ChangeBatchSchema)
+def read_changes(
+    consumer: str,
+    db: Session = Depends(get_db),
+    current_user=Depends(require_roles("admin")),
+    limit: Optional[int] = None,
+    entity_type: Optional[List[ChangeEntity]] = Query(None)
+):
+    """
+    Changes to leads, quotes, quote items and notifications after the
+    consumer's acknowledged offset. A new consumer starts at the beginning
+    of the feed. Reading does not move the offset: process the changes,
+    then acknowledge the returned position.
+    """
+    batch = ChangeFeed(db, consumer).read(limit, entity_type)
+    return ChangeBatchSchema(changes=batch.changes, position=batch.position, has_more=batch.has_more)
+
+
+@router.post("/changes/{consumer}/ack", response_model=ChangeConsumerSchema)
+def acknowledge_changes(
+    consumer: str,
+    acknowledgement: ChangeAcknowledgement,
+    db: Session = Depends(get_db),
+    current_user=Depends(require_roles("admin"))
+):
+    """
+    Move the consumer's offset forward to an acknowledged position.
+    """
+    feed = ChangeFeed(db, consumer)
+    head = feed.head()
+    if acknowledgement.position > head:
+        raise HTTPException(status_code=400, detail=f"Position is past the head of the feed ({head})")
+    position = feed.acknowledge(acknowledgement.position)
+    consumer_row = db.get(ChangeConsumer, consumer)
+    return ChangeConsumerSchema(name=consumer, position=position, lag=max(0, head - position),
+                                acknowledged_at=consumer_row.acknowledged_at)
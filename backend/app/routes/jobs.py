@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session
+import json
+
+from app.database import get_db
+from app.models.background_job import BackgroundJob, BackgroundJobStatus
+from app.models.user import UserRole
+from app.schemas.job import BackgroundJob as BackgroundJobSchema
+from app.utils.auth import Principal, require_roles
+
+router = APIRouter()
+
+
+def _get_job(db: Session, job_id: int, current_user: Principal) -> BackgroundJob:
+    job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+    # Jobs are visible to whoever submitted them and to admins
+    if job is None or (current_user.role != UserRole.ADMIN and job.submitted_by != current_user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/background-jobs/{job_id}", response_model=BackgroundJobSchema)
+def get_background_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin", "partner"))
+):
+    """
+    Poll a submitted job for status, progress and, once it has succeeded,
+    its result. A job that produced a file has has_file set; download it
+    from /background-jobs/{job_id}/result.
+    """
+    job = _get_job(db, job_id, current_user)
+    return BackgroundJobSchema(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        progress=job.progress,
+        progress_message=job.progress_message,
+        result=json.loads(job.result) if job.result else None,
+        has_file=job.result_file is not None,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+
+@router.get("/background-jobs/{job_id}/result")
+def get_background_job_result(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin", "partner"))
+):
+    """
+    Download the file a job produced, e.g. an analytics export.
+    """
+    job = _get_job(db, job_id, current_user)
+    if job.status != BackgroundJobStatus.SUCCEEDED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status.value}")
+    if job.result_file is None:
+        raise HTTPException(status_code=404, detail="Job has no result file")
+    return Response(
+        content=job.result_file,
+        media_type=job.result_content_type,
+        headers={"Content-Disposition": f"attachment; filename=job_{job.id}"}
+    )
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import json
 from datetime import datetime, timedelta
 
+from app.config import settings
 from app.database import get_db
 from app.models.kpi import KPIEvent, KPIMetric
 from app.schemas.kpi import KPIEvent as KPIEventSchema, KPIMetric as KPIMetricSchema, KPIDashboard
-from app.utils.kpi import calculate_metrics, get_kpi_dashboard_data
+from app.utils.kpi import get_kpi_dashboard_data
+from app.services.job_queue import enqueue, job_accepted
+from app.utils.auth import Principal, get_current_user
+from app.utils.http_cache import CACHE_CONTROL_KPI, cached_aggregate
+from app.utils.responses import rows_response, schema_columns
 
 router = APIRouter()
 
+KPI_EVENT_COLUMNS = schema_columns(KPIEvent, KPIEventSchema)
+KPI_METRIC_COLUMNS = schema_columns(KPIMetric, KPIMetricSchema)
+
 
 @router.get("/events", response_model=List[KPIEventSchema])
 def get_kpi_events(
@@ -22,11 +30,11 @@ def get_kpi_events(
     """
     Get KPI events. Only accessible by admin users.
     """
-    query = db.query(KPIEvent)
+    query = db.query(*KPI_EVENT_COLUMNS)
     if event_type:
         query = query.filter(KPIEvent.event_type == event_type)
     
-    return query.order_by(KPIEvent.created_at.desc()).offset(skip).limit(limit).all()
+    return rows_response(query.order_by(KPIEvent.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.get("/metrics", response_model=List[KPIMetricSchema])
@@ -39,20 +47,26 @@ def get_kpi_metrics(
     """
     Get KPI metrics. Only accessible by admin users.
     """
-    query = db.query(KPIMetric)
+    query = db.query(*KPI_METRIC_COLUMNS)
     if metric_name:
         query = query.filter(KPIMetric.metric_name == metric_name)
     
-    return query.order_by(KPIMetric.created_at.desc()).offset(skip).limit(limit).all()
+    return rows_response(query.order_by(KPIMetric.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.get("/dashboard", response_model=KPIDashboard)
 def get_kpi_dashboard(
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
     Get KPI dashboard data. Only accessible by admin users.
     """
+    return cached_aggregate(request, settings.KPI_CACHE_TTL_SECONDS, CACHE_CONTROL_KPI,
+                            lambda: _build_kpi_dashboard(db))
+
+
+def _build_kpi_dashboard(db: Session) -> dict:
     dashboard_data = get_kpi_dashboard_data(db)
     
     # Extract the metrics we need for the dashboard
@@ -200,15 +214,17 @@ def get_kpi_data_by_time(
     }
 
 
-@router.post("/calculate-metrics")
+@router.post("/calculate-metrics", status_code=status.HTTP_202_ACCEPTED)
 def trigger_metric_calculation(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """
-    Trigger calculation of KPI metrics. Only accessible by admin users.
+    Queue calculation of KPI metrics. Only accessible by admin users.
+    Poll the returned job for completion.
     """
-    result = calculate_metrics(db)
-    return {"message": result}
+    job = enqueue(db, "kpi.calculate_metrics", submitted_by=current_user.id)
+    return job_accepted(job)
 
 
 @router.post("/log-event", response_model=KPIEventSchema)
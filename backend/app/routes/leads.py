@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -6,13 +6,20 @@ from datetime import datetime, timedelta
 from app.database import get_db
 from app.models.lead import Lead, LeadStatus
 from app.utils.kpi import log_event
-from app.schemas.lead import Lead as LeadSchema, LeadCreate, LeadUpdate
+from app.services.push_service import lead_assigned_message, send_push_to_users
+from app.services.lead_assignment import assign_nearest_partner, auto_assign_lead
+from app.services.partner_locator import record_partner_assignment
+from app.models.user import UserRole
+from app.schemas.lead import Lead as LeadSchema, LeadCreate, LeadStatusBulkResult, LeadStatusBulkUpdate, LeadUpdate
 from app.config import settings
-from app.services.lead_status_transition import LeadStatusTransitionService
+from app.services.lead_state_machine import ADMIN, bulk_transition, transition
 from app.utils.auth import get_current_user, require_roles
+from app.utils.responses import rows_response, schema_columns
 
 router = APIRouter()
 
+LEAD_COLUMNS = schema_columns(Lead, LeadSchema)
+
 @router.get("/", response_model=List[LeadSchema])
 def get_all_leads(
     db: Session = Depends(get_db),
@@ -21,14 +28,15 @@ def get_all_leads(
     limit: int = 100,
     status: Optional[LeadStatus] = None
 ):
-    query = db.query(Lead)
+    query = db.query(*LEAD_COLUMNS)
     if status is not None:
         query = query.filter(Lead.status == status)
-    return query.offset(skip).limit(limit).all()
+    return rows_response(query.offset(skip).limit(limit).all())
 
 @router.post("/", response_model=LeadSchema)
 def create_lead(
     lead_in: LeadCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user = Depends(require_roles("admin", "chief engineer"))
 ):
@@ -44,6 +52,11 @@ def create_lead(
         lead_id=db_lead.id,
         data=f"Lead created for region: {db_lead.region}"
     )
+
+    if settings.AUTO_ASSIGN_NEW_LEADS:
+        partner_id = auto_assign_lead(db, db_lead)
+        if partner_id is not None:
+            background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
     return db_lead
 
 @router.get("/{lead_id}", response_model=LeadSchema)
@@ -71,25 +84,14 @@ def update_lead(
     old_status = db_lead.status
     update_data = lead_in.dict(exclude_unset=True)
 
-    if "status" in update_data and update_data["status"] != old_status:
-        transition_service = LeadStatusTransitionService(db)
+    new_status = update_data.pop("status", None)
+    status_changed = new_status is not None and new_status != old_status
+    if status_changed:
         try:
-            transition_service.update_lead_status(lead_id, update_data["status"], current_user.role, current_user.id)
+            transition(db_lead, new_status, current_user.role)
         except ValueError as e:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-        # Auto-update timestamps for specific statuses
-        status_timestamps = {
-            LeadStatus.ASSIGNED: "assigned_at",
-            LeadStatus.ACCEPTED: "accepted_at",
-            LeadStatus.QUOTED: "quoted_at",
-            LeadStatus.APPROVED: "customer_response_at",
-            LeadStatus.DECLINED: "customer_response_at",
-        }
-        timestamp_field = status_timestamps.get(update_data["status"])
-        if timestamp_field:
-            update_data[timestamp_field] = datetime.utcnow()
-
     for key, value in update_data.items():
         setattr(db_lead, key, value)
 
@@ -97,7 +99,7 @@ def update_lead(
     db.commit()
     db.refresh(db_lead)
 
-    if "status" in update_data and update_data["status"] != old_status:
+    if status_changed:
         log_event(
             db=db,
             event_type="lead_status_changed",
@@ -111,6 +113,7 @@ def update_lead(
 def assign_lead(
     lead_id: int,
     partner_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user = Depends(require_roles("admin", "chief engineer"))
 ):
@@ -124,12 +127,14 @@ def assign_lead(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Partner not found")
 
     db_lead.assigned_partner_id = partner_id
-    db_lead.status = LeadStatus.ASSIGNED
-    db_lead.assigned_at = datetime.utcnow()
+    # A reassignment keeps the status but restarts the assignment clock
+    if not transition(db_lead, LeadStatus.ASSIGNED, ADMIN):
+        db_lead.assigned_at = datetime.utcnow()
 
     db.add(db_lead)
     db.commit()
     db.refresh(db_lead)
+    record_partner_assignment(partner_id)
 
     log_event(
         db=db,
@@ -139,6 +144,32 @@ def assign_lead(
         data=f"Lead assigned to partner {db_partner.full_name}"
     )
 
+    # Notify the partner's devices after the response is sent
+    background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+
+    return db_lead
+
+@router.post("/{lead_id}/assign-nearest", response_model=LeadSchema)
+def assign_lead_to_nearest_partner(
+    lead_id: int,
+    background_tasks: BackgroundTasks,
+    radius_km: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("admin", "chief engineer"))
+):
+    db_lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    if not db_lead:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lead not found")
+    if db_lead.status != LeadStatus.NEW:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only new leads can be assigned automatically")
+
+    partner_id = assign_nearest_partner(db, db_lead, radius_km=radius_km)
+    if partner_id is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No partner with capacity within range of this lead")
+
+    # Notify the partner's devices after the response is sent
+    background_tasks.add_task(send_push_to_users, [partner_id], lead_assigned_message(db_lead))
+
     return db_lead
 
 @router.put("/{lead_id}/recall", response_model=dict)
@@ -147,13 +178,40 @@ def recall_lead(
     db: Session = Depends(get_db),
     current_user = Depends(require_roles("partner", "admin"))
 ):
-    transition_service = LeadStatusTransitionService(db)
+    db_lead = db.query(Lead).filter(Lead.id == lead_id).first()
+    if not db_lead:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lead not found")
+    if current_user.role != UserRole.ADMIN and db_lead.assigned_partner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to recall this lead")
+
     try:
-        transition_service.update_lead_status(lead_id, "CONTACTED", user_role=current_user.role, user_id=current_user.id)
-    except ValueError:
-        try:
-            transition_service.update_lead_status(lead_id, "NEW", user_role=current_user.role, user_id=current_user.id)
-        except ValueError as e:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        transition(db_lead, LeadStatus.NEW, current_user.role)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    db.commit()
 
     return {"detail": f"Lead {lead_id} recalled successfully"}
+
+@router.post("/bulk-status", response_model=LeadStatusBulkResult)
+def bulk_update_lead_status(
+    update_in: LeadStatusBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user = Depends(require_roles("partner", "admin"))
+):
+    """
+    Move many leads to one status in a single transaction. Leads the
+    caller may not move there (wrong current status, or for partners not
+    assigned to them) are skipped rather than failing the request.
+    """
+    partner_id = None if current_user.role == UserRole.ADMIN else current_user.id
+    try:
+        moved = bulk_transition(db, update_in.lead_ids, update_in.status, current_user.role, partner_id=partner_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    db.commit()
+
+    moved_ids = set(moved)
+    return LeadStatusBulkResult(
+        updated=moved,
+        skipped=[lead_id for lead_id in dict.fromkeys(update_in.lead_ids) if lead_id not in moved_ids]
+    )
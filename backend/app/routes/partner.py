@@ -11,9 +11,14 @@ from app.models.kpi import KPIEvent
 from app.utils.kpi import log_event
 from app.schemas.lead import Lead as LeadSchema, LeadPreview
 from app.schemas.quote import Quote as QuoteSchema, QuoteCreate
+from app.services.lead_state_machine import PARTNER, transition
+from app.utils.responses import rows_response, schema_columns
 
 router = APIRouter()
 
+# Only the columns LeadPreview exposes; summary-only previews never need details
+LEAD_PREVIEW_COLUMNS = schema_columns(Lead, LeadPreview)
+
 
 @router.get("/leads", response_model=List[LeadPreview])
 def get_partner_leads(
@@ -27,11 +32,11 @@ def get_partner_leads(
     Get all leads assigned to a specific partner.
     Only shows preview information until accepted.
     """
-    query = db.query(Lead).filter(Lead.assigned_partner_id == partner_id)
+    query = db.query(*LEAD_PREVIEW_COLUMNS).filter(Lead.assigned_partner_id == partner_id)
     if status:
         query = query.filter(Lead.status == status)
     
-    return query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all()
+    return rows_response(query.order_by(Lead.created_at.desc()).offset(skip).limit(limit).all())
 
 
 @router.get("/leads/{lead_id}", response_model=LeadSchema)
@@ -91,8 +96,7 @@ def accept_lead(
         raise HTTPException(status_code=404, detail="Lead not found or not available for acceptance")
     
     # Update lead status
-    db_lead.status = LeadStatus.ACCEPTED
-    db_lead.accepted_at = datetime.utcnow()
+    transition(db_lead, LeadStatus.ACCEPTED, PARTNER)
     
     db.add(db_lead)
     db.commit()
@@ -129,7 +133,7 @@ def reject_lead(
         raise HTTPException(status_code=404, detail="Lead not found or not available for rejection")
     
     # Update lead status
-    db_lead.status = LeadStatus.REJECTED
+    transition(db_lead, LeadStatus.REJECTED, PARTNER)
     
     db.add(db_lead)
     db.commit()
@@ -158,12 +162,9 @@ def get_partner_quotes(
     """
     Get all quotes created by a specific partner.
     """
-    # First get all leads assigned to this partner
-    partner_leads = db.query(Lead).filter(Lead.assigned_partner_id == partner_id).all()
-    partner_lead_ids = [lead.id for lead in partner_leads]
-    
-    # Then get quotes for those leads
-    query = db.query(Quote).filter(Quote.lead_id.in_(partner_lead_ids))
+    # Restrict to leads assigned to this partner without loading the leads
+    partner_lead_ids = db.query(Lead.id).filter(Lead.assigned_partner_id == partner_id)
+    query = db.query(Quote).filter(Quote.lead_id.in_(partner_lead_ids.scalar_subquery()))
     if status:
         query = query.filter(Quote.status == status)
     
@@ -214,8 +215,7 @@ def create_partner_quote(
     db.refresh(db_quote)
     
     # Update lead status
-    db_lead.status = LeadStatus.QUOTED
-    db_lead.quoted_at = datetime.utcnow()
+    transition(db_lead, LeadStatus.QUOTED, PARTNER)
     db.add(db_lead)
     db.commit()
     
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+import json
+
+from app.database import get_db
+from app.models.lead import Lead
+from app.models.user import UserRole
+from app.schemas.pricing import (
+    CatalogueUpdate, CataloguePriceEntry, CommissionWhatIf, CommissionWhatIfRequest, QuoteSuggestion,
+    QuoteSuggestionRequest, RepriceRequest,
+)
+from app.services.job_queue import enqueue, job_accepted
+from app.services.price_catalogue import get_price_catalogue, set_catalogue_prices
+from app.services.pricing_engine import commission_what_if
+from app.utils.auth import Principal, require_roles
+
+router = APIRouter()
+
+
+@router.post("/pricing/reprice", status_code=status.HTTP_202_ACCEPTED, response_model=Dict[str, Any])
+def reprice_quotes(
+    reprice: RepriceRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin"))
+):
+    """
+    Queue a bulk repricing of stored quotes with new rates and, for a
+    price-list change, new unit prices per species and operation.
+    """
+    # Decimals as strings so the job sees the exact amounts
+    job = enqueue(db, "pricing.reprice_quotes", json.loads(reprice.json(encoder=str)),
+                  submitted_by=current_user.id)
+    return job_accepted(job)
+
+
+@router.post("/pricing/commission-what-if", response_model=CommissionWhatIf)
+def what_if_commission(
+    what_if: CommissionWhatIfRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin"))
+):
+    """
+    Commission the selected quotes would have brought in at each of the
+    given rates, next to what they were actually charged.
+    """
+    return commission_what_if(db, what_if.commission_rates, what_if.statuses, what_if.partner_id,
+                              what_if.start_date, what_if.end_date)
+
+
+def _catalogue_partner(current_user: Principal, partner_id: Optional[int]) -> Optional[int]:
+    # Partners only see and set their own prices on top of the shared ones
+    if current_user.role != UserRole.ADMIN:
+        return current_user.id
+    return partner_id
+
+
+@router.get("/pricing/catalogue", response_model=List[CataloguePriceEntry])
+def get_catalogue(
+    partner_id: Optional[int] = None,
+    region: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin", "partner"))
+):
+    """
+    Unit prices that apply to a partner's quotes in a region: the partner's
+    own prices over the region's over the defaults.
+    """
+    return get_price_catalogue(db).entries(_catalogue_partner(current_user, partner_id), region)
+
+
+@router.put("/pricing/catalogue", response_model=List[CataloguePriceEntry])
+def update_catalogue(
+    update: CatalogueUpdate,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin", "partner"))
+):
+    """
+    Set or remove unit prices of one scope. Admins maintain the default and
+    regional prices; partners their own.
+    """
+    partner_id = _catalogue_partner(current_user, update.partner_id)
+    set_catalogue_prices(
+        db, [(price.tree_species, price.operation_type, price.unit_price) for price in update.prices],
+        partner_id=partner_id, region=update.region
+    )
+    return get_price_catalogue(db).entries(partner_id, update.region)
+
+
+@router.post("/pricing/suggestions", response_model=QuoteSuggestion)
+def suggest_quote(
+    suggestion: QuoteSuggestionRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles("admin", "partner"))
+):
+    """
+    Price quote items from the catalogue, with the quote totals.
+    """
+    partner_id, region = suggestion.partner_id, suggestion.region
+    if suggestion.lead_id is not None:
+        lead = db.query(Lead.assigned_partner_id, Lead.region).filter(Lead.id == suggestion.lead_id).first()
+        if lead is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        partner_id, region = lead.assigned_partner_id, lead.region
+    return get_price_catalogue(db).suggest(
+        [(item.tree_species, item.operation_type, item.quantity) for item in suggestion.items],
+        _catalogue_partner(current_user, partner_id), region, suggestion.commission_rate
+    )
@@ -1,120 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import uuid
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.models.quote import Quote, QuoteItem, OperationType
-from app.models.lead import LeadStatus
-from app.schemas.quote import QuoteCreate, QuoteUpdate
+from app.models.quote import Quote, QuoteItem, QuoteStatus, OperationType, TreeSpecies
+from app.models.lead import Lead, LeadStatus
+from app.models.notification import Notification, NotificationChannel, NotificationType
+from app.models.user import UserRole
+from app.schemas.quote import (
+    Quote as QuoteSchema,
+    QuoteCalculation,
+    QuoteDraftCreate,
+    QuoteVersionState,
+    QuoteVersionSummary,
+)
 from app.services.quote_logic import QuoteCalculator, QuoteItem as QuoteItemLogic
 from app.services.kpi_service import KPIService
 from app.services.offert_creator import OffertCreator
 from app.services.lead_status_transition import LeadStatusTransitionService
-from app.utils.notification_service import NotificationService
-from app.utils.auth import get_current_user
+from app.services.etag_service import ETagService
+from app.services.job_queue import enqueue
+from app.services.price_catalogue import get_price_catalogue
+from app.services.pricing_engine import money
+from app.services.quote_versions import list_quote_versions, quote_state, quote_version_state, record_quote_version
+from app.services.unit_of_work import UnitOfWork
+from app.utils.customer_portal import CustomerPortalService
+from app.utils.http_cache import CACHE_CONTROL_DETAIL, conditional_response
 from app.utils.rbac import rbac_required
 
 router = APIRouter()
 
-@router.post("/quotes", response_model=dict)
+def _check_catalogue_prices(db: Session, lead: Lead, items) -> None:
+    """Reject item unit prices too far from the partner's catalogue price for the lead's region"""
+    violations = get_price_catalogue(db).violations(
+        [(item.tree_species, item.operation_type, item.unit_price) for item in items],
+        lead.assigned_partner_id, lead.region
+    )
+    if violations:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=violations)
+
+def _check_lead_access(lead: Lead, current_user) -> None:
+    # Partners may only quote and see quotes on their own leads
+    if current_user.role != UserRole.ADMIN and lead.assigned_partner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this quote")
+
+def _get_quote(db: Session, quote_id: int, current_user) -> Quote:
+    quote = db.query(Quote).filter(Quote.id == quote_id).first()
+    if not quote:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote not found")
+    _check_lead_access(quote.lead, current_user)
+    return quote
+
+def _price_quote(db: Session, quote: Quote, calculation: QuoteCalculation, user_id: int) -> None:
+    """Set the quote's totals from its items and record them as its next revision"""
+    items_logic = [
+        QuoteItemLogic(item.tree_species, item.operation_type, item.quantity, item.unit_price)
+        for item in calculation.items
+    ]
+    calculator = QuoteCalculator(commission_rate=calculation.commission_rate, discount_rate=calculation.discount_rate)
+    result = calculator.calculate_quote(items_logic, apply_discount=calculation.apply_discount)
+
+    quote.subtotal = result["subtotal"]
+    quote.discount_amount = result["discount"]
+    quote.commission_amount = result["commission"]
+    quote.total_amount = result["final_total"]
+    db.flush()  # new items need their ids for the version
+    record_quote_version(db, quote, quote_state(quote, {
+        **result,
+        "commission_rate": calculation.commission_rate.normalize(),
+        "discount_rate": calculation.discount_rate.normalize(),
+        "apply_discount": calculation.apply_discount,
+    }), user_id)
+
+def _item_values(item) -> dict:
+    return {
+        "quantity": item.quantity,
+        "tree_species": TreeSpecies(item.tree_species),
+        "operation_type": OperationType(item.operation_type),
+        "custom_operation": item.custom_operation,
+        "cost": money(item.unit_price * item.quantity),
+    }
+
+@router.post("/quotes", response_model=QuoteSchema)
 def create_quote(
-    quote_data: QuoteCreate,
+    quote_data: QuoteDraftCreate,
     db: Session = Depends(get_db),
     current_user=Depends(rbac_required(["partner", "admin"]))
 ):
-    items_logic = [QuoteItemLogic(**item.dict()) for item in quote_data.items]
-    calculator = QuoteCalculator(commission_rate=quote_data.commission_rate, discount_rate=quote_data.discount_rate)
-    result = calculator.calculate_quote(items_logic, apply_discount=quote_data.apply_discount)
+    """
+    Create a draft quote priced from its items' unit prices. The draft is
+    stored as revision 1 of its version history.
+    """
+    lead = db.query(Lead).filter(Lead.id == quote_data.lead_id).first()
+    if not lead:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lead not found")
+    _check_lead_access(lead, current_user)
+    _check_catalogue_prices(db, lead, quote_data.items)
 
     new_quote = Quote(
-        lead_id=quote_data.lead_id,
-        subtotal=result["subtotal"],
-        discount=result["discount"],
-        commission=result["commission"],
-        total_amount=result["final_total"],
-        status="DRAFT",
-        versions=[result],
+        lead_id=lead.id,
+        status=QuoteStatus.DRAFT,
         created_by=current_user.id,
+        items=[QuoteItem(**_item_values(item)) for item in quote_data.items],
     )
     db.add(new_quote)
+    _price_quote(db, new_quote, quote_data, current_user.id)
+    KPIService(db).log_event("QuoteCreated", lead_id=lead.id, quote_id=new_quote.id, user_id=current_user.id)
     db.commit()
     db.refresh(new_quote)
-
-    for item in quote_data.items:
-        db_item = QuoteItem(
-            quote_id=new_quote.id,
-            tree_species=item.tree_species,
-            operation_type=OperationType(item.operation_type),
-            quantity=item.quantity,
-            cost=item.cost,
-        )
-        db.add(db_item)
-    db.commit()
-
-    KPIService(db).log_event("QuoteCreated", lead_id=quote_data.lead_id, quote_id=new_quote.id)
-    return new_quote.to_dict()
+    return QuoteSchema.from_orm(new_quote)
 
 @router.get("/quotes/{quote_id}", response_model=dict)
 def get_quote(
     quote_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user=Depends(rbac_required(["partner", "admin", "public customer"]))
 ):
-    quote = db.query(Quote).filter(Quote.id == quote_id).first()
-    if not quote:
+    validators = ETagService(db).quote_details(quote_id)
+    if validators is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote not found")
-    return quote.to_dict()
+    etag, _ = validators
+    return conditional_response(
+        request, etag, CACHE_CONTROL_DETAIL,
+        lambda: QuoteSchema.from_orm(db.query(Quote).filter(Quote.id == quote_id).first())
+    )
 
-@router.put("/quotes/{quote_id}", response_model=dict)
+@router.put("/quotes/{quote_id}", response_model=QuoteSchema)
 def update_quote(
     quote_id: int,
-    quote_data: QuoteUpdate,
+    quote_data: QuoteCalculation,
     db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    current_user=Depends(rbac_required(["partner", "admin"])),
 ):
-    quote = db.query(Quote).filter(Quote.id == quote_id).first()
-    if not quote:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote not found")
-
-    # Only partner owning quote or admin can update
-    if current_user.role.lower() == "partner" and quote.created_by != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to edit this quote")
+    """
+    Reprice a draft quote. Items with an id are changed in place, items
+    without one are added and the quote's items left out are removed, so
+    unchanged items keep their ids. Each change is a new revision.
+    """
+    quote = _get_quote(db, quote_id, current_user)
 
     # Prevent edits after sent/accepted/completed
-    if quote.status.upper() in {"SENT", "ACCEPTED", "COMPLETED"}:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quote cannot be edited after being sent")
+    if quote.status != QuoteStatus.DRAFT:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only draft quotes can be edited")
 
-    items_logic = [QuoteItemLogic(**item.dict()) for item in quote_data.items]
-    calculator = QuoteCalculator(commission_rate=quote_data.commission_rate, discount_rate=quote_data.discount_rate)
-    result = calculator.calculate_quote(items_logic, apply_discount=quote_data.apply_discount)
+    existing = {item.id: item for item in quote.items}
+    unknown = sorted({item.id for item in quote_data.items if item.id is not None} - existing.keys())
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Items {unknown} are not part of this quote")
+    _check_catalogue_prices(db, quote.lead, quote_data.items)
 
-    if not quote.versions:
-        quote.versions = []
-    quote.versions.append(result)
-
-    quote.subtotal = result["subtotal"]
-    quote.discount = result["discount"]
-    quote.commission = result["commission"]
-    quote.total_amount = result["final_total"]
-    quote.status = "UPDATED"
-
-    db.add(quote)
-    db.commit()
-    db.refresh(quote)
-
-    db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).delete()
+    kept = set()
     for item in quote_data.items:
-        db_item = QuoteItem(
-            quote_id=quote.id,
-            tree_species=item.tree_species,
-            operation_type=OperationType(item.operation_type),
-            quantity=item.quantity,
-            cost=item.cost,
-        )
-        db.add(db_item)
+        values = _item_values(item)
+        db_item = existing.get(item.id)
+        if db_item is None:
+            quote.items.append(QuoteItem(**values))
+            continue
+        kept.add(db_item.id)
+        for field, value in values.items():
+            # Only assign real changes, so untouched items are not rewritten
+            if getattr(db_item, field) != value:
+                setattr(db_item, field, value)
+    for item_id, db_item in existing.items():
+        if item_id not in kept:
+            # Delete explicitly: orphan deletes never show in session.deleted, so the change feed would miss them
+            quote.items.remove(db_item)
+            db.delete(db_item)
+    _price_quote(db, quote, quote_data, current_user.id)
+    KPIService(db).log_event("QuoteUpdated", lead_id=quote.lead_id, quote_id=quote.id, user_id=current_user.id)
     db.commit()
+    db.refresh(quote)
+    return QuoteSchema.from_orm(quote)
 
-    KPIService(db).log_event("QuoteUpdated", lead_id=quote.lead_id, quote_id=quote.id)
-    return quote.to_dict()
+@router.get("/quotes/{quote_id}/versions", response_model=List[QuoteVersionSummary])
+def get_quote_versions(
+    quote_id: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(rbac_required(["partner", "admin"])),
+):
+    """
+    Revision history of a quote, oldest first.
+    """
+    _get_quote(db, quote_id, current_user)
+    return list_quote_versions(db, quote_id)
+
+@router.get("/quotes/{quote_id}/versions/{revision}", response_model=QuoteVersionState)
+def get_quote_version(
+    quote_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(rbac_required(["partner", "admin"])),
+):
+    """
+    A quote's totals, rates and items as of one revision.
+    """
+    _get_quote(db, quote_id, current_user)
+    state = quote_version_state(db, quote_id, revision)
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote revision not found")
+    return QuoteVersionState(revision=revision, **state)
 
 @router.post("/quotes/{quote_id}/send", response_model=dict)
 def send_quote(
@@ -122,19 +209,47 @@ def send_quote(
     db: Session = Depends(get_db),
     current_user=Depends(rbac_required(["partner", "admin"])),
 ):
-    quote = db.query(Quote).filter(Quote.id == quote_id).first()
-    if not quote:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote not found")
-
-    offert_text = OffertCreator(db).generate_offert_text(quote_id)
-    NotificationService(db).send_quote_to_customer(quote.lead_id, offert_text)
-
-    LeadStatusTransitionService(db).update_lead_status(quote.lead_id, LeadStatus.QUOTED.value, user_role=current_user.role)
-
-    KPIService(db).log_event("QuoteSent", lead_id=quote.lead_id, quote_id=quote.id)
-
-    quote.status = "SENT"
-    db.add(quote)
-    db.commit()
+    """
+    Send a draft quote to the customer. The offert, the lead's move to
+    quoted, the KPI event, the customer page rendering and the customer
+    email are one unit of work on the request's session: the email is
+    queued as an outbox job in the same commit and goes out only if
+    everything else was saved.
+    """
+    quote = _get_quote(db, quote_id, current_user)
+    if quote.status != QuoteStatus.DRAFT:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only draft quotes can be sent")
+
+    try:
+        with UnitOfWork(db) as uow:
+            offert_text = OffertCreator(uow.db).generate_offert_text(quote.id)
+            LeadStatusTransitionService(uow.db).update_lead_status(
+                quote.lead_id, LeadStatus.QUOTED.value, user_role=current_user.role, user_id=current_user.id,
+                commit=False
+            )
+            KPIService(uow.db).log_event("QuoteSent", lead_id=quote.lead_id, quote_id=quote.id,
+                                         user_id=current_user.id)
+
+            notification = Notification(
+                customer_email=quote.lead.customer_email,
+                type=NotificationType.QUOTE_SENT,
+                channel=NotificationChannel.EMAIL,
+                title=f"Offert {quote.id}",
+                content=offert_text,
+                lead_id=quote.lead_id,
+                quote_id=quote.id,
+                tracking_id=str(uuid.uuid4()),
+            )
+            uow.db.add(notification)
+            uow.db.flush()
+            enqueue(uow.db, "notifications.send_email", {"notification_id": notification.id},
+                    submitted_by=current_user.id, commit=False)
+
+            quote.status = QuoteStatus.SENT
+            quote.sent_at = datetime.utcnow()
+            # Customer links show this rendering; the quote cannot change once sent
+            quote.render_hash = CustomerPortalService(uow.db).render_quote(quote.lead, quote)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     return {"detail": "Quote sent successfully"}
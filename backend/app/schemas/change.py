@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+
+from app.models.change_log import ChangeEntity, ChangeOperation
+
+
+class EntityChange(BaseModel):
+    id: int
+    entity_type: ChangeEntity
+    entity_id: int
+    operation: ChangeOperation
+    version: Optional[int] = None
+    diff: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+
+
+class ChangeBatch(BaseModel):
+    changes: List[EntityChange]
+    position: int  # acknowledge once the changes are processed
+    has_more: bool
+
+
+class ChangeConsumer(BaseModel):
+    name: str
+    position: int
+    lag: int = 0  # settled changes not yet acknowledged
+    acknowledged_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class ChangeAcknowledgement(BaseModel):
+    position: int
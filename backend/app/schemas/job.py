@@ -0,0 +1,52 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+from datetime import datetime
+
+from app.models.background_job import BackgroundJobStatus
+from app.models.scheduled_job import JobRunStatus
+
+
+class ScheduledJob(BaseModel):
+    name: str
+    schedule: str
+    next_run_at: datetime
+    locked_by: Optional[str] = None
+    locked_until: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class JobRun(BaseModel):
+    id: int
+    job_name: str
+    worker: str
+    status: JobRunStatus
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[int] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class BackgroundJob(BaseModel):
+    id: int
+    kind: str
+    status: BackgroundJobStatus
+    attempts: int
+    max_attempts: int
+    progress: int
+    progress_message: Optional[str] = None
+    result: Optional[Any] = None
+    has_file: bool = False
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Any
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
 
 
@@ -46,6 +47,16 @@ class LeadUpdate(BaseModel):
     assigned_partner_id: Optional[int] = None
 
 
+class LeadStatusBulkUpdate(BaseModel):
+    lead_ids: List[int] = Field(..., min_items=1)
+    status: LeadStatus
+
+
+class LeadStatusBulkResult(BaseModel):
+    updated: List[int]
+    skipped: List[int]
+
+
 class LeadInDBBase(LeadBase):
     id: int
     status: LeadStatus
@@ -57,8 +68,10 @@ class LeadInDBBase(LeadBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     expires_at: Optional[datetime] = None
-    lead_fee: float
-    commission_percent: float
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    lead_fee: Decimal
+    commission_percent: Decimal
     billed: bool
     viewed_details: bool
     view_count: int
@@ -0,0 +1,90 @@
+from pydantic import BaseModel, Field, condecimal
+from typing import List, Optional
+from datetime import datetime
+from decimal import Decimal
+
+from app.models.quote import OperationType, QuoteStatus, TreeSpecies
+
+Rate = condecimal(ge=0, le=1, decimal_places=4)
+
+
+class UnitPrice(BaseModel):
+    tree_species: TreeSpecies
+    operation_type: OperationType
+    unit_price: condecimal(ge=0, max_digits=10, decimal_places=2)
+
+
+class RepriceRequest(BaseModel):
+    commission_rate: Rate = Decimal("0.15")
+    discount_rate: Rate = Decimal("0.00")
+    apply_discount: bool = False
+    statuses: List[QuoteStatus] = [QuoteStatus.DRAFT]
+    partner_id: Optional[int] = None
+    quote_ids: Optional[List[int]] = None
+    unit_prices: List[UnitPrice] = []  # replaces the cost of matching items with unit price × quantity
+
+
+class CommissionWhatIfRequest(BaseModel):
+    commission_rates: List[Rate] = Field(..., min_items=1, max_items=50)
+    statuses: List[QuoteStatus] = [QuoteStatus.APPROVED]
+    partner_id: Optional[int] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+
+class CommissionScenario(BaseModel):
+    commission_rate: Decimal
+    commission: Decimal
+    final_total: Decimal
+
+
+class CommissionWhatIf(BaseModel):
+    quotes: int
+    current_commission: Decimal
+    scenarios: List[CommissionScenario]
+
+
+class CataloguePriceEntry(BaseModel):
+    tree_species: TreeSpecies
+    operation_type: OperationType
+    unit_price: Decimal
+
+
+class CataloguePriceUpdate(BaseModel):
+    tree_species: TreeSpecies
+    operation_type: OperationType
+    unit_price: Optional[condecimal(ge=0, max_digits=10, decimal_places=2)] = None  # None removes the price
+
+
+class CatalogueUpdate(BaseModel):
+    partner_id: Optional[int] = None  # None: every partner
+    region: Optional[str] = None  # None: every region
+    prices: List[CataloguePriceUpdate] = Field(..., min_items=1)
+
+
+class SuggestionItem(BaseModel):
+    tree_species: TreeSpecies
+    operation_type: OperationType
+    quantity: int = Field(1, ge=1)
+
+
+class QuoteSuggestionRequest(BaseModel):
+    lead_id: Optional[int] = None  # prices for the lead's partner and region
+    partner_id: Optional[int] = None
+    region: Optional[str] = None
+    commission_rate: Rate = Decimal("0.15")
+    items: List[SuggestionItem] = Field(..., min_items=1)
+
+
+class SuggestedItem(SuggestionItem):
+    unit_price: Optional[Decimal] = None  # None: not in the catalogue
+    amount: Optional[Decimal] = None
+
+
+class QuoteSuggestion(BaseModel):
+    items: List[SuggestedItem]
+    unpriced_items: int
+    subtotal: Decimal
+    discount: Decimal
+    commission: Decimal
+    final_total: Decimal
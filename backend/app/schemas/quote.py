@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Any
+from pydantic import BaseModel, Field, condecimal
+from typing import Optional, List, Any, Dict
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
 
 
@@ -53,7 +54,7 @@ class QuoteItemBase(BaseModel):
     tree_species: TreeSpecies
     operation_type: OperationType
     custom_operation: Optional[str] = None
-    cost: float
+    cost: Decimal
 
 
 class QuoteItemCreate(QuoteItemBase):
@@ -65,7 +66,7 @@ class QuoteItemUpdate(BaseModel):
     tree_species: Optional[TreeSpecies] = None
     operation_type: Optional[OperationType] = None
     custom_operation: Optional[str] = None
-    cost: Optional[float] = None
+    cost: Optional[Decimal] = None
 
 
 class QuoteItemInDBBase(QuoteItemBase):
@@ -84,8 +85,8 @@ class QuoteItem(QuoteItemInDBBase):
 
 class QuoteBase(BaseModel):
     lead_id: int
-    total_amount: float
-    commission_amount: float
+    total_amount: Decimal
+    commission_amount: Decimal
 
 
 class QuoteCreate(QuoteBase):
@@ -93,14 +94,38 @@ class QuoteCreate(QuoteBase):
 
 
 class QuoteUpdate(BaseModel):
-    total_amount: Optional[float] = None
-    commission_amount: Optional[float] = None
+    total_amount: Optional[Decimal] = None
+    commission_amount: Optional[Decimal] = None
     status: Optional[QuoteStatus] = None
 
 
+class QuoteLineItem(BaseModel):
+    id: Optional[int] = None  # existing item to change; on update, items left out are removed
+    quantity: int = Field(..., ge=1)
+    tree_species: TreeSpecies
+    operation_type: OperationType
+    custom_operation: Optional[str] = None
+    unit_price: condecimal(ge=0, max_digits=10, decimal_places=2)  # the item's cost is unit_price × quantity
+
+
+class QuoteCalculation(BaseModel):
+    items: List[QuoteLineItem] = Field(..., min_items=1)
+    commission_rate: condecimal(ge=0, le=1, decimal_places=4) = Decimal("0.15")
+    discount_rate: condecimal(ge=0, le=1, decimal_places=4) = Decimal("0.00")
+    apply_discount: bool = False
+
+
+class QuoteDraftCreate(QuoteCalculation):
+    lead_id: int
+
+
 class QuoteInDBBase(QuoteBase):
     id: int
     status: QuoteStatus
+    subtotal: Decimal = Decimal("0.00")
+    discount_amount: Decimal = Decimal("0.00")
+    created_by: Optional[int] = None
+    revision: int = 0
     sent_at: Optional[datetime] = None
     customer_response_at: Optional[datetime] = None
     created_at: datetime
@@ -112,3 +137,19 @@ class QuoteInDBBase(QuoteBase):
 
 class Quote(QuoteInDBBase):
     items: List[QuoteItem]
+
+
+class QuoteVersionSummary(BaseModel):
+    revision: int
+    is_snapshot: bool
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+class QuoteVersionState(BaseModel):
+    revision: int
+    totals: Dict[str, Any]
+    items: Dict[str, Dict[str, Any]]  # by item id
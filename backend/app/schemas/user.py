@@ -15,6 +15,10 @@ class UserBase(BaseModel):
     role: UserRole
     region: Optional[str] = None
     is_active: bool = True
+    base_latitude: Optional[float] = None
+    base_longitude: Optional[float] = None
+    service_radius_km: Optional[float] = None
+    max_open_leads: Optional[int] = None
 
 
 class UserCreate(UserBase):
@@ -27,6 +31,10 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None
     region: Optional[str] = None
     is_active: Optional[bool] = None
+    base_latitude: Optional[float] = None
+    base_longitude: Optional[float] = None
+    service_radius_km: Optional[float] = None
+    max_open_leads: Optional[int] = None
 
 
 class UserInDBBase(UserBase):
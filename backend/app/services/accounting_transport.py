@@ -0,0 +1,373 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Type
+
+import requests
+from pydantic import BaseModel
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Times a request is retried after a 429 from the accounting system
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class AccountingResult(BaseModel):
+    """Outcome for one invoice or customer, matched to its record by key"""
+    key: str
+    external_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `rate` start per second, across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class AccountingTransport:
+    """
+    Pushes invoices and customers to one accounting system.
+
+    Records are plain dicts; each has a "key" (the idempotency key for
+    invoices, the email for customers) that results are matched on.
+    Implementations take up to max_batch_size records per call and return
+    one result per record. Calls may run concurrently.
+    """
+
+    system: str
+    max_batch_size: int = 1
+    requests_per_second: float = 5.0
+    simulated: bool = False  # nothing reaches a real accounting system
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        raise NotImplementedError
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        raise NotImplementedError
+
+
+def _batch_key(records: List[Dict[str, Any]]) -> str:
+    """Stable idempotency key for a batch request, derived from its records' keys"""
+    return hashlib.sha256("\n".join(record["key"] for record in records).encode()).hexdigest()[:40]
+
+
+class HTTPAccountingTransport(AccountingTransport):
+    """
+    Base for the HTTP adapters. Requests go through a shared rate limiter
+    and a 429 is retried after the Retry-After the system asks for.
+    Systems without a batch endpoint send one request per record.
+    """
+
+    def __init__(self, base_url: str, api_key: str = "", tenant_id: str = "", timeout: float = 15.0,
+                 batch_size: Optional[int] = None, requests_per_second: Optional[float] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.tenant_id = tenant_id
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.http.headers["Authorization"] = f"Bearer {api_key}"
+        if batch_size:
+            self.max_batch_size = min(batch_size, type(self).max_batch_size)
+        self.limiter = RateLimiter(requests_per_second or self.requests_per_second)
+
+    def _post(self, path: str, body: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.limiter.acquire()
+            response = self.http.post(f"{self.base_url}{path}", json=body, headers=headers, timeout=self.timeout)
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+        response.raise_for_status()
+        return response.json()
+
+    def _each(self, records: List[Dict[str, Any]],
+              send: Callable[[Dict[str, Any]], str]) -> List[AccountingResult]:
+        results = []
+        for record in records:
+            try:
+                results.append(AccountingResult(key=record["key"], external_id=send(record)))
+            except requests.RequestException as e:
+                results.append(AccountingResult(key=record["key"], error=str(e)))
+        return results
+
+
+class QuickBooksTransport(HTTPAccountingTransport):
+    """QuickBooks Online batch API: up to 30 operations per request; requestid makes it idempotent"""
+
+    system = "quickbooks"
+    max_batch_size = 30
+    requests_per_second = 8.0  # 500 requests per minute per company
+
+    def _batch(self, entity: str, records: List[Dict[str, Any]], to_entity: Callable) -> List[AccountingResult]:
+        response = self._post(
+            f"/v3/company/{self.tenant_id}/batch?requestid={_batch_key(records)}",
+            {"BatchItemRequest": [
+                {"bId": record["key"], "operation": "create", entity: to_entity(record)} for record in records
+            ]}
+        )
+        results = []
+        for item in response.get("BatchItemResponse", []):
+            if "Fault" in item:
+                errors = item["Fault"].get("Error", [])
+                results.append(AccountingResult(key=item["bId"], error=errors[0]["Message"] if errors else "Fault"))
+            else:
+                results.append(AccountingResult(key=item["bId"], external_id=str(item[entity]["Id"])))
+        return results
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._batch("Invoice", invoices, lambda invoice: {
+            "DocNumber": invoice["key"],
+            "CustomerRef": {"name": invoice["customer_name"]},
+            "BillEmail": {"Address": invoice["customer_email"]},
+            "DueDate": invoice["due_date"],
+            "Line": [
+                {"DetailType": "SalesItemLineDetail", "Description": item["description"], "Amount": item["amount"],
+                 "SalesItemLineDetail": {"Qty": item["quantity"], "UnitPrice": item["unit_price"]}}
+                for item in invoice["items"]
+            ],
+        })
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._batch("Customer", customers, lambda customer: {
+            "DisplayName": customer["name"],
+            "PrimaryEmailAddr": {"Address": customer["email"]},
+            "PrimaryPhone": {"FreeFormNumber": customer["phone"]},
+            "BillAddr": {"Line1": customer["address"], "City": customer["city"],
+                         "PostalCode": customer["postal_code"], "CountrySubDivisionCode": customer["region"]},
+        })
+
+
+class XeroTransport(HTTPAccountingTransport):
+    """Xero accounting API: up to 50 invoices or contacts per request, with an Idempotency-Key header"""
+
+    system = "xero"
+    max_batch_size = 50
+    requests_per_second = 1.0  # 60 calls per minute per tenant
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.http.headers["Xero-tenant-id"] = self.tenant_id
+
+    def _batch(self, entity: str, records: List[Dict[str, Any]], to_entity: Callable,
+               id_field: str) -> List[AccountingResult]:
+        response = self._post(
+            f"/api.xro/2.0/{entity}?summarizeErrors=false",
+            {entity: [to_entity(record) for record in records]},
+            idempotency_key=_batch_key(records)
+        )
+        # Elements come back in request order
+        results = []
+        for record, item in zip(records, response.get(entity, [])):
+            errors = item.get("ValidationErrors") or []
+            if errors:
+                results.append(AccountingResult(key=record["key"], error=errors[0]["Message"]))
+            else:
+                results.append(AccountingResult(key=record["key"], external_id=str(item[id_field])))
+        return results
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._batch("Invoices", invoices, lambda invoice: {
+            "Type": "ACCREC",
+            "Reference": invoice["key"],
+            "Contact": {"Name": invoice["customer_name"], "EmailAddress": invoice["customer_email"]},
+            "DueDate": invoice["due_date"],
+            "LineItems": [
+                {"Description": item["description"], "Quantity": item["quantity"],
+                 "UnitAmount": item["unit_price"], "LineAmount": item["amount"]}
+                for item in invoice["items"]
+            ],
+        }, "InvoiceID")
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._batch("Contacts", customers, lambda customer: {
+            "Name": customer["name"],
+            "EmailAddress": customer["email"],
+            "Phones": [{"PhoneType": "DEFAULT", "PhoneNumber": customer["phone"]}],
+            "Addresses": [{"AddressType": "STREET", "AddressLine1": customer["address"], "City": customer["city"],
+                           "PostalCode": customer["postal_code"], "Region": customer["region"]}],
+        }, "ContactID")
+
+
+class FortnoxTransport(HTTPAccountingTransport):
+    """Fortnox API v3: one record per request, so throughput comes from concurrency"""
+
+    system = "fortnox"
+    requests_per_second = 5.0  # 25 requests per 5 seconds
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._each(invoices, lambda invoice: str(self._post("/3/invoices", {"Invoice": {
+            "YourReference": invoice["key"],
+            "CustomerName": invoice["customer_name"],
+            "EmailInformation": {"EmailAddressTo": invoice["customer_email"]},
+            "DueDate": invoice["due_date"],
+            "InvoiceRows": [
+                {"Description": item["description"], "DeliveredQuantity": item["quantity"],
+                 "Price": item["unit_price"]}
+                for item in invoice["items"]
+            ],
+        }}, idempotency_key=invoice["key"])["Invoice"]["DocumentNumber"]))
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._each(customers, lambda customer: str(self._post("/3/customers", {"Customer": {
+            "Name": customer["name"],
+            "Email": customer["email"],
+            "Phone1": customer["phone"],
+            "Address1": customer["address"],
+            "City": customer["city"],
+            "ZipCode": customer["postal_code"],
+        }})["Customer"]["CustomerNumber"]))
+
+
+class VismaTransport(HTTPAccountingTransport):
+    """Visma eAccounting API v2: one record per request"""
+
+    system = "visma"
+    requests_per_second = 10.0
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._each(invoices, lambda invoice: str(self._post("/v2/customerinvoicedrafts", {
+            "YourReference": invoice["key"],
+            "InvoiceCustomerName": invoice["customer_name"],
+            "InvoiceEmailAddress": invoice["customer_email"],
+            "DueDate": invoice["due_date"],
+            "Rows": [
+                {"Text": item["description"], "Quantity": item["quantity"], "UnitPrice": item["unit_price"]}
+                for item in invoice["items"]
+            ],
+        }, idempotency_key=invoice["key"])["Id"]))
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        return self._each(customers, lambda customer: str(self._post("/v2/customers", {
+            "Name": customer["name"],
+            "EmailAddress": customer["email"],
+            "Telephone": customer["phone"],
+            "InvoiceAddress1": customer["address"],
+            "InvoiceCity": customer["city"],
+            "InvoicePostalCode": customer["postal_code"],
+        })["Id"]))
+
+
+HTTP_TRANSPORTS: Dict[str, Type[HTTPAccountingTransport]] = {
+    transport.system: transport
+    for transport in (QuickBooksTransport, XeroTransport, FortnoxTransport, VismaTransport)
+}
+
+# Invoice id prefixes of the simulated systems
+SIMULATED_PREFIXES = {"quickbooks": "QB", "xero": "XR", "fortnox": "FN", "visma": "VS"}
+
+
+class SimulatedAccountingTransport(AccountingTransport):
+    """
+    Stand-in used when no ACCOUNTING_API_URL is configured: logs what would
+    be sent and derives ids from the idempotency keys. Also handy in tests.
+    Its ids are not real invoices, so the invoice ledger is left pending
+    while it is in use and is sent once a real system is configured.
+    """
+
+    max_batch_size = 500
+    requests_per_second = 0.0
+    simulated = True
+
+    def __init__(self, system: str):
+        if system not in SIMULATED_PREFIXES:
+            raise ValueError(f"Unsupported accounting system: {system}")
+        self.system = system
+        self.prefix = SIMULATED_PREFIXES[system]
+        self.invoices: List[Dict[str, Any]] = []
+        self.customers: List[Dict[str, Any]] = []
+
+    def create_invoices(self, invoices: List[Dict[str, Any]]) -> List[AccountingResult]:
+        logger.info(f"Would create {len(invoices)} invoices in {self.system}")
+        self.invoices.extend(invoices)
+        return [AccountingResult(key=invoice["key"], external_id=f"{self.prefix}-INV-{invoice['quote_id']}")
+                for invoice in invoices]
+
+    def upsert_customers(self, customers: List[Dict[str, Any]]) -> List[AccountingResult]:
+        logger.info(f"Would sync {len(customers)} customers with {self.system}")
+        self.customers.extend(customers)
+        return [AccountingResult(key=customer["key"], external_id=f"{self.prefix}-CUS-{customer['key']}")
+                for customer in customers]
+
+
+def build_transport(system: str) -> AccountingTransport:
+    system = system.lower()
+    if not settings.ACCOUNTING_API_URL:
+        return SimulatedAccountingTransport(system)
+    if system not in HTTP_TRANSPORTS:
+        raise ValueError(f"Unsupported accounting system: {system}")
+    return HTTP_TRANSPORTS[system](
+        settings.ACCOUNTING_API_URL,
+        api_key=settings.ACCOUNTING_API_KEY,
+        tenant_id=settings.ACCOUNTING_TENANT_ID,
+        timeout=settings.ACCOUNTING_TIMEOUT_SECONDS,
+        batch_size=settings.ACCOUNTING_BATCH_SIZE,
+        requests_per_second=settings.ACCOUNTING_REQUESTS_PER_SECOND,
+    )
+
+
+# Transports per system, built on first use; replaced in tests via set_accounting_transport
+_transports: Dict[str, AccountingTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_accounting_transport(system: str) -> AccountingTransport:
+    with _transports_lock:
+        if system not in _transports:
+            _transports[system] = build_transport(system)
+        return _transports[system]
+
+
+def set_accounting_transport(transport: AccountingTransport) -> None:
+    """Replace the transport of a system, e.g. with one pointed at a fake server"""
+    with _transports_lock:
+        _transports[transport.system] = transport
+
+
+def send_concurrently(transport: AccountingTransport, operation: str, records: List[Dict[str, Any]],
+                      concurrency: Optional[int] = None) -> List[AccountingResult]:
+    """
+    Split records into the transport's batches and send them on a thread
+    pool. The transport's rate limiter keeps the combined rate within the
+    system's limit. A batch that fails as a whole fails all of its records.
+
+    Args:
+        transport: Accounting system adapter
+        operation: "create_invoices" or "upsert_customers"
+        records: Records to send, each with a "key"
+        concurrency: Requests in flight at once (ACCOUNTING_CONCURRENCY)
+
+    Returns:
+        One result per record
+    """
+    size = transport.max_batch_size
+    batches = [records[i:i + size] for i in range(0, len(records), size)]
+    if not batches:
+        return []
+
+    def send(batch: List[Dict[str, Any]]) -> List[AccountingResult]:
+        try:
+            return getattr(transport, operation)(batch)
+        except Exception as e:
+            logger.error(f"{transport.system} {operation} batch of {len(batch)} failed: {e}")
+            return [AccountingResult(key=record["key"], error=str(e)) for record in batch]
+
+    workers = min(concurrency or settings.ACCOUNTING_CONCURRENCY, len(batches))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="accounting") as pool:
+        return [result for results in pool.map(send, batches) for result in results]
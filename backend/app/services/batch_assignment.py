@@ -0,0 +1,205 @@
+import heapq
+import logging
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.change_log import ChangeEntity
+from app.models.kpi import KPIEvent
+from app.models.lead import Lead, LeadStatus
+from app.services.change_tracking import record_changes, record_entity_changes
+from app.services.lead_assignment import invalidate_assignment_engine
+from app.services.partner_locator import get_partner_locator, record_partner_assignment
+from app.services.partner_ranking_service import compute_partner_scores, score_partner
+
+logger = logging.getLogger(__name__)
+
+# Smallest bid raise; the matching is within len(leads) * AUCTION_EPSILON of
+# the best possible total weight. Smaller values cost more bidding rounds
+# when many leads compete for the same partners.
+AUCTION_EPSILON = 0.01
+
+
+class BatchAssignmentResult(BaseModel):
+    considered: int = 0
+    assigned: int = 0
+    unassigned: int = 0
+    elapsed_ms: float = 0.0
+    dry_run: bool = False
+    assignments: Dict[int, List[int]] = {}  # partner id -> lead ids
+
+
+def auction_match(edges: Dict[int, List[Tuple[int, float]]], capacity: Dict[int, int],
+                  open_leads: Dict[int, int], load_penalty: float,
+                  epsilon: float = AUCTION_EPSILON) -> Dict[int, int]:
+    """
+    Capacitated maximum-weight matching of leads to partners (auction algorithm)
+
+    Each partner offers `capacity` slots. Its k-th slot costs
+    load_penalty * (open_leads + k), so a partner's marginal lead is worth
+    less the busier it already is and work spreads across partners. Leads bid
+    for the slot with the best weight minus cost minus price, raising its
+    price by their margin over the next best option; an outbid lead bids
+    again. A lead drops out when no slot is worth more than staying
+    unassigned.
+
+    Args:
+        edges: Lead id -> [(partner id, weight)] for the partners eligible for it
+        capacity: Partner id -> number of leads it can take in this batch
+        open_leads: Partner id -> leads it is already working on
+        load_penalty: Cost per open lead
+
+    Returns:
+        Lead id -> partner id for the matched leads
+    """
+    # Per partner: heap of (slot cost + price, slot), and who holds each slot
+    slots: Dict[int, List[Tuple[float, int]]] = {}
+    holders: Dict[int, List[Optional[int]]] = {}
+    for partner_id, cap in capacity.items():
+        base = open_leads.get(partner_id, 0)
+        slots[partner_id] = [(load_penalty * (base + k), k) for k in range(cap)]
+        holders[partner_id] = [None] * cap
+
+    matched: Dict[int, int] = {}
+    queue = deque(edges)
+    while queue:
+        lead_id = queue.popleft()
+        best, second, best_partner, best_weight = 0.0, 0.0, None, 0.0
+        for partner_id, weight in edges[lead_id]:
+            heap = slots.get(partner_id)
+            if not heap:
+                continue
+            value = weight - heap[0][0]
+            if value > best:
+                best, second, best_partner, best_weight = value, best, partner_id, weight
+            elif value > second:
+                second = value
+        if best_partner is None:
+            continue
+
+        # The best partner's next slot is an alternative too
+        heap = slots[best_partner]
+        if len(heap) > 1:
+            second = max(second, best_weight - min(heap[1:3])[0])
+
+        cost, slot = heap[0]
+        heapq.heapreplace(heap, (cost + best - second + epsilon, slot))
+        outbid = holders[best_partner][slot]
+        holders[best_partner][slot] = lead_id
+        matched[lead_id] = best_partner
+        if outbid is not None:
+            del matched[outbid]
+            queue.append(outbid)
+    return matched
+
+
+def batch_assign_leads(db: Session, limit: Optional[int] = None, radius_km: Optional[float] = None,
+                       dry_run: bool = False) -> BatchAssignmentResult:
+    """
+    Assign the oldest unassigned leads to nearby partners in one matching
+
+    Weights combine the partner's acceptance-rate score with proximity;
+    partner capacity is max_open_leads minus open leads, or
+    BATCH_ASSIGN_PARTNER_CAPACITY for partners without a limit. Assignments
+    are written with one guarded UPDATE per partner (leads assigned
+    meanwhile are skipped), with their change_log rows and KPI events, in a
+    single transaction.
+
+    Args:
+        db: Database session
+        limit: Leads considered, defaults to BATCH_ASSIGN_MAX_LEADS
+        radius_km: Search radius, defaults to NEAREST_PARTNER_RADIUS_KM
+        dry_run: Compute the matching without writing it
+    """
+    started = time.perf_counter()
+    radius_km = radius_km or settings.NEAREST_PARTNER_RADIUS_KM
+    leads = db.query(Lead.id, Lead.latitude, Lead.longitude).filter(
+        Lead.status == LeadStatus.NEW
+    ).order_by(Lead.created_at).limit(limit or settings.BATCH_ASSIGN_MAX_LEADS).all()
+
+    locator = get_partner_locator(db)
+    scores = {p.partner_id: p.score for p in compute_partner_scores(db)}
+    new_partner_score = score_partner(0, 0, None)
+
+    edges: Dict[int, List[Tuple[int, float]]] = {}
+    capacity: Dict[int, int] = {}
+    open_leads: Dict[int, int] = {}
+    for lead_id, latitude, longitude in leads:
+        if latitude is None or longitude is None:
+            continue
+        nearby = locator.nearest(latitude, longitude, limit=settings.BATCH_ASSIGN_CANDIDATES, radius_km=radius_km)
+        if not nearby:
+            continue
+        edges[lead_id] = [
+            (p.partner_id, scores.get(p.partner_id, new_partner_score)
+             + settings.BATCH_ASSIGN_PROXIMITY_WEIGHT * (1 - p.distance_km / radius_km))
+            for p in nearby
+        ]
+        for p in nearby:
+            if p.partner_id not in capacity:
+                spare = settings.BATCH_ASSIGN_PARTNER_CAPACITY if p.max_open_leads is None else p.max_open_leads - p.open_leads
+                capacity[p.partner_id] = max(0, spare)
+                open_leads[p.partner_id] = p.open_leads
+
+    matched = auction_match(edges, capacity, open_leads, settings.ASSIGNMENT_LOAD_PENALTY)
+    by_partner: Dict[int, List[int]] = defaultdict(list)
+    for lead_id, partner_id in matched.items():
+        by_partner[partner_id].append(lead_id)
+
+    if not dry_run and by_partner:
+        by_partner = _write_assignments(db, by_partner)
+
+    assigned = sum(len(ids) for ids in by_partner.values())
+    result = BatchAssignmentResult(
+        considered=len(leads),
+        assigned=assigned,
+        unassigned=len(leads) - assigned,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        dry_run=dry_run,
+        assignments={partner_id: sorted(ids) for partner_id, ids in by_partner.items()}
+    )
+    logger.info(
+        f"Batch assignment: {result.assigned} of {result.considered} leads to "
+        f"{len(by_partner)} partners in {result.elapsed_ms} ms"
+    )
+    return result
+
+
+def _write_assignments(db: Session, by_partner: Dict[int, List[int]]) -> Dict[int, List[int]]:
+    now = datetime.utcnow()
+    written: Dict[int, List[int]] = {}
+    kpi_rows = []
+    for partner_id, lead_ids in by_partner.items():
+        rows = db.execute(
+            update(Lead)
+            .where(Lead.id.in_(lead_ids), Lead.status == LeadStatus.NEW)
+            .values(assigned_partner_id=partner_id, status=LeadStatus.ASSIGNED, assigned_at=now,
+                    version=Lead.version + 1)
+            .returning(Lead.id, Lead.version)
+        ).all()
+        if not rows:
+            continue
+        ids = [lead_id for lead_id, _ in rows]
+        written[partner_id] = ids
+        record_changes(db, partner_id, ChangeEntity.LEAD, ids)
+        diff = {"assigned_partner_id": partner_id, "status": LeadStatus.ASSIGNED, "assigned_at": now}
+        record_entity_changes(db, ChangeEntity.LEAD, [(lead_id, version, diff) for lead_id, version in rows])
+        kpi_rows.extend(
+            {"event_type": "lead_assigned", "lead_id": lead_id, "user_id": partner_id,
+             "data": f"Lead batch-assigned to partner {partner_id}"}
+            for lead_id in ids
+        )
+    if kpi_rows:
+        db.execute(KPIEvent.__table__.insert(), kpi_rows)
+    db.commit()
+
+    for partner_id, ids in written.items():
+        record_partner_assignment(partner_id, len(ids))
+    invalidate_assignment_engine()
+    return written
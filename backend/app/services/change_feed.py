@@ -0,0 +1,141 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.change_log import ChangeConsumer, ChangeEntity, EntityChange
+from app.services.change_tracking import visibility_horizon
+
+
+def feed_head(db: Session) -> int:
+    """
+    Offset up to which the feed is settled: just before the first row
+    written by a transaction that may still be running (xid at or above
+    the visibility horizon), whatever its age
+    """
+    horizon = visibility_horizon(db)
+    if horizon is not None:
+        unsettled = db.query(func.min(EntityChange.id)).filter(EntityChange.xid >= horizon).scalar()
+        if unsettled is not None:
+            return unsettled - 1
+    return db.query(func.max(EntityChange.id)).scalar() or 0
+
+
+class ChangeBatch:
+    def __init__(self, changes: List[Dict[str, Any]], position: int, has_more: bool):
+        self.changes = changes
+        self.position = position  # acknowledge this once the changes are processed
+        self.has_more = has_more
+
+
+class ChangeFeed:
+    """
+    Incremental reader of the entity_changes feed for one named consumer.
+
+    read() returns the changes after the consumer's acknowledged offset;
+    acknowledge() moves the offset once they are processed, so delivery is
+    at least once and a consumer that fails re-reads the same batch. Reads
+    stop at feed_head: ids are assigned at insert but become visible at
+    commit, and a row from a transaction still running must not be
+    skipped.
+    """
+
+    def __init__(self, db: Session, consumer: str):
+        self.db = db
+        self.consumer = consumer
+
+    def _consumer(self) -> ChangeConsumer:
+        row = self.db.get(ChangeConsumer, self.consumer)
+        if row is None:
+            row = ChangeConsumer(name=self.consumer, position=0)
+            self.db.add(row)
+            self.db.commit()
+        return row
+
+    @property
+    def position(self) -> int:
+        return self._consumer().position
+
+    def head(self) -> int:
+        return feed_head(self.db)
+
+    def read(self, limit: Optional[int] = None, entity_types: Optional[Iterable[ChangeEntity]] = None,
+             after: Optional[int] = None) -> ChangeBatch:
+        """
+        Changes after the consumer's offset, oldest first
+
+        Args:
+            limit: Maximum number of changes (CHANGE_FEED_BATCH_SIZE)
+            entity_types: Only return changes to these entities; the offset
+                still moves past the others
+            after: Read after this offset instead of the acknowledged one
+
+        Returns:
+            The changes, the offset to acknowledge and whether more are pending
+        """
+        limit = min(limit or settings.CHANGE_FEED_BATCH_SIZE, settings.CHANGE_FEED_MAX_BATCH_SIZE)
+        position = self.position if after is None else after
+        head = self.head()
+        query = self.db.query(EntityChange).filter(EntityChange.id > position, EntityChange.id <= head)
+        if entity_types:
+            query = query.filter(EntityChange.entity_type.in_(list(entity_types)))
+        rows = query.order_by(EntityChange.id).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [
+            {
+                "id": row.id,
+                "entity_type": row.entity_type,
+                "entity_id": row.entity_id,
+                "operation": row.operation,
+                "version": row.version,
+                "diff": json.loads(row.diff) if row.diff else None,
+                "created_at": row.created_at,
+            }
+            for row in rows
+        ]
+        return ChangeBatch(changes, rows[-1].id if has_more else max(head, position), has_more)
+
+    def batches(self, limit: Optional[int] = None,
+                entity_types: Optional[Iterable[ChangeEntity]] = None) -> Iterator[ChangeBatch]:
+        """Read until caught up; the caller acknowledges each batch after processing it"""
+        position = self.position
+        while True:
+            batch = self.read(limit, entity_types, after=position)
+            if batch.position != position:
+                yield batch
+            if not batch.has_more:
+                return
+            position = batch.position
+
+    def acknowledge(self, position: int) -> int:
+        """
+        Record that everything up to position has been processed. Offsets
+        only move forward, so a late acknowledgement from a concurrent
+        reader cannot rewind the consumer.
+
+        Returns:
+            The consumer's offset
+        """
+        consumer = self._consumer()
+        self.db.execute(
+            update(ChangeConsumer)
+            .where(ChangeConsumer.name == self.consumer, ChangeConsumer.position < position)
+            .values(position=position, acknowledged_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        self.db.refresh(consumer)
+        return consumer.position
+
+
+def purge_entity_changes(db: Session) -> int:
+    """Delete feed entries older than CHANGE_FEED_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+    deleted = db.query(EntityChange).filter(EntityChange.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,216 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.models.change_log import ChangeLog, ChangeEntity, ChangeOperation, EntityChange
+from app.models.lead import Lead
+from app.models.notification import Notification
+from app.models.quote import Quote, QuoteItem
+from app.utils.responses import dumps
+
+ENTITY_TYPES = {Lead: ChangeEntity.LEAD, Quote: ChangeEntity.QUOTE, QuoteItem: ChangeEntity.QUOTE_ITEM,
+                Notification: ChangeEntity.NOTIFICATION}
+
+# Left out of entity_changes diffs: version has its own column, and
+# updated_at is set by the database
+DIFF_EXCLUDED_COLUMNS = {"version", "updated_at"}
+
+# Session.info key: (transaction, its PostgreSQL transaction id)
+_XID = "change_tracking_xid"
+
+
+def current_xid(session: Session) -> Optional[int]:
+    """
+    The PostgreSQL id (xid8) of the session's current transaction, stored
+    with every change row; None on other databases
+    """
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    transaction = session.get_transaction()
+    cached = session.info.get(_XID)
+    if cached is None or cached[0] is not transaction:
+        cached = (transaction, connection.execute(text("SELECT pg_current_xact_id()::text::bigint")).scalar())
+        session.info[_XID] = cached
+    return cached[1]
+
+
+def visibility_horizon(session: Session) -> Optional[int]:
+    """
+    Oldest transaction id still running, as of the session's snapshot
+    (PostgreSQL). Change rows with a lower xid are committed (or rolled
+    back); rows at or above it may still become visible. None on other
+    databases, where writers commit one at a time (SQLite) so ids become
+    visible in order.
+    """
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    return connection.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+
+class _FlushChangeCollector:
+    """Collects change_log rows for one flush, resolving each entity's audience"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.rows: List[dict] = []
+        self.feed_rows: List[dict] = []
+        self._lead_partner: Dict[int, Optional[int]] = {}
+        self._quote_lead: Dict[int, Optional[int]] = {}
+
+    def add(self, user_id: Optional[int], entity_type: ChangeEntity, entity_id: int,
+            operation: ChangeOperation) -> None:
+        if user_id is None or entity_id is None:
+            return
+        self.rows.append({
+            "user_id": user_id,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "operation": operation,
+            "xid": current_xid(self.session),
+        })
+
+    def lead_partner(self, lead_id: Optional[int]) -> Optional[int]:
+        if lead_id is None:
+            return None
+        if lead_id not in self._lead_partner:
+            lead = self.session.get(Lead, lead_id)
+            self._lead_partner[lead_id] = lead.assigned_partner_id if lead else None
+        return self._lead_partner[lead_id]
+
+    def quote_partner(self, quote_id: Optional[int]) -> Optional[int]:
+        if quote_id is None:
+            return None
+        if quote_id not in self._quote_lead:
+            quote = self.session.get(Quote, quote_id)
+            self._quote_lead[quote_id] = quote.lead_id if quote else None
+        return self.lead_partner(self._quote_lead[quote_id])
+
+    def collect_feed(self, obj, operation: ChangeOperation, is_new: bool = False) -> None:
+        self.feed_rows.append({
+            "entity_type": ENTITY_TYPES[type(obj)],
+            "entity_id": obj.id,
+            "operation": operation,
+            "version": getattr(obj, "version", None),
+            "diff": None if operation == ChangeOperation.DELETE else _diff(obj, is_new),
+            "xid": current_xid(self.session),
+        })
+
+    def collect(self, obj, operation: ChangeOperation) -> None:
+        if isinstance(obj, Lead):
+            self.add(obj.assigned_partner_id, ChangeEntity.LEAD, obj.id, operation)
+            # A reassigned lead disappears for the previous partner
+            history = inspect(obj).attrs.assigned_partner_id.history
+            for previous in history.deleted or ():
+                if previous != obj.assigned_partner_id:
+                    self.add(previous, ChangeEntity.LEAD, obj.id, ChangeOperation.DELETE)
+        elif isinstance(obj, Quote):
+            self.add(self.lead_partner(obj.lead_id), ChangeEntity.QUOTE, obj.id, operation)
+        elif isinstance(obj, QuoteItem):
+            self.add(self.quote_partner(obj.quote_id), ChangeEntity.QUOTE_ITEM, obj.id, operation)
+        elif isinstance(obj, Notification):
+            self.add(obj.user_id, ChangeEntity.NOTIFICATION, obj.id, operation)
+
+
+@event.listens_for(Session, "after_flush")
+def _log_changes(session: Session, flush_context) -> None:
+    """
+    Append a change_log row (per user who can see it) and an
+    entity_changes row for every lead, quote, quote item and notification
+    written by an ORM flush, in the same transaction.
+
+    Bulk Core statements (query.update/delete, insert()) bypass the ORM
+    unit of work and must call record_changes themselves.
+    """
+    tracked = (Lead, Quote, QuoteItem, Notification)
+    collector = _FlushChangeCollector(session)
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, tracked):
+                collector.collect(obj, ChangeOperation.UPSERT)
+                collector.collect_feed(obj, ChangeOperation.UPSERT, is_new=True)
+        for obj in session.dirty:
+            if isinstance(obj, tracked) and session.is_modified(obj, include_collections=False):
+                collector.collect(obj, ChangeOperation.UPSERT)
+                collector.collect_feed(obj, ChangeOperation.UPSERT)
+        for obj in session.deleted:
+            if isinstance(obj, tracked):
+                collector.collect(obj, ChangeOperation.DELETE)
+                collector.collect_feed(obj, ChangeOperation.DELETE)
+
+    if collector.rows:
+        session.connection().execute(ChangeLog.__table__.insert(), collector.rows)
+    if collector.feed_rows:
+        session.connection().execute(EntityChange.__table__.insert(), collector.feed_rows)
+
+
+def _diff(obj, is_new: bool) -> str:
+    """Changed columns and their new values as JSON; every loaded column for a new row"""
+    state = inspect(obj)
+    values: Dict[str, Any] = {}
+    for attr in state.mapper.column_attrs:
+        if attr.key in DIFF_EXCLUDED_COLUMNS:
+            continue
+        if is_new:
+            if attr.key in state.dict:
+                values[attr.key] = state.dict[attr.key]
+        else:
+            added = state.attrs[attr.key].history.added
+            if added:
+                values[attr.key] = added[0]
+    return dumps(values).decode()
+
+
+def record_changes(db: Session, user_id: Optional[int], entity_type: ChangeEntity,
+                   entity_ids: Iterable[int], operation: ChangeOperation = ChangeOperation.UPSERT) -> None:
+    """
+    Record changes made outside the ORM unit of work, e.g. bulk updates
+
+    Args:
+        db: Database session (the rows join its current transaction)
+        user_id: User the entities are visible to
+        entity_type: Type of the changed entities
+        entity_ids: IDs of the changed entities
+        operation: Upsert or delete
+    """
+    if user_id is None:
+        return
+    xid = current_xid(db)
+    rows = [
+        {"user_id": user_id, "entity_type": entity_type, "entity_id": entity_id, "operation": operation,
+         "xid": xid}
+        for entity_id in entity_ids
+    ]
+    if rows:
+        db.execute(ChangeLog.__table__.insert(), rows)
+
+
+def record_entity_changes(db: Session, entity_type: ChangeEntity,
+                          changes: Iterable[Tuple[int, Optional[int], Optional[Dict[str, Any]]]],
+                          operation: ChangeOperation = ChangeOperation.UPSERT) -> None:
+    """
+    Append entity_changes rows for changes made outside the ORM unit of
+    work; the counterpart of record_changes for the integration feed
+
+    Args:
+        db: Database session (the rows join its current transaction)
+        entity_type: Type of the changed entities
+        changes: (entity id, version after the change, changed columns) per entity
+        operation: Upsert or delete
+    """
+    xid = current_xid(db)
+    rows = [
+        {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "operation": operation,
+            "version": version,
+            "diff": None if diff is None else dumps(diff).decode(),
+            "xid": xid,
+        }
+        for entity_id, version, diff in changes
+    ]
+    if rows:
+        db.execute(EntityChange.__table__.insert(), rows)
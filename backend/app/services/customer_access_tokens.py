@@ -0,0 +1,153 @@
+import logging
+import secrets
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.customer_access_token import CustomerAccessToken
+from app.models.quote_render import QuoteRender
+from app.services.quote_renders import QuoteRenderService
+from app.services.refresh_tokens import hash_token
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# token hash -> (quote id, render hash, expires_at, cached at), so a link
+# opened again costs one single-row read instead of the join to its rendering
+_view_cache = TTLCache(maxsize=10 * settings.QUOTE_RENDER_CACHE_SIZE, ttl=settings.QUOTE_VIEW_CACHE_TTL_SECONDS)
+
+# quote id -> time its links last changed in this process; view cache
+# entries older than this are ignored. Other workers notice through the
+# token row, which get_view re-reads on every cache hit.
+_invalidated = TTLCache(maxsize=10 * settings.QUOTE_RENDER_CACHE_SIZE, ttl=settings.QUOTE_VIEW_CACHE_TTL_SECONDS)
+
+
+def invalidate_quote(quote_id: int) -> None:
+    """Drop this process's cached views of a quote's links"""
+    _invalidated.set(quote_id, time.monotonic())
+
+
+def _check_usable(row: Optional[Any]) -> None:
+    if row is None or row.revoked_at is not None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if row.expires_at.replace(tzinfo=None) <= datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Token expired")
+
+
+class CustomerAccessTokenService:
+    """Issues, resolves and revokes the quote links emailed to customers"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def issue(self, lead_id: int, quote_id: int, customer_email: Optional[str],
+              render_hash: str) -> Tuple[str, CustomerAccessToken]:
+        """
+        Create an access token for a quote, pointing at its current rendering
+
+        Returns:
+            (opaque token for the customer's link, stored row)
+        """
+        token = secrets.token_urlsafe(32)
+        row = CustomerAccessToken(
+            token_hash=hash_token(token),
+            lead_id=lead_id,
+            quote_id=quote_id,
+            customer_email=customer_email,
+            render_hash=render_hash,
+            expires_at=datetime.utcnow() + timedelta(days=settings.CUSTOMER_ACCESS_TOKEN_EXPIRE_DAYS),
+        )
+        self.db.add(row)
+        self.db.commit()
+        logger.info(f"Issued customer access token {row.id} for lead {lead_id}, quote {quote_id}")
+        return token, row
+
+    def resolve(self, token: str) -> CustomerAccessToken:
+        """Get the row for a live token, or raise 401"""
+        row = self.db.query(CustomerAccessToken).filter(
+            CustomerAccessToken.token_hash == hash_token(token)
+        ).first()
+        _check_usable(row)
+        return row
+
+    def get_view(self, token: str) -> Tuple[str, tuple]:
+        """
+        Get the rendered quote for a live token
+
+        When the link was opened recently the bodies come from this
+        process's caches, but the token row is still re-read (revoked_at and
+        render_hash, one indexed lookup), so a link revoked or answered on
+        another worker stops serving the old quote at once. Otherwise one
+        indexed read of the token joined to its rendering.
+
+        Returns:
+            (content hash, (json body, html body))
+        """
+        token_hash = hash_token(token)
+        entry = _view_cache.get(token_hash)
+        if entry is not None:
+            quote_id, render_hash, expires_at, cached_at = entry
+            if _invalidated.get(quote_id, 0) < cached_at and expires_at > datetime.utcnow():
+                current = self.db.query(CustomerAccessToken.revoked_at, CustomerAccessToken.render_hash).filter(
+                    CustomerAccessToken.token_hash == token_hash
+                ).first()
+                if current is None or current.revoked_at is not None:
+                    _view_cache.pop(token_hash)
+                    raise HTTPException(status_code=401, detail="Invalid token")
+                if current.render_hash == render_hash:
+                    bodies = QuoteRenderService(self.db).get(render_hash)
+                    if bodies is not None:
+                        return render_hash, bodies
+
+        row = self.db.query(
+            CustomerAccessToken.quote_id,
+            CustomerAccessToken.render_hash,
+            CustomerAccessToken.expires_at,
+            CustomerAccessToken.revoked_at,
+            QuoteRender.json_body,
+            QuoteRender.html_body,
+        ).join(QuoteRender, QuoteRender.content_hash == CustomerAccessToken.render_hash).filter(
+            CustomerAccessToken.token_hash == token_hash
+        ).first()
+        _check_usable(row)
+
+        _view_cache.set(token_hash, (row.quote_id, row.render_hash, row.expires_at.replace(tzinfo=None),
+                                     time.monotonic()))
+        return row.render_hash, (bytes(row.json_body), row.html_body)
+
+    def mark_responded(self, quote_id: int, render_hash: str) -> None:
+        """
+        Close every token of an answered quote for further responses and
+        point them at the quote's new rendering. Does not commit; call
+        invalidate_quote once committed.
+        """
+        self.db.query(CustomerAccessToken).filter(
+            CustomerAccessToken.quote_id == quote_id
+        ).update({
+            CustomerAccessToken.responded_at: datetime.utcnow(),
+            CustomerAccessToken.render_hash: render_hash,
+        }, synchronize_session=False)
+
+    def revoke_for_quote(self, quote_id: int) -> int:
+        """Revoke every live token of a quote"""
+        revoked = self.db.query(CustomerAccessToken).filter(
+            CustomerAccessToken.quote_id == quote_id,
+            CustomerAccessToken.revoked_at.is_(None)
+        ).update({CustomerAccessToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+        invalidate_quote(quote_id)
+        logger.info(f"Revoked {revoked} customer access tokens for quote {quote_id}")
+        return revoked
+
+    def purge_expired(self) -> int:
+        """Delete expired customer access tokens and renderings left unused"""
+        deleted = self.db.query(CustomerAccessToken).filter(
+            CustomerAccessToken.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        QuoteRenderService(self.db).purge_unreferenced()
+        return deleted
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.change_log import ChangeEntity
+from app.models.customer import Customer, normalize_email
+from app.models.lead import Lead
+# Imported as a module: app.models imports both hook modules, so either may
+# be the one still initializing when the other is loaded
+from app.services import change_tracking
+
+
+def link_leads_to_customer(db: Session, customer: Customer) -> int:
+    """
+    Attach a verified customer's earlier leads to their account, matching on
+    the normalized customer email (uses ix_leads_customer_email_lower).
+    Does not commit.
+
+    Returns:
+        Number of leads linked
+    """
+    rows = db.execute(
+        update(Lead)
+        .where(func.lower(Lead.customer_email) == normalize_email(customer.email), Lead.customer_id.is_(None))
+        .values(customer_id=customer.id, version=Lead.version + 1, updated_at=datetime.utcnow())
+        .returning(Lead.id, Lead.assigned_partner_id, Lead.version)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    by_partner: Dict[int, List[int]] = {}
+    for lead_id, partner_id, _ in rows:
+        if partner_id is not None:
+            by_partner.setdefault(partner_id, []).append(lead_id)
+    for partner_id, ids in by_partner.items():
+        change_tracking.record_changes(db, partner_id, ChangeEntity.LEAD, ids)
+    change_tracking.record_entity_changes(db, ChangeEntity.LEAD, [
+        (lead_id, version, {"customer_id": customer.id}) for lead_id, _, version in rows
+    ])
+    return len(rows)
+
+
+@event.listens_for(Lead, "before_insert")
+def _link_new_lead(mapper, connection, target: Lead) -> None:
+    # Covers every place a lead is created (web form, admin, sample data)
+    if target.customer_id is not None or not target.customer_email:
+        return
+    target.customer_id = connection.execute(
+        select(Customer.id).where(
+            Customer.email == normalize_email(target.customer_email),
+            Customer.is_verified.is_(True)
+        )
+    ).scalar()
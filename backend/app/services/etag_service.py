@@ -0,0 +1,66 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.lead import Lead
+from app.models.quote import Quote, QuoteItem
+from app.utils.http_cache import make_etag
+
+
+class ETagService:
+    """
+    Computes ETags for entity reads from validator columns only (ids,
+    versions, updated_at), with one small aggregate query, so conditional
+    GETs can be answered before the full payload is loaded.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def lead_details(self, lead_id: int) -> Optional[Tuple[str, Optional[int]]]:
+        """
+        Get the ETag of a lead with its quotes
+
+        Returns:
+            (etag, assigned_partner_id), or None if the lead does not exist
+        """
+        row = self.db.query(
+            Lead.assigned_partner_id,
+            Lead.version,
+            Lead.updated_at,
+            func.count(Quote.id),
+            func.coalesce(func.sum(Quote.version), 0),
+            func.max(Quote.updated_at),
+        ).outerjoin(Quote, Quote.lead_id == Lead.id).filter(
+            Lead.id == lead_id
+        ).group_by(Lead.id).first()
+        if row is None:
+            return None
+        return make_etag("lead", lead_id, *row[1:]), row[0]
+
+    def quote_details(self, quote_id: int) -> Optional[Tuple[str, Optional[int]]]:
+        """
+        Get the ETag of a quote with its items and customer (lead) info
+
+        Items are added, changed in place and removed, so their count,
+        highest id and latest updated_at are part of the validator.
+
+        Returns:
+            (etag, assigned_partner_id of the lead), or None if the quote does not exist
+        """
+        row = self.db.query(
+            Lead.assigned_partner_id,
+            Quote.version,
+            Quote.updated_at,
+            Lead.version,
+            Lead.updated_at,
+            func.count(QuoteItem.id),
+            func.max(QuoteItem.id),
+            func.max(QuoteItem.updated_at),
+        ).join(Lead, Quote.lead_id == Lead.id).outerjoin(
+            QuoteItem, QuoteItem.quote_id == Quote.id
+        ).filter(Quote.id == quote_id).group_by(Quote.id, Lead.id).first()
+        if row is None:
+            return None
+        return make_etag("quote", quote_id, *row[1:]), row[0]
@@ -1,6 +1,131 @@
+import csv
+import math
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.models.lead import Lead
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+BUNDLED_POSTCODE_REGIONS = DATA_DIR / "postcode_regions.csv"
+BUNDLED_POSTCODE_CENTROIDS = DATA_DIR / "postcode_centroids.csv"
+
+EARTH_RADIUS_KM = 6371.0
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def postcode_prefix(postcode: str) -> Optional[int]:
+    """First three digits of a Swedish postcode ("123 45", "12345", "SE-123 45")"""
+    digits = _NON_DIGITS.sub("", postcode or "")
+    return int(digits[:3]) if len(digits) >= 3 else None
+
+
+def _read_data_file(path: Path) -> List[Dict[str, str]]:
+    """Rows of a bundled CSV data file, skipping # comment lines"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(line for line in f if not line.startswith("#")))
+
+
+class PostcodeIndex:
+    """
+    Sorted-array index of non-overlapping postcode prefix ranges to values
+    (regions, centroids). A lookup is one binary search over the range starts.
+    """
+
+    def __init__(self, ranges: Iterable[Tuple[int, int, Any]]):
+        ranges = sorted(ranges, key=lambda r: r[0])
+        for (_, prev_end, _), (start, _, _) in zip(ranges, ranges[1:]):
+            if start <= prev_end:
+                raise ValueError(f"Postcode range starting at {start} overlaps the previous range")
+        self._starts: List[int] = [start for start, _, _ in ranges]
+        self._ends: List[int] = [end for _, end, _ in ranges]
+        self._values: List[Any] = [value for _, _, value in ranges]
+
+    @classmethod
+    def from_csv(cls, path: Path, value: Callable[[Dict[str, str]], Any] = lambda row: row["region"].strip()
+                 ) -> "PostcodeIndex":
+        return cls((int(row["prefix_from"]), int(row["prefix_to"]), value(row)) for row in _read_data_file(path))
+
+    @property
+    def values(self) -> List[Any]:
+        return list(self._values)
+
+    def lookup(self, postcode: str) -> Optional[Any]:
+        prefix = postcode_prefix(postcode)
+        if prefix is None:
+            return None
+        i = bisect_right(self._starts, prefix) - 1
+        if i >= 0 and prefix <= self._ends[i]:
+            return self._values[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+
+@lru_cache(maxsize=1)
+def load_postcode_index() -> PostcodeIndex:
+    """Postcode -> region index from POSTCODE_REGIONS_FILE, or the bundled data file"""
+    return PostcodeIndex.from_csv(Path(settings.POSTCODE_REGIONS_FILE or BUNDLED_POSTCODE_REGIONS))
+
+
+@lru_cache(maxsize=1)
+def load_centroid_index() -> PostcodeIndex:
+    """Postcode -> (latitude, longitude) index from the bundled centroid table"""
+    return PostcodeIndex.from_csv(
+        BUNDLED_POSTCODE_CENTROIDS, value=lambda row: (float(row["latitude"]), float(row["longitude"]))
+    )
+
+
+@lru_cache(maxsize=1)
+def _city_centroids() -> Dict[str, Tuple[float, float]]:
+    return {
+        row["city"].strip().lower(): (float(row["latitude"]), float(row["longitude"]))
+        for row in _read_data_file(BUNDLED_POSTCODE_CENTROIDS)
+    }
+
+
+def geocode(postal_code: Optional[str], city: Optional[str] = None) -> Optional[Tuple[float, float]]:
+    """
+    Approximate coordinates of an address from the bundled centroid table,
+    by postcode area or else by city name
+
+    Returns:
+        (latitude, longitude), or None if neither is known
+    """
+    point = load_centroid_index().lookup(postal_code) if postal_code else None
+    if point is None and city:
+        point = _city_centroids().get(city.strip().lower())
+    return point
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+@event.listens_for(Lead, "before_insert")
+def _geocode_new_lead(mapper, connection, target: Lead) -> None:
+    # Every lead gets coordinates for nearest-partner matching
+    if target.latitude is None or target.longitude is None:
+        point = geocode(target.postal_code, target.city)
+        if point is not None:
+            target.latitude, target.longitude = point
+
+
 class GeoService:
-    def __init__(self, postcode_region_map: dict):
-        self.postcode_region_map = postcode_region_map
+    def __init__(self, postcode_index: Optional[PostcodeIndex] = None):
+        self.postcode_index = postcode_index or load_postcode_index()
 
     def get_region_by_postcode(self, postcode: str) -> str:
-        return self.postcode_region_map.get(postcode[:3], "Unknown")
\ No newline at end of file
+        return self.postcode_index.lookup(postcode) or "Unknown"
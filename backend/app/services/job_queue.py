@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.background_job import BackgroundJob, BackgroundJobStatus
+from app.utils.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Longest error text kept on a job
+MAX_ERROR_LENGTH = 2000
+
+
+class JobContext:
+    """What a job handler gets: a session, its parameters and a progress hook"""
+
+    def __init__(self, db: Session, job: BackgroundJob, session_factory: sessionmaker):
+        self.db = db
+        self.job_id = job.id
+        self.params: Dict[str, Any] = json.loads(job.params) if job.params else {}
+        self._session_factory = session_factory
+
+    def report(self, progress: int, message: Optional[str] = None) -> None:
+        """
+        Record progress (0-100) and refresh the heartbeat. Written in its own
+        session so the handler's transaction is left alone.
+        """
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == self.job_id)
+                .values(progress=max(0, min(100, progress)), progress_message=message,
+                        heartbeat_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class JobFile:
+    """Handler result stored as a downloadable file instead of JSON"""
+
+    def __init__(self, content: bytes, content_type: str = "application/octet-stream"):
+        self.content = content
+        self.content_type = content_type
+
+
+JobHandler = Callable[[JobContext], Any]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register the function that runs jobs of a kind"""
+    def register(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(db: Session, kind: str, params: Optional[Dict[str, Any]] = None,
+            submitted_by: Optional[int] = None, max_attempts: Optional[int] = None,
+            commit: bool = True) -> BackgroundJob:
+    """
+    Queue a job; a worker picks it up on its next poll. With commit=False
+    the job is only flushed and is written with the caller's transaction,
+    as an outbox entry: it runs only if the rest of that transaction
+    commits.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    job = BackgroundJob(
+        kind=kind,
+        params=dumps(params).decode() if params else None,
+        submitted_by=submitted_by,
+        max_attempts=max_attempts or settings.JOB_QUEUE_MAX_ATTEMPTS,
+        run_after=datetime.utcnow()
+    )
+    db.add(job)
+    if commit:
+        db.commit()
+        db.refresh(job)
+    else:
+        db.flush()
+    return job
+
+
+def job_accepted(job: BackgroundJob) -> Dict[str, Any]:
+    """Body of a 202 Accepted response for a submitted job"""
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "status_url": f"/api/v1/background-jobs/{job.id}",
+    }
+
+
+class JobQueueWorker:
+    """
+    Polls background_jobs and runs claimed jobs on a few threads.
+
+    Claiming is SELECT ... FOR UPDATE SKIP LOCKED on the oldest due QUEUED
+    row followed by a guarded UPDATE to RUNNING, so concurrent workers (in
+    any number of processes) never take the same job; on SQLite, which has
+    no row locks, the guarded UPDATE alone decides. Each claim writes its own
+    token to locked_by, and every later write is guarded by it, so a job
+    re-queued and claimed again (even by another thread of this process) is
+    left to its new owner. A running job's heartbeat is refreshed in the
+    background; jobs whose heartbeat goes stale (the worker died) are
+    re-queued, or failed once they are out of attempts.
+    """
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, worker_id: Optional[str] = None,
+                 concurrency: Optional[int] = None):
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency or settings.JOB_QUEUE_CONCURRENCY
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, name=f"job-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue worker {self.worker_id} started with {self.concurrency} threads")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+                self.requeue_stale()
+            except Exception as e:
+                logger.error(f"Job queue poll failed: {e}")
+            self._stop.wait(settings.JOB_QUEUE_POLL_SECONDS)
+
+    def run_next(self) -> Optional[BackgroundJob]:
+        """Claim and run one due job; None if there was nothing to do"""
+        db = self.session_factory()
+        try:
+            job = self._claim(db)
+            if job is not None:
+                self._run(db, job)
+            return job
+        finally:
+            db.close()
+
+    def _claim(self, db: Session) -> Optional[BackgroundJob]:
+        now = datetime.utcnow()
+        lock = f"{self.worker_id}:{secrets.token_hex(4)}"
+        job_id = db.execute(
+            select(BackgroundJob.id)
+            .where(BackgroundJob.status == BackgroundJobStatus.QUEUED, BackgroundJob.run_after <= now)
+            .order_by(BackgroundJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            db.commit()
+            return None
+        claimed = db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == BackgroundJobStatus.QUEUED)
+            .values(status=BackgroundJobStatus.RUNNING, locked_by=lock, started_at=now,
+                    heartbeat_at=now, attempts=BackgroundJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.commit()
+        return db.get(BackgroundJob, job_id) if claimed else None
+
+    def _run(self, db: Session, job: BackgroundJob) -> None:
+        handler = _handlers.get(job.kind)
+        lock = job.locked_by
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job.id, lock, done), daemon=True)
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind {job.kind!r}")
+            result = handler(JobContext(db, job, self.session_factory))
+        except Exception as e:
+            db.rollback()
+            logger.exception(f"Background job {job.id} ({job.kind}) failed on attempt {job.attempts}")
+            self._fail(db, job, lock, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            done.set()
+
+        values: Dict[str, Any] = {
+            "status": BackgroundJobStatus.SUCCEEDED,
+            "progress": 100,
+            "finished_at": datetime.utcnow(),
+            "error": None,
+        }
+        if isinstance(result, JobFile):
+            values.update(result_file=result.content, result_content_type=result.content_type)
+        elif result is not None:
+            values["result"] = dumps(result).decode()
+        # A job re-queued as stale and claimed again belongs to that claim now
+        db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.locked_by == lock)
+            .values(**values)
+        )
+        db.commit()
+        logger.info(f"Background job {job.id} ({job.kind}) succeeded")
+
+    def _heartbeat(self, job_id: int, lock: str, done: threading.Event) -> None:
+        """Keep a running job's heartbeat fresh so it is not taken for stale"""
+        interval = settings.JOB_QUEUE_STALE_SECONDS / 3
+        while not done.wait(interval):
+            db = self.session_factory()
+            try:
+                db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job_id, BackgroundJob.locked_by == lock)
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Heartbeat for background job {job_id} failed: {e}")
+            finally:
+                db.close()
+
+    def _fail(self, db: Session, job: BackgroundJob, lock: str, error: str) -> None:
+        now = datetime.utcnow()
+        attempts = job.attempts
+        values: Dict[str, Any] = {"error": error[:MAX_ERROR_LENGTH], "locked_by": None}
+        if attempts < job.max_attempts:
+            backoff = settings.JOB_QUEUE_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+            values.update(status=BackgroundJobStatus.QUEUED, run_after=now + timedelta(seconds=backoff))
+        else:
+            values.update(status=BackgroundJobStatus.FAILED, finished_at=now)
+        db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.locked_by == lock)
+            .values(**values)
+        )
+        db.commit()
+
+    def requeue_stale(self) -> int:
+        """
+        Put RUNNING jobs whose worker stopped sending heartbeats back in the
+        queue, or fail them if that was their last attempt
+
+        Returns:
+            Number of jobs re-queued
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            cutoff = now - timedelta(seconds=settings.JOB_QUEUE_STALE_SECONDS)
+            stale = (BackgroundJob.status == BackgroundJobStatus.RUNNING, BackgroundJob.heartbeat_at < cutoff)
+            requeued = db.execute(
+                update(BackgroundJob)
+                .where(*stale, BackgroundJob.attempts < BackgroundJob.max_attempts)
+                .values(status=BackgroundJobStatus.QUEUED, locked_by=None, run_after=now,
+                        error="Worker stopped responding")
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            failed = db.execute(
+                update(BackgroundJob)
+                .where(*stale)
+                .values(status=BackgroundJobStatus.FAILED, locked_by=None, finished_at=now,
+                        error="Worker stopped responding on the last attempt")
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if requeued:
+                logger.warning(f"Re-queued {requeued} stale background jobs")
+            if failed:
+                logger.warning(f"Failed {failed} stale background jobs that were out of attempts")
+            return requeued
+        finally:
+            db.close()
+
+
+def purge_finished_jobs(db: Session) -> int:
+    """Delete finished jobs older than JOB_QUEUE_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.JOB_QUEUE_RETENTION_DAYS)
+    deleted = db.query(BackgroundJob).filter(
+        BackgroundJob.status.in_((BackgroundJobStatus.SUCCEEDED, BackgroundJobStatus.FAILED)),
+        BackgroundJob.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+worker = JobQueueWorker()
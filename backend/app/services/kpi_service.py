@@ -3,10 +3,20 @@ from app.models.kpi import KPIEvent, KPIMetric
 from app.database import SessionLocal
 import json
 from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
 
 class KPIService:
-    def __init__(self):
-        self.db = SessionLocal()
+    def __init__(self, db: Optional[Session] = None):
+        # Given a session, writes join the caller's transaction and the caller commits
+        self._owns_session = db is None
+        self.db = SessionLocal() if db is None else db
+
+    def _commit(self):
+        if self._owns_session:
+            self.db.commit()
+        else:
+            self.db.flush()
 
     def log_event(self, event_type: str, lead_id=None, user_id=None, quote_id=None, data: dict = None):
         event = KPIEvent(
@@ -17,7 +27,7 @@ class KPIService:
             data=json.dumps(data) if data else None,
         )
         self.db.add(event)
-        self.db.commit()
+        self._commit()
 
     def record_metric(self, metric_name: str, metric_value: float, user_id=None, region=None, 
                       time_period: str = None, period_start: datetime = None, period_end: datetime = None):
@@ -31,7 +41,7 @@ class KPIService:
             period_end=period_end
         )
         self.db.add(metric)
-        self.db.commit()
+        self._commit()
 
     def get_recent_metrics(self, metric_name: str, days: int = 7):
         cutoff = datetime.utcnow() - timedelta(days=days)
@@ -0,0 +1,159 @@
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.lead import Lead, LeadStatus
+from app.services.geo_service import PostcodeIndex, load_postcode_index
+from app.services.lead_state_machine import SYSTEM, transition
+from app.services.partner_locator import get_partner_locator, record_partner_assignment
+from app.services.partner_ranking_service import PartnerScore, compute_partner_scores
+from app.utils.kpi import log_event
+
+logger = logging.getLogger(__name__)
+
+
+class AssignmentEngine:
+    """
+    In-memory index for automatic lead assignment.
+
+    A lead's postcode is mapped to a region by binary search (PostcodeIndex),
+    then the region's best partner is taken from a heap ordered by score
+    minus a penalty per open lead. Picking a partner and charging it the new
+    lead is one heapreplace, so an assignment is O(log n) in both postcode
+    ranges and partners.
+
+    Scores and open-lead counts are snapshots from compute_partner_scores;
+    get_assignment_engine rebuilds the engine every
+    ASSIGNMENT_INDEX_TTL_SECONDS. Assignments made by this engine update its
+    counts immediately; manual assignments are seen at the next rebuild.
+    """
+
+    def __init__(self, postcode_index: PostcodeIndex, partners: Iterable[PartnerScore],
+                 load_penalty: Optional[float] = None):
+        self.postcode_index = postcode_index
+        self.load_penalty = settings.ASSIGNMENT_LOAD_PENALTY if load_penalty is None else load_penalty
+        self._heaps: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+        for partner in partners:
+            if partner.region:
+                priority = -partner.score + self.load_penalty * partner.open_leads
+                self._heaps[partner.region].append((priority, partner.partner_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def region_for(self, postal_code: Optional[str], fallback_region: Optional[str] = None) -> Optional[str]:
+        return self.postcode_index.lookup(postal_code) or fallback_region
+
+    def top_partners(self, region: str, limit: int = 3) -> List[int]:
+        """Best partner ids for a region, without assigning anything"""
+        with self._lock:
+            return [partner_id for _, partner_id in heapq.nsmallest(limit, self._heaps.get(region, []))]
+
+    def choose(self, postal_code: Optional[str], fallback_region: Optional[str] = None) -> Optional[int]:
+        """
+        Pick the partner for a new lead and count the lead against them
+
+        Args:
+            postal_code: Lead postcode, mapped to a region via the postcode index
+            fallback_region: Region to use when the postcode is not covered
+
+        Returns:
+            Partner id, or None if no active partner serves the region
+        """
+        region = self.region_for(postal_code, fallback_region)
+        with self._lock:
+            heap = self._heaps.get(region)
+            if not heap:
+                return None
+            priority, partner_id = heap[0]
+            heapq.heapreplace(heap, (priority + self.load_penalty, partner_id))
+        return partner_id
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self._heaps.values())
+
+
+_engine: Optional[AssignmentEngine] = None
+_engine_built_at = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_assignment_engine(db: Session) -> AssignmentEngine:
+    """This process's assignment engine, rebuilt when older than the TTL"""
+    global _engine, _engine_built_at
+    with _engine_lock:
+        if _engine is None or time.monotonic() - _engine_built_at > settings.ASSIGNMENT_INDEX_TTL_SECONDS:
+            _engine = AssignmentEngine(load_postcode_index(), compute_partner_scores(db))
+            _engine_built_at = time.monotonic()
+            logger.info(f"Built lead assignment index with {len(_engine)} partners")
+        return _engine
+
+
+def invalidate_assignment_engine() -> None:
+    """Force a rebuild on next use, e.g. after partners are added or removed"""
+    global _engine
+    with _engine_lock:
+        _engine = None
+
+
+def _assign(db: Session, lead: Lead, partner_id: int, data: str) -> None:
+    lead.assigned_partner_id = partner_id
+    transition(lead, LeadStatus.ASSIGNED, SYSTEM)
+    db.add(lead)
+    db.commit()
+    db.refresh(lead)
+    record_partner_assignment(partner_id)
+
+    log_event(
+        db=db,
+        event_type="lead_assigned",
+        lead_id=lead.id,
+        user_id=partner_id,
+        data=data
+    )
+
+
+def auto_assign_lead(db: Session, lead: Lead) -> Optional[int]:
+    """
+    Assign a new lead to the best partner for its postcode
+
+    Returns:
+        Assigned partner id, or None if no partner serves the lead's area
+    """
+    partner_id = get_assignment_engine(db).choose(lead.postal_code, lead.region)
+    if partner_id is None:
+        logger.info(f"No partner available for lead {lead.id} ({lead.postal_code}, {lead.region})")
+        return None
+
+    _assign(db, lead, partner_id, f"Lead automatically assigned to partner {partner_id}")
+    return partner_id
+
+
+def assign_nearest_partner(db: Session, lead: Lead, radius_km: Optional[float] = None) -> Optional[int]:
+    """
+    Assign a lead to the closest partner with capacity whose service area
+    covers it
+
+    Returns:
+        Assigned partner id, or None if the lead has no coordinates or no
+        partner is in range
+    """
+    if lead.latitude is None or lead.longitude is None:
+        logger.info(f"Lead {lead.id} has no coordinates for nearest-partner matching")
+        return None
+    nearest = get_partner_locator(db).nearest(lead.latitude, lead.longitude, limit=1, radius_km=radius_km)
+    if not nearest:
+        logger.info(f"No partner in range of lead {lead.id} ({lead.postal_code}, {lead.city})")
+        return None
+
+    partner = nearest[0]
+    _assign(db, lead, partner.partner_id,
+            f"Lead assigned to nearest partner {partner.partner_id} ({partner.distance_km} km)")
+    return partner.partner_id
@@ -0,0 +1,231 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session, object_session
+
+from app.config import settings
+from app.models.change_log import ChangeEntity, ChangeOperation
+from app.models.lead import Lead, LeadStatus
+from app.services.change_tracking import record_changes, record_entity_changes
+from app.services.partner_locator import record_partner_assignment
+
+# Roles the rules are written for; UserRole values plus the two actors
+# without a user account
+ADMIN = "admin"
+PARTNER = "partner"
+CUSTOMER = "customer"  # through the customer portal
+SYSTEM = "system"      # scheduled jobs
+
+# Status codes are positions in LeadStatus; bit n of a mask is status n
+STATUSES: Tuple[LeadStatus, ...] = tuple(LeadStatus)
+_CODE: Dict[LeadStatus, int] = {status: code for code, status in enumerate(STATUSES)}
+_ALL = (1 << len(STATUSES)) - 1
+
+# (from, to, roles besides admin allowed to make the move); admins may make any move
+_RULES = (
+    (LeadStatus.NEW, LeadStatus.ASSIGNED, (SYSTEM,)),
+    (LeadStatus.NEW, LeadStatus.EXPIRED, (SYSTEM,)),
+    (LeadStatus.ASSIGNED, LeadStatus.ACCEPTED, (PARTNER,)),
+    (LeadStatus.ASSIGNED, LeadStatus.REJECTED, (PARTNER,)),
+    (LeadStatus.ASSIGNED, LeadStatus.NEW, (PARTNER,)),  # recall
+    (LeadStatus.ASSIGNED, LeadStatus.EXPIRED, (SYSTEM,)),
+    (LeadStatus.ACCEPTED, LeadStatus.QUOTED, (PARTNER,)),
+    (LeadStatus.ACCEPTED, LeadStatus.NEW, (PARTNER,)),  # recall
+    (LeadStatus.QUOTED, LeadStatus.QUOTED, (PARTNER,)),  # a revised quote
+    (LeadStatus.QUOTED, LeadStatus.APPROVED, (CUSTOMER,)),
+    (LeadStatus.QUOTED, LeadStatus.DECLINED, (CUSTOMER,)),
+    (LeadStatus.QUOTED, LeadStatus.COMPLETED, (PARTNER,)),
+    (LeadStatus.APPROVED, LeadStatus.COMPLETED, (PARTNER,)),
+)
+
+# Set when a lead enters the status
+STATUS_TIMESTAMPS: Dict[LeadStatus, str] = {
+    LeadStatus.ASSIGNED: "assigned_at",
+    LeadStatus.ACCEPTED: "accepted_at",
+    LeadStatus.QUOTED: "quoted_at",
+    LeadStatus.APPROVED: "customer_response_at",
+    LeadStatus.DECLINED: "customer_response_at",
+}
+
+# Entering these statuses takes a lead back from its partner (a recall):
+# ASSIGNMENT_FIELDS are cleared and the partner's open-lead count in the
+# partner locator is released once the transaction commits
+UNASSIGNING_STATUSES = frozenset({LeadStatus.NEW})
+ASSIGNMENT_FIELDS = ("assigned_partner_id", "assigned_at", "accepted_at", "expiry_warned_at")
+
+# Session.info key: partner id -> leads released in the open transaction
+_RELEASED = "released_partner_leads"
+
+
+def _compile() -> Dict[str, Tuple[int, ...]]:
+    masks: Dict[str, List[int]] = {role: [0] * len(STATUSES) for role in (PARTNER, CUSTOMER, SYSTEM)}
+    for source, target, roles in _RULES:
+        for role in roles:
+            masks[role][_CODE[source]] |= 1 << _CODE[target]
+    masks[ADMIN] = [_ALL] * len(STATUSES)
+    return {role: tuple(row) for role, row in masks.items()}
+
+
+# role -> allowed target mask per source status code
+TRANSITIONS: Dict[str, Tuple[int, ...]] = _compile()
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def _release(db: Optional[Session], partner_id: int, count: int) -> None:
+    if db is None:
+        record_partner_assignment(partner_id, -count)
+        return
+    released = db.info.setdefault(_RELEASED, {})
+    released[partner_id] = released.get(partner_id, 0) + count
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_releases(session: Session) -> None:
+    for partner_id, count in session.info.pop(_RELEASED, {}).items():
+        record_partner_assignment(partner_id, -count)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_releases(session: Session) -> None:
+    session.info.pop(_RELEASED, None)
+
+
+def _role(role: Any) -> str:
+    return str(getattr(role, "value", role)).lower()
+
+
+def parse_status(status: Any) -> LeadStatus:
+    """A LeadStatus from an enum member of any LeadStatus type or its value, in any case"""
+    value = str(getattr(status, "value", status)).lower()
+    try:
+        return LeadStatus(value)
+    except ValueError:
+        raise InvalidTransition(f"Unknown lead status {value!r}")
+
+
+def can_transition(current: Any, new: Any, role: Any) -> bool:
+    masks = TRANSITIONS.get(_role(role))
+    if masks is None:
+        return False
+    return bool(masks[_CODE[parse_status(current)]] >> _CODE[parse_status(new)] & 1)
+
+
+def allowed_targets(current: Any, role: Any) -> List[LeadStatus]:
+    """Statuses a role may move a lead to from its current status"""
+    mask = TRANSITIONS.get(_role(role), (0,) * len(STATUSES))[_CODE[parse_status(current)]]
+    return [status for code, status in enumerate(STATUSES) if mask >> code & 1]
+
+
+def allowed_sources(new: Any, role: Any) -> List[LeadStatus]:
+    """Statuses from which a role may move a lead to new"""
+    bit = 1 << _CODE[parse_status(new)]
+    masks = TRANSITIONS.get(_role(role), ())
+    return [STATUSES[code] for code, mask in enumerate(masks) if mask & bit]
+
+
+def transition(lead: Lead, new_status: Any, role: Any, now: Optional[datetime] = None) -> bool:
+    """
+    Move a lead to a new status and set the timestamp of that status; a
+    move to an UNASSIGNING_STATUSES status also unassigns the lead.
+    Joins the caller's transaction.
+
+    Raises:
+        InvalidTransition: The role may not make this move
+
+    Returns:
+        Whether the status changed
+    """
+    current, target = parse_status(lead.status), parse_status(new_status)
+    if not can_transition(current, target, role):
+        raise InvalidTransition(f"Invalid transition from {current.value} to {target.value}")
+    if current == target:
+        return False
+    lead.status = target
+    field = STATUS_TIMESTAMPS.get(target)
+    if field:
+        setattr(lead, field, now or datetime.utcnow())
+    if target in UNASSIGNING_STATUSES and lead.assigned_partner_id is not None:
+        _release(object_session(lead), lead.assigned_partner_id, 1)
+        for field in ASSIGNMENT_FIELDS:
+            setattr(lead, field, None)
+    return True
+
+
+def bulk_transition(db: Session, lead_ids: Iterable[int], new_status: Any, role: Any,
+                    partner_id: Optional[int] = None, now: Optional[datetime] = None) -> List[int]:
+    """
+    Move many leads to a new status with one guarded UPDATE per
+    LEAD_TRANSITION_CHUNK_SIZE leads: only leads whose current status may
+    move to new_status are changed, so validation happens in the WHERE
+    clause. A move to an UNASSIGNING_STATUSES status also unassigns the
+    leads. Joins the caller's transaction.
+
+    Args:
+        db: Database session
+        lead_ids: Leads to move
+        new_status: Target status
+        role: Role making the move
+        partner_id: Only move leads assigned to this partner
+
+    Returns:
+        IDs of the leads that were moved; the others were not allowed to
+
+    Raises:
+        InvalidTransition: new_status is ASSIGNED, which needs a partner per
+            lead; use batch assignment instead
+    """
+    target = parse_status(new_status)
+    if target == LeadStatus.ASSIGNED:
+        raise InvalidTransition("Leads are assigned with a partner, not by a bulk status change")
+    # Leads already in the target status have nothing to change
+    sources = [status for status in allowed_sources(target, role) if status != target]
+    lead_ids = list(dict.fromkeys(lead_ids))
+    if not sources or not lead_ids:
+        return []
+
+    now = now or datetime.utcnow()
+    values = {"status": target}
+    field = STATUS_TIMESTAMPS.get(target)
+    if field:
+        values[field] = now
+    unassigns = target in UNASSIGNING_STATUSES
+    if unassigns:
+        values.update(dict.fromkeys(ASSIGNMENT_FIELDS))
+    moved: List[int] = []
+    chunk_size = settings.LEAD_TRANSITION_CHUNK_SIZE
+    for start in range(0, len(lead_ids), chunk_size):
+        conditions = [Lead.id.in_(lead_ids[start:start + chunk_size]), Lead.status.in_(sources)]
+        if partner_id is not None:
+            conditions.append(Lead.assigned_partner_id == partner_id)
+        previous: Dict[int, Optional[int]] = {}
+        if unassigns:
+            # RETURNING gives the cleared partner, so lock the leads and read their partners first
+            previous = dict(db.execute(
+                select(Lead.id, Lead.assigned_partner_id).where(*conditions).with_for_update()
+            ).all())
+        rows = db.execute(
+            update(Lead).where(*conditions)
+            .values(**values, version=Lead.version + 1, updated_at=now)
+            .returning(Lead.id, Lead.assigned_partner_id, Lead.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        by_partner: Dict[int, List[int]] = {}
+        for lead_id, assigned_partner_id, _ in rows:
+            owner = previous.get(lead_id) if unassigns else assigned_partner_id
+            if owner is not None:
+                by_partner.setdefault(owner, []).append(lead_id)
+        for owner, ids in by_partner.items():
+            if unassigns:
+                # The leads disappear for the partner they were taken from
+                record_changes(db, owner, ChangeEntity.LEAD, ids, ChangeOperation.DELETE)
+                _release(db, owner, len(ids))
+            else:
+                record_changes(db, owner, ChangeEntity.LEAD, ids)
+        record_entity_changes(db, ChangeEntity.LEAD, [(lead_id, version, values) for lead_id, _, version in rows])
+        moved.extend(lead_id for lead_id, _, _ in rows)
+    return moved
@@ -1,10 +1,12 @@
 # app/services/offert_creator.py
+from sqlalchemy.orm import Session
+
 from app.models.quote import Quote
-from app.database import SessionLocal
+from app.services.pricing_engine import money
 
 class OffertCreator:
-    def __init__(self):
-        self.db = SessionLocal()
+    def __init__(self, db: Session):
+        self.db = db
 
     def generate_offert_text(self, quote_id: int) -> str:
         quote = self.db.query(Quote).filter(Quote.id == quote_id).first()
@@ -13,9 +15,10 @@ class OffertCreator:
 
         lines = []
         for item in quote.items:
-            line = f"{item.quantity}x {item.tree_species} - {item.operation_type} à {item.unit_price} SEK"
+            # An item's cost is its line amount
+            unit_price = money(item.cost / item.quantity)
+            line = f"{item.quantity}x {item.tree_species.value} - {item.operation_type.value} à {unit_price} SEK"
             lines.append(line)
 
-        total = sum(item.quantity * item.unit_price for item in quote.items)
-        text = f"Offert för arbete:\n" + "\n".join(lines) + f"\n\nTotal: {total} SEK"
+        text = f"Offert för arbete:\n" + "\n".join(lines) + f"\n\nTotal: {quote.total_amount} SEK"
         return text
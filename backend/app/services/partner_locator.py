@@ -0,0 +1,219 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.user import User, UserRole
+from app.services.geo_service import geocode, haversine_km
+from app.services.partner_ranking_service import open_lead_counts
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE_LAT = 111.2
+
+
+class NearbyPartner(BaseModel):
+    partner_id: int
+    distance_km: float
+    open_leads: int = 0
+    max_open_leads: Optional[int] = None
+
+
+class PartnerLocation(BaseModel):
+    partner_id: int
+    latitude: float
+    longitude: float
+    service_radius_km: float
+    max_open_leads: Optional[int] = None
+    open_leads: int = 0
+
+    def has_capacity(self) -> bool:
+        return self.max_open_leads is None or self.open_leads < self.max_open_leads
+
+
+class PartnerLocator:
+    """
+    Geohash-style grid of partner service bases for nearest-partner matching.
+
+    Bases are bucketed into cells of PARTNER_GRID_CELL_DEGREES by latitude
+    and longitude. A query only measures partners in the cells overlapping
+    the search circle, so its cost depends on local partner density rather
+    than on the total number of partners. Partners are added, moved and
+    removed one at a time (upsert_partner / remove_partner), so the grid
+    never needs a full rebuild when a partner changes.
+    """
+
+    def __init__(self, partners: Iterable[PartnerLocation] = (), cell_degrees: Optional[float] = None):
+        self.cell_degrees = cell_degrees or settings.PARTNER_GRID_CELL_DEGREES
+        self._partners: Dict[int, PartnerLocation] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._lock = threading.Lock()
+        for partner in partners:
+            self.upsert_partner(partner)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def upsert_partner(self, partner: PartnerLocation) -> None:
+        """Add a partner or move it to its new base, keeping its open-lead count"""
+        with self._lock:
+            old = self._partners.get(partner.partner_id)
+            if old is not None:
+                self._discard(old)
+                partner.open_leads = old.open_leads
+            self._partners[partner.partner_id] = partner
+            self._cells[self._cell(partner.latitude, partner.longitude)].add(partner.partner_id)
+
+    def remove_partner(self, partner_id: int) -> None:
+        with self._lock:
+            old = self._partners.pop(partner_id, None)
+            if old is not None:
+                self._discard(old)
+
+    def _discard(self, partner: PartnerLocation) -> None:
+        cell = self._cell(partner.latitude, partner.longitude)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(partner.partner_id)
+            if not members:
+                del self._cells[cell]
+
+    def record_assignment(self, partner_id: int, count: int = 1) -> None:
+        """Count leads assigned to (or, with a negative count, taken from) a partner"""
+        with self._lock:
+            partner = self._partners.get(partner_id)
+            if partner is not None:
+                partner.open_leads = max(0, partner.open_leads + count)
+
+    def nearest(self, latitude: float, longitude: float, limit: Optional[int] = None,
+                radius_km: Optional[float] = None) -> List[NearbyPartner]:
+        """
+        Nearest partners with spare capacity that serve a location
+
+        Args:
+            latitude, longitude: Location of the job
+            limit: Maximum number of partners, defaults to NEAREST_PARTNER_LIMIT
+            radius_km: Search radius, defaults to NEAREST_PARTNER_RADIUS_KM.
+                A partner must also be within its own service radius.
+
+        Returns:
+            Partners ordered by distance, closest first
+        """
+        limit = limit or settings.NEAREST_PARTNER_LIMIT
+        radius_km = radius_km or settings.NEAREST_PARTNER_RADIUS_KM
+
+        # Cells overlapping the circle's bounding box; a degree of longitude
+        # is shortest at the box edge furthest from the equator
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        edge_lat = min(89.0, abs(latitude) + dlat)
+        dlon = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(edge_lat)))
+        lat_lo, lon_lo = self._cell(latitude - dlat, longitude - dlon)
+        lat_hi, lon_hi = self._cell(latitude + dlat, longitude + dlon)
+
+        candidates = []
+        with self._lock:
+            for lat_cell in range(lat_lo, lat_hi + 1):
+                for lon_cell in range(lon_lo, lon_hi + 1):
+                    for partner_id in self._cells.get((lat_cell, lon_cell), ()):
+                        partner = self._partners[partner_id]
+                        # Cheap bounding-box and capacity checks before the haversine
+                        if abs(partner.latitude - latitude) > dlat or abs(partner.longitude - longitude) > dlon:
+                            continue
+                        if partner.max_open_leads is not None and partner.open_leads >= partner.max_open_leads:
+                            continue
+                        distance = haversine_km(latitude, longitude, partner.latitude, partner.longitude)
+                        if distance <= radius_km and distance <= partner.service_radius_km:
+                            candidates.append((distance, partner_id))
+
+            return [
+                NearbyPartner(
+                    partner_id=partner_id,
+                    distance_km=round(distance, 2),
+                    open_leads=self._partners[partner_id].open_leads,
+                    max_open_leads=self._partners[partner_id].max_open_leads
+                )
+                for distance, partner_id in heapq.nsmallest(limit, candidates)
+            ]
+
+    def __len__(self) -> int:
+        return len(self._partners)
+
+
+def partner_location(partner: User, open_leads: int = 0) -> Optional[PartnerLocation]:
+    """
+    Locator entry for a partner, based at its coordinates or else at the
+    centroid of its region; None if neither is known
+    """
+    if partner.base_latitude is not None and partner.base_longitude is not None:
+        point = (partner.base_latitude, partner.base_longitude)
+    else:
+        point = geocode(None, partner.region)
+    if point is None:
+        return None
+    return PartnerLocation(
+        partner_id=partner.id,
+        latitude=point[0],
+        longitude=point[1],
+        service_radius_km=partner.service_radius_km or settings.DEFAULT_SERVICE_RADIUS_KM,
+        max_open_leads=partner.max_open_leads,
+        open_leads=open_leads
+    )
+
+
+def load_partner_locations(db: Session) -> List[PartnerLocation]:
+    partners = db.query(User).filter(User.role == UserRole.PARTNER, User.is_active.is_(True)).all()
+    counts = open_lead_counts(db, [p.id for p in partners]) if partners else {}
+    locations = (partner_location(p, counts.get(p.id, 0)) for p in partners)
+    return [location for location in locations if location is not None]
+
+
+_locator: Optional[PartnerLocator] = None
+_locator_built_at = 0.0
+_locator_lock = threading.Lock()
+
+
+def get_partner_locator(db: Session) -> PartnerLocator:
+    """
+    This process's partner locator, rebuilt when older than
+    ASSIGNMENT_INDEX_TTL_SECONDS to pick up lead status changes and
+    assignments made by other workers
+    """
+    global _locator, _locator_built_at
+    with _locator_lock:
+        if _locator is None or time.monotonic() - _locator_built_at > settings.ASSIGNMENT_INDEX_TTL_SECONDS:
+            _locator = PartnerLocator(load_partner_locations(db))
+            _locator_built_at = time.monotonic()
+            logger.info(f"Built partner locator with {len(_locator)} partners")
+        return _locator
+
+
+def update_partner_location(partner: User) -> None:
+    """Apply a created, edited or deactivated partner to the locator, if built"""
+    locator = _locator
+    if locator is None:
+        return
+    location = partner_location(partner) if partner.is_active else None
+    if location is None:
+        locator.remove_partner(partner.id)
+    else:
+        locator.upsert_partner(location)
+
+
+def remove_partner_location(partner_id: int) -> None:
+    locator = _locator
+    if locator is not None:
+        locator.remove_partner(partner_id)
+
+
+def record_partner_assignment(partner_id: int, count: int = 1) -> None:
+    """Count a lead against a partner's capacity, if the locator is built"""
+    locator = _locator
+    if locator is not None:
+        locator.record_assignment(partner_id, count)
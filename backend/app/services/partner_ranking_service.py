@@ -1,11 +1,103 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.models.user import User
+
+from app.config import settings
+from app.models.lead import Lead, LeadStatus
+from app.models.user import User, UserRole
+
+# Leads a partner is still working on; they count against the partner's load
+OPEN_LEAD_STATUSES = (LeadStatus.ASSIGNED, LeadStatus.ACCEPTED)
+
+# Acceptance rate is smoothed towards PRIOR_ACCEPTED / PRIOR_ASSIGNED, so a
+# new partner starts near the middle instead of at 0 or 100%
+PRIOR_ASSIGNED = 4
+PRIOR_ACCEPTED = 2
+
+# Response times are capped here before being turned into a penalty
+MAX_RESPONSE_HOURS = 48.0
+RESPONSE_TIME_WEIGHT = 0.25
+
+
+class PartnerScore(BaseModel):
+    partner_id: int
+    region: Optional[str]
+    assigned: int = 0
+    accepted: int = 0
+    avg_response_hours: Optional[float] = None
+    open_leads: int = 0
+    score: float = 0.0
+
+
+def score_partner(assigned: int, accepted: int, avg_response_hours: Optional[float]) -> float:
+    """Smoothed acceptance rate minus a penalty for slow responses, roughly 0..1"""
+    rate = (accepted + PRIOR_ACCEPTED) / (assigned + PRIOR_ASSIGNED)
+    if avg_response_hours is None:
+        return rate
+    return rate - RESPONSE_TIME_WEIGHT * min(avg_response_hours, MAX_RESPONSE_HOURS) / MAX_RESPONSE_HOURS
+
+
+def open_lead_counts(db: Session, partner_ids: List[int]) -> Dict[int, int]:
+    """Leads each partner is still working on; partners without any are omitted"""
+    rows = db.query(Lead.assigned_partner_id, func.count(Lead.id)).filter(
+        Lead.assigned_partner_id.in_(partner_ids), Lead.status.in_(OPEN_LEAD_STATUSES)
+    ).group_by(Lead.assigned_partner_id)
+    return dict(rows.all())
+
+
+def compute_partner_scores(db: Session, region: Optional[str] = None,
+                           window_days: Optional[int] = None) -> List[PartnerScore]:
+    """
+    Roll up each active partner's recent assignments into a score
+
+    Args:
+        db: Database session
+        region: Only partners of this region
+        window_days: Assignments considered, defaults to ASSIGNMENT_SCORE_WINDOW_DAYS
+
+    Returns:
+        One PartnerScore per active partner
+    """
+    partner_query = db.query(User.id, User.region).filter(
+        User.role == UserRole.PARTNER, User.is_active.is_(True)
+    )
+    if region is not None:
+        partner_query = partner_query.filter(User.region == region)
+    scores = {row.id: PartnerScore(partner_id=row.id, region=row.region) for row in partner_query}
+    if not scores:
+        return []
+
+    cutoff = datetime.utcnow() - timedelta(days=window_days or settings.ASSIGNMENT_SCORE_WINDOW_DAYS)
+    response_hours = defaultdict(list)
+    history = db.query(Lead.assigned_partner_id, Lead.assigned_at, Lead.accepted_at).filter(
+        Lead.assigned_partner_id.in_(list(scores)), Lead.assigned_at >= cutoff
+    )
+    for partner_id, assigned_at, accepted_at in history:
+        score = scores[partner_id]
+        score.assigned += 1
+        if accepted_at is not None:
+            score.accepted += 1
+            response_hours[partner_id].append((accepted_at - assigned_at).total_seconds() / 3600)
+
+    for partner_id, count in open_lead_counts(db, list(scores)).items():
+        scores[partner_id].open_leads = count
+
+    for partner_id, score in scores.items():
+        hours = response_hours.get(partner_id)
+        score.avg_response_hours = sum(hours) / len(hours) if hours else None
+        score.score = score_partner(score.assigned, score.accepted, score.avg_response_hours)
+    return list(scores.values())
+
 
 class PartnerRankingService:
     def __init__(self, db: Session):
         self.db = db
 
-    def get_top_partners(self, region: str, limit: int = 3):
-        partners = self.db.query(User).filter(User.region == region, User.role == "Partner").all()
-        ranked_partners = sorted(partners, key=lambda p: (p.kpi_accept_rate, -p.kpi_response_time), reverse=True)
-        return ranked_partners[:limit]
\ No newline at end of file
+    def get_top_partners(self, region: str, limit: int = 3) -> List[PartnerScore]:
+        partners = compute_partner_scores(self.db, region=region)
+        return heapq.nlargest(limit, partners, key=lambda p: p.score)
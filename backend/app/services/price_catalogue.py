@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Date, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.change_log import ChangeEntity
+from app.models.price_catalogue import CataloguePrice, QuoteItemStats
+from app.models.quote import OperationType, Quote, QuoteItem, TreeSpecies
+from app.services.change_feed import ChangeFeed
+from app.services.pricing_engine import (
+    NO_PRICE, OPERATIONS, SPECIES, from_ore, money, operation_codes, ore_array, price_items, species_codes, to_ore,
+)
+
+logger = logging.getLogger(__name__)
+
+STATS_CHANGE_CONSUMER = "quote_item_stats"
+
+# (partner_id, region); None is the wildcard
+Scope = Tuple[Optional[int], Optional[str]]
+
+
+def _region_key(region: Optional[str]) -> Optional[str]:
+    return region.strip().lower() if region else None
+
+
+def _empty_matrix() -> np.ndarray:
+    return np.full((len(SPECIES), len(OPERATIONS)), NO_PRICE, dtype=np.int64)
+
+
+class PriceCatalogue:
+    """
+    Catalogue prices as dense species × operation matrices of öre, one per
+    scope: the defaults, each region, each partner and each partner within a
+    region. matrix() layers the scopes that apply to one partner and region
+    (partner and region, then partner, then region, then default) and caches
+    the result, so pricing a quote is a single array index.
+    """
+
+    def __init__(self, prices: Iterable[CataloguePrice] = ()):
+        self._scopes: Dict[Scope, np.ndarray] = {}
+        self._resolved: Dict[Scope, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._count = 0
+        for price in prices:
+            scope = (price.partner_id, _region_key(price.region))
+            matrix = self._scopes.setdefault(scope, _empty_matrix())
+            matrix[SPECIES.index(price.tree_species), OPERATIONS.index(price.operation_type)] = to_ore(price.unit_price)
+            self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def matrix(self, partner_id: Optional[int] = None, region: Optional[str] = None) -> np.ndarray:
+        """Unit prices in öre that apply to a partner's quotes in a region, NO_PRICE where unset"""
+        key = (partner_id, _region_key(region))
+        with self._lock:
+            resolved = self._resolved.get(key)
+            if resolved is None:
+                resolved = _empty_matrix()
+                # Most general first; each more specific scope overrides it
+                for scope in ((None, None), (None, key[1]), (partner_id, None), key):
+                    layer = self._scopes.get(scope)
+                    if layer is not None:
+                        resolved = np.where(layer != NO_PRICE, layer, resolved)
+                resolved.flags.writeable = False
+                self._resolved[key] = resolved
+            return resolved
+
+    def entries(self, partner_id: Optional[int] = None, region: Optional[str] = None) -> List[Dict[str, Any]]:
+        matrix = self.matrix(partner_id, region)
+        return [
+            {"tree_species": SPECIES[s], "operation_type": OPERATIONS[o], "unit_price": from_ore(matrix[s, o])}
+            for s, o in zip(*np.nonzero(matrix != NO_PRICE))
+        ]
+
+    def suggest(self, items: Sequence[Tuple[TreeSpecies, OperationType, int]], partner_id: Optional[int] = None,
+                region: Optional[str] = None, commission_rate: Any = Decimal("0.15")) -> Dict[str, Any]:
+        """
+        Price quote items from the catalogue
+
+        Args:
+            items: (species, operation, quantity) per item
+            partner_id: Partner making the quote
+            region: Region of the lead
+            commission_rate: Commission rate for the totals
+
+        Returns:
+            Unit price and amount per item (None without a catalogue price)
+            and the quote totals over the priced items
+        """
+        matrix = self.matrix(partner_id, region)
+        species = species_codes(TreeSpecies(s) for s, _, _ in items)
+        operations = operation_codes(OperationType(o) for _, o, _ in items)
+        quantities = np.fromiter((quantity for _, _, quantity in items), dtype=np.int64)
+        unit = matrix[species, operations]
+        priced = unit != NO_PRICE
+        lines = np.where(priced, unit * quantities, 0)
+        totals = price_items(np.zeros(len(items), dtype=np.int64), lines, commission_rate)
+        return {
+            "items": [
+                {
+                    "tree_species": SPECIES[species[i]],
+                    "operation_type": OPERATIONS[operations[i]],
+                    "quantity": int(quantities[i]),
+                    "unit_price": from_ore(unit[i]) if priced[i] else None,
+                    "amount": from_ore(lines[i]) if priced[i] else None,
+                }
+                for i in range(len(items))
+            ],
+            "unpriced_items": int((~priced).sum()),
+            **(totals.result(0) if len(totals) else {field: Decimal("0.00") for field in totals.FIELDS}),
+        }
+
+    def violations(self, items: Sequence[Tuple[TreeSpecies, OperationType, Any]], partner_id: Optional[int] = None,
+                   region: Optional[str] = None) -> List[str]:
+        """
+        Items whose unit price is further than PRICE_CATALOGUE_TOLERANCE_PERCENT
+        from the catalogue price; items without a catalogue price always pass
+        """
+        tolerance = settings.PRICE_CATALOGUE_TOLERANCE_PERCENT
+        if tolerance < 0 or not items:
+            return []
+        matrix = self.matrix(partner_id, region)
+        unit = matrix[species_codes(TreeSpecies(s) for s, _, _ in items),
+                      operation_codes(OperationType(o) for _, o, _ in items)]
+        costs = ore_array(cost for _, _, cost in items)
+        outside = (unit != NO_PRICE) & (np.abs(costs - unit) * 100 > unit * tolerance)
+        return [
+            f"{TreeSpecies(items[i][0]).value} / {OperationType(items[i][1]).value}: {from_ore(costs[i])} SEK is more "
+            f"than {tolerance}% from the catalogue price of {from_ore(unit[i])} SEK"
+            for i in np.flatnonzero(outside)
+        ]
+
+
+_catalogue: Optional[PriceCatalogue] = None
+_catalogue_built_at = 0.0
+_catalogue_lock = threading.Lock()
+
+
+def get_price_catalogue(db: Session) -> PriceCatalogue:
+    """
+    This process's price catalogue, reloaded when older than
+    PRICE_CATALOGUE_TTL_SECONDS to pick up prices changed by other workers
+    """
+    global _catalogue, _catalogue_built_at
+    with _catalogue_lock:
+        if _catalogue is None or time.monotonic() - _catalogue_built_at > settings.PRICE_CATALOGUE_TTL_SECONDS:
+            _catalogue = PriceCatalogue(db.query(CataloguePrice).all())
+            _catalogue_built_at = time.monotonic()
+            logger.info(f"Loaded price catalogue with {len(_catalogue)} prices")
+        return _catalogue
+
+
+def invalidate_price_catalogue() -> None:
+    global _catalogue
+    with _catalogue_lock:
+        _catalogue = None
+
+
+def set_catalogue_prices(db: Session, prices: Iterable[Tuple[TreeSpecies, OperationType, Optional[Decimal]]],
+                         partner_id: Optional[int] = None, region: Optional[str] = None) -> int:
+    """
+    Set the unit prices of one scope; a price of None removes the entry
+
+    Returns:
+        Number of entries written or removed
+    """
+    region = region.strip() if region else None
+    query = db.query(CataloguePrice).filter(
+        CataloguePrice.partner_id.is_(None) if partner_id is None else CataloguePrice.partner_id == partner_id,
+        CataloguePrice.region.is_(None) if region is None else func.lower(CataloguePrice.region) == region.lower()
+    )
+    existing = {(row.tree_species, row.operation_type): row for row in query}
+    changed = 0
+    for species, operation, unit_price in prices:
+        row = existing.get((TreeSpecies(species), OperationType(operation)))
+        if unit_price is None:
+            if row is not None:
+                db.delete(row)
+                changed += 1
+        elif row is not None:
+            row.unit_price = unit_price
+            changed += 1
+        else:
+            db.add(CataloguePrice(partner_id=partner_id, region=region, tree_species=species,
+                                  operation_type=operation, unit_price=unit_price))
+            changed += 1
+    db.commit()
+    invalidate_price_catalogue()
+    return changed
+
+
+def _rebuild_stats(db: Session, days: Optional[List[date]] = None) -> int:
+    day = func.date(Quote.created_at, type_=Date)
+    rollup = select(
+        day, QuoteItem.tree_species, QuoteItem.operation_type,
+        func.count(QuoteItem.id), func.sum(QuoteItem.quantity), func.sum(QuoteItem.cost)
+    ).join(Quote, QuoteItem.quote_id == Quote.id).group_by(day, QuoteItem.tree_species, QuoteItem.operation_type)
+    clear = delete(QuoteItemStats)
+    if days is not None:
+        rollup = rollup.where(day.in_(days))
+        clear = clear.where(QuoteItemStats.day.in_(days))
+    db.execute(clear)
+    return db.execute(insert(QuoteItemStats).from_select(
+        ["day", "tree_species", "operation_type", "items", "quantity", "total_cost"], rollup
+    )).rowcount
+
+
+def refresh_quote_item_stats(db: Session) -> int:
+    """
+    Rebuild the quote_item_stats days whose quotes or items changed since
+    the last refresh, via the change feed. The first refresh rebuilds
+    everything. Items deleted without a change to their quote leave no
+    trace of their day, which is why the quote routes record both.
+
+    Returns:
+        Number of stats rows written
+    """
+    feed = ChangeFeed(db, STATS_CHANGE_CONSUMER)
+    if feed.position == 0:
+        # Take the offset first, then roll up every item
+        head = feed.head()
+        written = _rebuild_stats(db)
+        db.commit()
+        feed.acknowledge(head)
+        return written
+
+    written = 0
+    for batch in feed.batches(entity_types=[ChangeEntity.QUOTE, ChangeEntity.QUOTE_ITEM]):
+        quote_ids = set()
+        item_ids = set()
+        for change in batch.changes:
+            if change["entity_type"] == ChangeEntity.QUOTE:
+                quote_ids.add(change["entity_id"])
+            elif change["diff"] and "quote_id" in change["diff"]:
+                quote_ids.add(change["diff"]["quote_id"])
+            else:
+                item_ids.add(change["entity_id"])
+        if item_ids:
+            quote_ids.update(
+                quote_id for (quote_id,) in db.query(QuoteItem.quote_id).filter(QuoteItem.id.in_(item_ids))
+            )
+        if quote_ids:
+            days = [
+                day for (day,) in db.query(func.date(Quote.created_at, type_=Date)).filter(
+                    Quote.id.in_(quote_ids)
+                ).distinct()
+            ]
+            if days:
+                written += _rebuild_stats(db, days)
+        db.commit()
+        feed.acknowledge(batch.position)
+    return written
+
+
+def quote_item_stats_matrix(db: Session, start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Items and total cost in öre per species × operation for quotes created
+    between two days, inclusive, from the daily rollup
+    """
+    rows = db.query(
+        QuoteItemStats.tree_species, QuoteItemStats.operation_type,
+        func.sum(QuoteItemStats.items), func.sum(QuoteItemStats.total_cost)
+    ).filter(QuoteItemStats.day >= start, QuoteItemStats.day <= end).group_by(
+        QuoteItemStats.tree_species, QuoteItemStats.operation_type
+    ).all()
+    counts = np.zeros((len(SPECIES), len(OPERATIONS)), dtype=np.int64)
+    totals = np.zeros((len(SPECIES), len(OPERATIONS)), dtype=np.int64)
+    if rows:
+        species, operations, items, costs = zip(*rows)
+        index = (species_codes(species), operation_codes(operations))
+        counts[index] = items
+        totals[index] = ore_array(money(cost) for cost in costs)
+    return counts, totals
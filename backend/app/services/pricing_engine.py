@@ -0,0 +1,397 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, bindparam, cast, func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.change_log import ChangeEntity
+from app.models.lead import Lead
+from app.models.quote import OperationType, Quote, QuoteItem, QuoteStatus, TreeSpecies
+from app.services.change_tracking import record_changes, record_entity_changes
+
+# Amounts are int64 öre and rates int64 multiples of 1/RATE_SCALE, so every
+# figure below is an exact integer numerator over a power of RATE_SCALE and
+# only the final half-even division rounds, as Decimal.quantize does
+ORE_PER_SEK = 100
+RATE_SCALE = 10_000
+# Largest |subtotal| whose numerators stay within int64 (100M SEK; the
+# Numeric(10, 2) money columns end just below it)
+MAX_SUBTOTAL_ORE = 10 ** 10
+NO_PRICE = -1
+
+SPECIES = list(TreeSpecies)
+OPERATIONS = list(OperationType)
+_SPECIES_INDEX = {species: i for i, species in enumerate(SPECIES)}
+_OPERATION_INDEX = {operation: i for i, operation in enumerate(OPERATIONS)}
+
+_quotes = Quote.__table__
+_quote_items = QuoteItem.__table__
+
+
+def _decimal(value: Any) -> Decimal:
+    # str() first so a float gives its shortest repr, 0.15 and not 0.1499999...
+    return Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+
+
+def money(value: Any) -> Decimal:
+    """Round a SEK amount (Decimal, float or int) half-even to whole öre"""
+    return _decimal(value or 0).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+
+
+def to_ore(value: Any) -> int:
+    """Exact öre amount of a SEK value; fractions of an öre are rejected"""
+    ore = _decimal(value).scaleb(2)
+    if ore != ore.to_integral_value():
+        raise ValueError(f"{value} SEK is not a whole number of öre")
+    return int(ore)
+
+
+def ore_array(values: Iterable[Any]) -> np.ndarray:
+    return np.fromiter((to_ore(value) for value in values), dtype=np.int64)
+
+
+def from_ore(ore: Any) -> Decimal:
+    return Decimal(int(ore)).scaleb(-2)
+
+
+def to_rate(rate: Any) -> int:
+    """A rate between 0 and 1 as a whole number of 1/RATE_SCALE"""
+    scaled = _decimal(rate) * RATE_SCALE
+    if scaled != scaled.to_integral_value() or not 0 <= scaled <= RATE_SCALE:
+        raise ValueError(f"Rate {rate} must be between 0 and 1 in steps of 1/{RATE_SCALE}")
+    return int(scaled)
+
+
+def _rates(rate: Any, count: int) -> np.ndarray:
+    if np.ndim(rate) == 0:
+        return np.int64(to_rate(rate))
+    rates = np.fromiter((to_rate(r) for r in rate), dtype=np.int64)
+    if len(rates) != count:
+        raise ValueError(f"Expected {count} rates, got {len(rates)}")
+    return rates
+
+
+def _round_half_even(numerator: np.ndarray, denominator: int) -> np.ndarray:
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice = remainder * 2
+    return quotient + ((twice > denominator) | ((twice == denominator) & (quotient % 2 == 1)))
+
+
+def _group_sum(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum values per key; keys must be sorted"""
+    if not len(keys):
+        return keys, values
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(values, starts)
+
+
+class PricedQuotes:
+    """
+    Prices of many quotes as öre arrays, row i belonging to quote_ids[i].
+    result(i) is what QuoteCalculator.calculate_quote returns for the same
+    items and rates, to the öre.
+    """
+
+    FIELDS = ("subtotal", "discount", "commission", "final_total")
+
+    def __init__(self, quote_ids: np.ndarray, subtotal: np.ndarray, discount: np.ndarray,
+                 commission: np.ndarray, final_total: np.ndarray):
+        self.quote_ids = quote_ids
+        self.subtotal = subtotal
+        self.discount = discount
+        self.commission = commission
+        self.final_total = final_total
+
+    def __len__(self) -> int:
+        return len(self.quote_ids)
+
+    def result(self, index: int) -> Dict[str, Decimal]:
+        return {field: from_ore(getattr(self, field)[index]) for field in self.FIELDS}
+
+    def totals(self) -> Dict[str, Decimal]:
+        return {field: from_ore(getattr(self, field).sum()) for field in self.FIELDS}
+
+
+def _price(subtotals: np.ndarray, commission_rate: Any, discount_rate: Any,
+           apply_discount: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if len(subtotals) and np.abs(subtotals).max() > MAX_SUBTOTAL_ORE:
+        raise OverflowError(f"Quote subtotal above {from_ore(MAX_SUBTOTAL_ORE)} SEK")
+    commission = _rates(commission_rate, len(subtotals))
+    discount = _rates(discount_rate, len(subtotals)) if apply_discount else np.int64(0)
+    # subtotal * (1 - discount), still over RATE_SCALE
+    net = subtotals * (RATE_SCALE - discount)
+    return (
+        _round_half_even(subtotals * discount, RATE_SCALE),
+        _round_half_even(net * commission, RATE_SCALE ** 2),
+        _round_half_even(net * (RATE_SCALE + commission), RATE_SCALE ** 2),
+    )
+
+
+def price_subtotals(quote_ids: Sequence[int], subtotals: Sequence[int], commission_rate: Any,
+                    discount_rate: Any = 0, apply_discount: bool = False) -> PricedQuotes:
+    """
+    Price quotes from their subtotals
+
+    Args:
+        quote_ids: Quote IDs
+        subtotals: Subtotal of each quote in öre
+        commission_rate: Rate for every quote, or one rate per quote
+        discount_rate: Rate for every quote, or one rate per quote
+        apply_discount: Whether the discount is applied
+
+    Returns:
+        Discount, commission and final total of each quote in öre
+    """
+    subtotals = np.asarray(subtotals, dtype=np.int64)
+    discount, commission, final_total = _price(subtotals, commission_rate, discount_rate, apply_discount)
+    return PricedQuotes(np.asarray(quote_ids, dtype=np.int64), subtotals, discount, commission, final_total)
+
+
+def price_items(item_quote_ids: Sequence[int], amounts: Sequence[int], commission_rate: Any,
+                discount_rate: Any = 0, apply_discount: bool = False,
+                quantities: Optional[Sequence[int]] = None) -> PricedQuotes:
+    """
+    Price quotes from their items, all quotes in one pass
+
+    Args:
+        item_quote_ids: Quote ID of each item
+        amounts: Unit price of each item in öre, or the line amount when
+            quantities is None
+        commission_rate: Rate for every quote, or one rate per quote in
+            ascending quote ID order
+        discount_rate: As commission_rate
+        apply_discount: Whether the discount is applied
+        quantities: Quantity of each item
+
+    Returns:
+        Prices of the quotes, in ascending quote ID order
+    """
+    quote_ids = np.asarray(item_quote_ids, dtype=np.int64)
+    lines = np.asarray(amounts, dtype=np.int64)
+    if quantities is not None:
+        lines = lines * np.asarray(quantities, dtype=np.int64)
+    if len(quote_ids) and np.any(quote_ids[1:] < quote_ids[:-1]):
+        order = np.argsort(quote_ids, kind="stable")
+        quote_ids, lines = quote_ids[order], lines[order]
+    quote_ids, subtotals = _group_sum(quote_ids, lines)
+    return price_subtotals(quote_ids, subtotals, commission_rate, discount_rate, apply_discount)
+
+
+def commission_scenarios(subtotals: Sequence[int], commission_rates: Iterable[Any], discount_rate: Any = 0,
+                         apply_discount: bool = False) -> List[Dict[str, Decimal]]:
+    """
+    What-if totals of the same quotes under each commission rate; every
+    quote is rounded on its own, as it would be invoiced
+
+    Returns:
+        Commission and final total summed over the quotes, per rate
+    """
+    subtotals = np.asarray(subtotals, dtype=np.int64)
+    scenarios = []
+    for rate in commission_rates:
+        _, commission, final_total = _price(subtotals, rate, discount_rate, apply_discount)
+        scenarios.append({
+            "commission_rate": _decimal(rate),
+            "commission": from_ore(commission.sum()),
+            "final_total": from_ore(final_total.sum()),
+        })
+    return scenarios
+
+
+def price_matrix(unit_prices: Mapping[Tuple[TreeSpecies, OperationType], Any]) -> np.ndarray:
+    """Dense species × operation matrix of unit prices in öre, NO_PRICE where unset"""
+    matrix = np.full((len(SPECIES), len(OPERATIONS)), NO_PRICE, dtype=np.int64)
+    for (species, operation), price in unit_prices.items():
+        ore = to_ore(price)
+        if ore < 0:
+            raise ValueError(f"Negative unit price for {species} / {operation}")
+        matrix[_SPECIES_INDEX[TreeSpecies(species)], _OPERATION_INDEX[OperationType(operation)]] = ore
+    return matrix
+
+
+def species_codes(values: Iterable[TreeSpecies]) -> np.ndarray:
+    return np.fromiter((_SPECIES_INDEX[value] for value in values), dtype=np.int64)
+
+
+def operation_codes(values: Iterable[OperationType]) -> np.ndarray:
+    return np.fromiter((_OPERATION_INDEX[value] for value in values), dtype=np.int64)
+
+
+def apply_price_matrix(matrix: np.ndarray, species: np.ndarray, operations: np.ndarray,
+                       quantities: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    """Line amounts with unit price × quantity wherever the matrix has a price"""
+    unit = matrix[species, operations]
+    return np.where(unit != NO_PRICE, unit * quantities, lines)
+
+
+def _ore_column(column):
+    return cast(func.round(column * ORE_PER_SEK), BigInteger)
+
+
+def reprice_quotes(db: Session, commission_rate: Any, discount_rate: Any = 0, apply_discount: bool = False,
+                   unit_prices: Optional[Mapping[Tuple[TreeSpecies, OperationType], Any]] = None,
+                   statuses: Sequence[QuoteStatus] = (QuoteStatus.DRAFT,), partner_id: Optional[int] = None,
+                   quote_ids: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+    """
+    Recalculate the stored totals of many quotes, optionally after a
+    price-list change: items with a price in unit_prices get unit price ×
+    quantity as their cost. Quotes are locked and processed in chunks of
+    PRICING_CHUNK_SIZE, each committed on its own, and only quotes whose
+    totals change are written.
+
+    Args:
+        db: Database session
+        commission_rate: New commission rate
+        discount_rate: New discount rate
+        apply_discount: Whether the discount is applied
+        unit_prices: Unit price per (species, operation)
+        statuses: Only reprice quotes in these states
+        partner_id: Only reprice quotes on leads assigned to this partner
+        quote_ids: Only reprice these quotes
+
+    Returns:
+        Counts and commission before and after for the repriced quotes
+    """
+    matrix = price_matrix(unit_prices) if unit_prices else None
+    result = {"quotes": 0, "repriced_quotes": 0, "repriced_items": 0,
+              "commission_before": Decimal("0.00"), "commission_after": Decimal("0.00")}
+    after = 0
+    while True:
+        query = db.query(
+            Quote.id, Quote.version, _ore_column(Quote.total_amount), _ore_column(Quote.commission_amount),
+            Lead.assigned_partner_id
+        ).join(Lead, Quote.lead_id == Lead.id).filter(Quote.id > after, Quote.status.in_(list(statuses)))
+        if partner_id is not None:
+            query = query.filter(Lead.assigned_partner_id == partner_id)
+        if quote_ids is not None:
+            query = query.filter(Quote.id.in_(list(quote_ids)))
+        quotes = query.order_by(Quote.id).limit(settings.PRICING_CHUNK_SIZE).with_for_update(of=Quote).all()
+        if not quotes:
+            break
+        chunk = _reprice_chunk(db, quotes, after, matrix, commission_rate, discount_rate, apply_discount)
+        db.commit()
+        after = quotes[-1][0]
+        for key, value in chunk.items():
+            result[key] += value
+    return result
+
+
+def _reprice_chunk(db: Session, quotes: List[Any], after: int, matrix: Optional[np.ndarray],
+                   commission_rate: Any, discount_rate: Any, apply_discount: bool) -> Dict[str, Any]:
+    ids, versions, totals, commissions, partners = (np.array(column, dtype=object) for column in zip(*quotes))
+    ids = ids.astype(np.int64)
+    partner_of = dict(zip(ids.tolist(), partners.tolist()))
+
+    # Items of every quote in the id range, then only those of the chunk
+    items = db.query(
+        QuoteItem.id, QuoteItem.quote_id, _ore_column(QuoteItem.cost), QuoteItem.quantity,
+        QuoteItem.tree_species, QuoteItem.operation_type
+    ).filter(QuoteItem.quote_id > after, QuoteItem.quote_id <= int(ids[-1])).order_by(
+        QuoteItem.quote_id, QuoteItem.id
+    ).all()
+    item_ids, item_quotes, lines, quantities, species, operations = (
+        [list(column) for column in zip(*items)] if items else [[]] * 6
+    )
+    item_ids = np.array(item_ids, dtype=np.int64)
+    item_quotes = np.array(item_quotes, dtype=np.int64)
+    lines = np.array(lines, dtype=np.int64)
+    keep = np.isin(item_quotes, ids)
+
+    repriced_items = 0
+    if matrix is not None and keep.any():
+        new_lines = lines.copy()
+        new_lines[keep] = apply_price_matrix(
+            matrix, species_codes(s for s, k in zip(species, keep) if k),
+            operation_codes(o for o, k in zip(operations, keep) if k),
+            np.array(quantities, dtype=np.int64)[keep], lines[keep]
+        )
+        changed = np.flatnonzero(new_lines != lines)
+        if len(changed):
+            db.execute(
+                _quote_items.update().where(_quote_items.c.id == bindparam("item_id"))
+                .values(cost=bindparam("new_cost")),
+                [{"item_id": int(item_ids[i]), "new_cost": from_ore(new_lines[i])} for i in changed]
+            )
+            by_partner = defaultdict(list)
+            for i in changed:
+                by_partner[partner_of[int(item_quotes[i])]].append(int(item_ids[i]))
+            for partner, partner_items in by_partner.items():
+                record_changes(db, partner, ChangeEntity.QUOTE_ITEM, partner_items)
+            record_entity_changes(db, ChangeEntity.QUOTE_ITEM, [
+                (int(item_ids[i]), None, {"cost": from_ore(new_lines[i])}) for i in changed
+            ])
+            repriced_items = len(changed)
+        lines = new_lines
+
+    item_quotes, sums = _group_sum(item_quotes[keep], lines[keep])
+    subtotals = np.zeros(len(ids), dtype=np.int64)
+    subtotals[np.searchsorted(ids, item_quotes)] = sums
+    _, commission, final_total = _price(subtotals, commission_rate, discount_rate, apply_discount)
+
+    totals = totals.astype(np.int64)
+    commissions = commissions.astype(np.int64)
+    changed = np.flatnonzero((final_total != totals) | (commission != commissions))
+    if len(changed):
+        db.execute(
+            _quotes.update().where(_quotes.c.id == bindparam("quote_id")).values(
+                total_amount=bindparam("new_total"), commission_amount=bindparam("new_commission"),
+                version=_quotes.c.version + 1
+            ),
+            [
+                {"quote_id": int(ids[i]), "new_total": from_ore(final_total[i]),
+                 "new_commission": from_ore(commission[i])}
+                for i in changed
+            ]
+        )
+        by_partner = defaultdict(list)
+        for i in changed:
+            by_partner[partners[i]].append(int(ids[i]))
+        for partner, partner_quotes in by_partner.items():
+            record_changes(db, partner, ChangeEntity.QUOTE, partner_quotes)
+        record_entity_changes(db, ChangeEntity.QUOTE, [
+            (int(ids[i]), versions[i] + 1,
+             {"total_amount": from_ore(final_total[i]), "commission_amount": from_ore(commission[i])})
+            for i in changed
+        ])
+    return {
+        "quotes": len(ids),
+        "repriced_quotes": len(changed),
+        "repriced_items": repriced_items,
+        "commission_before": from_ore(commissions[changed].sum()),
+        "commission_after": from_ore(commission[changed].sum()),
+    }
+
+
+def commission_what_if(db: Session, commission_rates: Iterable[Any],
+                       statuses: Sequence[QuoteStatus] = (QuoteStatus.APPROVED,), partner_id: Optional[int] = None,
+                       start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    What the stored quotes would have earned in commission at other rates
+
+    Returns:
+        Number of quotes, their current commission and one scenario per rate
+    """
+    filters = [Quote.status.in_(list(statuses))]
+    if partner_id is not None:
+        filters.append(Lead.assigned_partner_id == partner_id)
+    if start_date is not None:
+        filters.append(Quote.created_at >= start_date)
+    if end_date is not None:
+        filters.append(Quote.created_at <= end_date)
+
+    rows = db.query(func.coalesce(func.sum(_ore_column(QuoteItem.cost)), 0)).select_from(Quote).outerjoin(
+        QuoteItem, QuoteItem.quote_id == Quote.id
+    ).join(Lead, Quote.lead_id == Lead.id).filter(*filters).group_by(Quote.id).all()
+    current = db.query(func.sum(Quote.commission_amount)).join(Lead, Quote.lead_id == Lead.id).filter(
+        *filters
+    ).scalar()
+    subtotals = np.array([subtotal for (subtotal,) in rows], dtype=np.int64)
+    return {
+        "quotes": len(subtotals),
+        "current_commission": money(current),
+        "scenarios": commission_scenarios(subtotals, commission_rates),
+    }
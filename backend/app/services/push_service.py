@@ -0,0 +1,348 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+import jwt
+import requests
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.mobile_device import MobileDevice, PushProvider
+
+logger = logging.getLogger(__name__)
+
+
+class PushMessage(BaseModel):
+    title: str
+    body: str
+    data: Dict[str, str] = {}
+
+
+class PushTransport(ABC):
+    """
+    Sends one push message to a batch of device tokens of a single provider.
+
+    Implementations return the tokens the provider reported as invalid or
+    unregistered, so the dispatcher can prune them.
+    """
+
+    provider: PushProvider
+    max_batch_size: int = 500
+
+    @abstractmethod
+    def send_multicast(self, tokens: List[str], message: PushMessage) -> List[str]:
+        ...
+
+
+class PerTokenPushTransport(PushTransport):
+    """
+    Transport for providers whose API takes one token per request (FCM
+    HTTP v1, APNs): a batch is sent as concurrent requests on a small
+    thread pool, PUSH_CONCURRENCY at a time.
+    """
+
+    def __init__(self, timeout: float = 10.0, batch_size: Optional[int] = None,
+                 concurrency: Optional[int] = None):
+        self.timeout = timeout
+        if batch_size:
+            self.max_batch_size = batch_size
+        self.concurrency = concurrency or settings.PUSH_CONCURRENCY
+
+    @abstractmethod
+    def send_one(self, token: str, message: PushMessage) -> bool:
+        """Send to one token; False if the provider says the token will never work again"""
+
+    def _send_or_log(self, token: str, message: PushMessage) -> bool:
+        try:
+            return self.send_one(token, message)
+        except Exception as e:
+            # A transient failure for one device must not drop the rest of the batch
+            logger.warning(f"Push to a {self.provider.value} device failed: {e}")
+            return True
+
+    def send_multicast(self, tokens: List[str], message: PushMessage) -> List[str]:
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tokens)) or 1) as pool:
+            valid = list(pool.map(lambda token: self._send_or_log(token, message), tokens))
+        return [token for token, ok in zip(tokens, valid) if not ok]
+
+
+class FCMTransport(PerTokenPushTransport):
+    """
+    Firebase Cloud Messaging over the HTTP v1 API
+    (projects/{project}/messages:send), authenticated with a service
+    account's OAuth access token
+    """
+
+    provider = PushProvider.FCM
+    SCOPES = ["https://www.googleapis.com/auth/firebase.messaging"]
+
+    # errorCode values meaning the token will never work again
+    INVALID_TOKEN_ERRORS = {"UNREGISTERED", "SENDER_ID_MISMATCH"}
+
+    def __init__(self, project_id: str, service_account_file: str, endpoint: str, **kwargs):
+        super().__init__(**kwargs)
+        # Only needed when FCM is configured
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import Request
+
+        self.url = f"{endpoint.rstrip('/')}/projects/{project_id}/messages:send"
+        self.credentials = service_account.Credentials.from_service_account_file(
+            service_account_file, scopes=self.SCOPES
+        )
+        self._auth_request = Request()
+        self._auth_lock = threading.Lock()
+        self.http = requests.Session()
+
+    def _access_token(self) -> str:
+        with self._auth_lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(self._auth_request)
+            return self.credentials.token
+
+    def send_one(self, token: str, message: PushMessage) -> bool:
+        response = self.http.post(
+            self.url,
+            json={
+                "message": {
+                    "token": token,
+                    "notification": {"title": message.title, "body": message.body},
+                    "data": message.data,
+                }
+            },
+            headers={"Authorization": f"Bearer {self._access_token()}"},
+            timeout=self.timeout,
+        )
+        if response.ok:
+            return True
+        details = response.json().get("error", {}).get("details", []) if response.content else []
+        if any(detail.get("errorCode") in self.INVALID_TOKEN_ERRORS for detail in details):
+            return False
+        response.raise_for_status()
+        return True
+
+
+class APNsTransport(PerTokenPushTransport):
+    """
+    Apple Push Notification service over HTTP/2 with token (.p8 key)
+    authentication
+    """
+
+    provider = PushProvider.APNS
+    PRODUCTION_ENDPOINT = "https://api.push.apple.com"
+    SANDBOX_ENDPOINT = "https://api.sandbox.push.apple.com"
+
+    # Reasons meaning the token will never work again
+    INVALID_TOKEN_REASONS = {"BadDeviceToken", "Unregistered", "DeviceTokenNotForTopic"}
+
+    # Apple rejects provider tokens older than an hour and throttles refreshes more often than every 20 minutes
+    TOKEN_LIFETIME_SECONDS = 50 * 60
+
+    def __init__(self, key_id: str, team_id: str, auth_key: str, topic: str, sandbox: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.key_id = key_id
+        self.team_id = team_id
+        self.auth_key = auth_key
+        self.topic = topic
+        self.http = httpx.Client(
+            base_url=self.SANDBOX_ENDPOINT if sandbox else self.PRODUCTION_ENDPOINT,
+            http2=True,
+            timeout=self.timeout,
+        )
+        self._token: Optional[str] = None
+        self._token_issued_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _provider_token(self) -> str:
+        with self._token_lock:
+            now = time.time()
+            if self._token is None or now - self._token_issued_at > self.TOKEN_LIFETIME_SECONDS:
+                self._token = jwt.encode({"iss": self.team_id, "iat": int(now)}, self.auth_key,
+                                         algorithm="ES256", headers={"kid": self.key_id})
+                self._token_issued_at = now
+            return self._token
+
+    def send_one(self, token: str, message: PushMessage) -> bool:
+        response = self.http.post(
+            f"/3/device/{token}",
+            json={"aps": {"alert": {"title": message.title, "body": message.body}}, **message.data},
+            headers={
+                "authorization": f"bearer {self._provider_token()}",
+                "apns-topic": self.topic,
+                "apns-push-type": "alert",
+            },
+        )
+        if response.status_code == 200:
+            return True
+        reason = response.json().get("reason") if response.content else None
+        if response.status_code == 410 or reason in self.INVALID_TOKEN_REASONS:
+            return False
+        response.raise_for_status()
+        return True
+
+
+class FakePushTransport(PushTransport):
+    """In-memory transport for tests and local development"""
+
+    def __init__(self, provider: PushProvider = PushProvider.FCM, max_batch_size: int = 500,
+                 invalid_tokens: Iterable[str] = ()):
+        self.provider = provider
+        self.max_batch_size = max_batch_size
+        self.invalid_tokens = set(invalid_tokens)
+        self.sent: List[Dict] = []
+
+    def send_multicast(self, tokens: List[str], message: PushMessage) -> List[str]:
+        self.sent.append({"tokens": list(tokens), "message": message})
+        return [token for token in tokens if token in self.invalid_tokens]
+
+
+def _read_key(value: str) -> str:
+    """A PEM key given inline or as the path of a key file"""
+    if value.lstrip().startswith("-----BEGIN"):
+        return value
+    with open(value) as key_file:
+        return key_file.read()
+
+
+def _default_transports() -> Dict[PushProvider, PushTransport]:
+    transports = {}
+    options = {"timeout": settings.PUSH_TIMEOUT_SECONDS, "batch_size": settings.PUSH_BATCH_SIZE}
+    if settings.FCM_PROJECT_ID and settings.FCM_SERVICE_ACCOUNT_FILE:
+        transports[PushProvider.FCM] = FCMTransport(
+            settings.FCM_PROJECT_ID,
+            settings.FCM_SERVICE_ACCOUNT_FILE,
+            settings.FCM_ENDPOINT,
+            **options,
+        )
+    if settings.APNS_KEY_ID and settings.APNS_TEAM_ID and settings.APNS_AUTH_KEY and settings.APNS_TOPIC:
+        transports[PushProvider.APNS] = APNsTransport(
+            settings.APNS_KEY_ID,
+            settings.APNS_TEAM_ID,
+            _read_key(settings.APNS_AUTH_KEY),
+            settings.APNS_TOPIC,
+            sandbox=settings.APNS_USE_SANDBOX,
+            **options,
+        )
+    return transports
+
+
+# Transports per provider; replaced with fakes in tests via set_push_transports
+_transports: Dict[PushProvider, PushTransport] = _default_transports()
+
+
+def set_push_transports(transports: Iterable[PushTransport]) -> None:
+    """Replace the registered transports, e.g. with FakePushTransport in tests"""
+    global _transports
+    _transports = {transport.provider: transport for transport in transports}
+
+
+class PushDispatcher:
+    """
+    Fans a push message out to all registered devices of a set of users.
+
+    Tokens are loaded with one query, grouped per provider and sent in
+    multicast batches, so one event costs one provider call per batch rather
+    than one per device. Tokens the provider rejects are cleared.
+    """
+
+    def __init__(self, db: Session, transports: Optional[Dict[PushProvider, PushTransport]] = None):
+        self.db = db
+        self.transports = _transports if transports is None else transports
+
+    def send_to_users(self, user_ids: Iterable[int], message: PushMessage) -> int:
+        """
+        Send a push message to every device of the given users
+
+        Args:
+            user_ids: Recipient user IDs
+            message: Message to send
+
+        Returns:
+            Number of tokens the message was sent to
+        """
+        user_ids = list(set(user_ids))
+        if not settings.PUSH_NOTIFICATIONS_ENABLED or not user_ids:
+            return 0
+
+        rows = self.db.query(MobileDevice.push_provider, MobileDevice.push_token).filter(
+            MobileDevice.user_id.in_(user_ids),
+            MobileDevice.push_token.isnot(None)
+        ).all()
+
+        tokens_by_provider: Dict[PushProvider, List[str]] = defaultdict(list)
+        for provider, token in rows:
+            tokens_by_provider[provider].append(token)
+
+        sent = 0
+        invalid: List[str] = []
+        for provider, tokens in tokens_by_provider.items():
+            transport = self.transports.get(provider)
+            if transport is None:
+                logger.warning(f"No push transport for {provider.value}, skipping {len(tokens)} devices")
+                continue
+
+            # A token may be registered on several rows (e.g. a shared tablet)
+            tokens = list(dict.fromkeys(tokens))
+            for start in range(0, len(tokens), transport.max_batch_size):
+                batch = tokens[start:start + transport.max_batch_size]
+                try:
+                    invalid.extend(transport.send_multicast(batch, message))
+                    sent += len(batch)
+                except Exception as e:
+                    logger.error(f"Push batch to {provider.value} failed: {e}")
+
+        if invalid:
+            self.prune_tokens(invalid)
+        return sent
+
+    def prune_tokens(self, tokens: List[str]) -> None:
+        """Clear push tokens the provider reported as invalid"""
+        self.db.query(MobileDevice).filter(MobileDevice.push_token.in_(tokens)).update(
+            {MobileDevice.push_token: None}, synchronize_session=False
+        )
+        self.db.commit()
+        logger.info(f"Pruned {len(tokens)} invalid push tokens")
+
+
+def lead_assigned_message(lead) -> PushMessage:
+    """Push message telling a partner a lead was assigned to them"""
+    return PushMessage(
+        title="New lead assigned",
+        body=f"{lead.customer_name}, {lead.city}",
+        data={"type": "lead_assigned", "lead_id": str(lead.id)},
+    )
+
+
+def leads_assigned_message(lead_ids: List[int]) -> PushMessage:
+    """Push message telling a partner a batch of leads was assigned to them"""
+    if len(lead_ids) == 1:
+        return PushMessage(
+            title="New lead assigned",
+            body="1 new lead is waiting for you",
+            data={"type": "lead_assigned", "lead_id": str(lead_ids[0])},
+        )
+    return PushMessage(
+        title="New leads assigned",
+        body=f"{len(lead_ids)} new leads are waiting for you",
+        data={"type": "leads_assigned", "lead_ids": ",".join(str(i) for i in lead_ids)},
+    )
+
+
+def send_push_to_users(user_ids: Iterable[int], message: PushMessage) -> None:
+    """
+    Send a push message in its own session, for use as a background task
+    after the request's session has been closed
+    """
+    db = SessionLocal()
+    try:
+        PushDispatcher(db).send_to_users(user_ids, message)
+    except Exception as e:
+        logger.error(f"Push dispatch failed: {e}")
+    finally:
+        db.close()
@@ -26,12 +26,3 @@ class QuoteCalculator:
             "commission": commission.quantize(Decimal('0.01')),
             "final_total": final_total.quantize(Decimal('0.01'))
         }
-
-    def version_quote(self, quote_versions: List[dict], new_quote_data: dict):
-        version_number = len(quote_versions) + 1
-        new_version = {
-            "version": version_number,
-            "data": new_quote_data
-        }
-        quote_versions.append(new_version)
-        return quote_versions
\ No newline at end of file
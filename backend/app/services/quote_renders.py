@@ -0,0 +1,150 @@
+import hashlib
+from html import escape
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.customer_access_token import CustomerAccessToken
+from app.models.quote import Quote
+from app.models.quote_render import QuoteRender
+from app.utils.cache import TTLCache
+from app.utils.responses import dumps
+
+# content hash -> (json body, html body). Renders never change once stored,
+# so entries only leave the cache by LRU eviction.
+_render_cache = TTLCache(maxsize=settings.QUOTE_RENDER_CACHE_SIZE, ttl=7 * 24 * 3600)
+
+_STATUS_TEXT = {
+    "sent": "Awaiting your response",
+    "approved": "Approved",
+    "declined": "Declined",
+}
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    return escape(str(getattr(value, "value", value)))
+
+
+def render_quote_html(snapshot: Dict[str, Any]) -> str:
+    """
+    Render a quote snapshot (see CustomerPortalService.build_quote_snapshot)
+    as the customer's quote page
+    """
+    customer = snapshot.get("customer") or {}
+    partner = snapshot.get("partner") or {}
+    status = _text(snapshot.get("status"))
+
+    rows = "".join(
+        f"""
+            <tr>
+                <td>{_text(item["quantity"])}</td>
+                <td>{_text(item["tree_species"])}</td>
+                <td>{_text(item["custom_operation"] or item["operation_type"])}</td>
+                <td>{_text(item["cost"])} SEK</td>
+            </tr>"""
+        for item in snapshot.get("items", [])
+    )
+
+    partner_html = ""
+    if partner:
+        partner_html = f"""
+        <h3>Your Arborist</h3>
+        <p>{_text(partner.get("name"))}<br>{_text(partner.get("email"))}</p>"""
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Quote {_text(snapshot.get("quote_id"))} - T24 Arborist Services</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; }}
+        table {{ border-collapse: collapse; width: 100%; }}
+        th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+        th {{ background-color: #f2f2f2; }}
+        .total {{ font-weight: bold; }}
+    </style>
+</head>
+<body>
+    <h2>Arborist Quote for {_text(customer.get("name"))}</h2>
+    <p>Status: {escape(_STATUS_TEXT.get(status, status))}</p>
+
+    <h3>Quote Details</h3>
+    <table>
+        <tr>
+            <th>Quantity</th>
+            <th>Tree Species</th>
+            <th>Operation</th>
+            <th>Cost (SEK)</th>
+        </tr>{rows}
+        <tr class="total">
+            <td colspan="3">Total</td>
+            <td>{_text(snapshot.get("total_amount"))} SEK</td>
+        </tr>
+    </table>
+
+    <h3>Property Information</h3>
+    <p>Address: {_text(customer.get("address"))}, {_text(customer.get("city"))}, {_text(customer.get("postal_code"))}</p>
+    {partner_html}
+    <p>Valid until: {_text(snapshot.get("expires_at"))}</p>
+</body>
+</html>
+"""
+
+
+class QuoteRenderService:
+    """Stores and serves pre-rendered customer quote pages"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def render(self, quote_id: int, snapshot: Dict[str, Any]) -> str:
+        """
+        Render a quote snapshot as JSON and HTML and store it, unless an
+        identical rendering already exists. Does not commit.
+
+        Returns:
+            Content hash of the rendering
+        """
+        json_body = dumps(snapshot)
+        content_hash = hashlib.sha256(json_body).hexdigest()
+        existing = self.db.query(QuoteRender.content_hash).filter(
+            QuoteRender.content_hash == content_hash
+        ).first()
+        html_body = render_quote_html(snapshot)
+        if existing is None:
+            self.db.add(QuoteRender(
+                content_hash=content_hash,
+                quote_id=quote_id,
+                json_body=json_body,
+                html_body=html_body,
+            ))
+            self.db.flush()
+        _render_cache.set(content_hash, (json_body, html_body))
+        return content_hash
+
+    def get(self, content_hash: str) -> Optional[tuple]:
+        """Get (json body, html body) of a rendering"""
+        bodies = _render_cache.get(content_hash)
+        if bodies is None:
+            row = self.db.query(QuoteRender.json_body, QuoteRender.html_body).filter(
+                QuoteRender.content_hash == content_hash
+            ).first()
+            if row is None:
+                return None
+            bodies = (bytes(row.json_body), row.html_body)
+            _render_cache.set(content_hash, bodies)
+        return bodies
+
+    def purge_unreferenced(self) -> int:
+        """Delete renderings neither a quote nor a customer access token points at"""
+        referenced = self.db.query(CustomerAccessToken.render_hash)
+        current = self.db.query(Quote.render_hash).filter(Quote.render_hash.isnot(None))
+        deleted = self.db.query(QuoteRender).filter(
+            QuoteRender.content_hash.notin_(referenced),
+            QuoteRender.content_hash.notin_(current)
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
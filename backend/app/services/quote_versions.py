@@ -0,0 +1,133 @@
+import json
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.quote import Quote
+from app.models.quote_version import QuoteVersion
+
+# A state is {"totals": {...}, "items": {"<item id>": {...}}} with money as
+# strings, so JSON round trips keep every öre. A delta has the changed
+# totals, the new or changed items (only their changed fields) and the ids
+# of the removed items.
+ITEM_FIELDS = ("quantity", "tree_species", "operation_type", "custom_operation", "cost")
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    return getattr(value, "value", value)  # enums
+
+
+def quote_state(quote: Quote, totals: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Versioned state of a quote
+
+    Args:
+        quote: Quote with its items flushed (they need ids)
+        totals: Totals and rates the quote was priced with
+    """
+    return {
+        "totals": {key: _json_value(value) for key, value in totals.items()},
+        "items": {
+            str(item.id): {field: _json_value(getattr(item, field)) for field in ITEM_FIELDS}
+            for item in quote.items
+        },
+    }
+
+
+def diff_states(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Delta that turns state old into state new"""
+    delta: Dict[str, Any] = {}
+    totals = {key: value for key, value in new["totals"].items() if old["totals"].get(key) != value}
+    if totals:
+        delta["totals"] = totals
+    items = {}
+    for item_id, item in new["items"].items():
+        previous = old["items"].get(item_id)
+        if previous is None:
+            items[item_id] = item
+        else:
+            changed = {field: value for field, value in item.items() if previous.get(field) != value}
+            if changed:
+                items[item_id] = changed
+    if items:
+        delta["items"] = items
+    removed = [item_id for item_id in old["items"] if item_id not in new["items"]]
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a delta to a state in place"""
+    state["totals"].update(delta.get("totals", {}))
+    for item_id, fields in delta.get("items", {}).items():
+        state["items"].setdefault(item_id, {}).update(fields)
+    for item_id in delta.get("removed", ()):
+        state["items"].pop(item_id, None)
+    return state
+
+
+def quote_version_state(db: Session, quote_id: int, revision: int) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild a revision from the nearest snapshot at or before it and the
+    deltas after that snapshot
+
+    Returns:
+        The state, or None if the quote has no such revision
+    """
+    snapshot = db.query(QuoteVersion).filter(
+        QuoteVersion.quote_id == quote_id,
+        QuoteVersion.is_snapshot.is_(True),
+        QuoteVersion.revision <= revision
+    ).order_by(QuoteVersion.revision.desc()).first()
+    if snapshot is None:
+        return None
+    deltas = db.query(QuoteVersion.revision, QuoteVersion.data).filter(
+        QuoteVersion.quote_id == quote_id,
+        QuoteVersion.revision > snapshot.revision,
+        QuoteVersion.revision <= revision
+    ).order_by(QuoteVersion.revision).all()
+    if snapshot.revision + len(deltas) != revision:
+        return None
+    state = json.loads(snapshot.data)
+    for _, data in deltas:
+        apply_delta(state, json.loads(data))
+    return state
+
+
+def record_quote_version(db: Session, quote: Quote, state: Dict[str, Any],
+                         user_id: Optional[int] = None) -> Optional[QuoteVersion]:
+    """
+    Add the next revision of a quote, as a snapshot every
+    QUOTE_VERSION_SNAPSHOT_INTERVAL revisions and as a delta against the
+    previous revision otherwise. Joins the caller's transaction.
+
+    Returns:
+        The new version, or None if nothing changed since the previous one
+    """
+    revision = (quote.revision or 0) + 1
+    interval = max(1, settings.QUOTE_VERSION_SNAPSHOT_INTERVAL)
+    previous = quote_version_state(db, quote.id, revision - 1) if revision > 1 else None
+    if previous is None:
+        # First revision, or history written before versioning: start with a snapshot
+        is_snapshot, data = True, state
+    else:
+        data = diff_states(previous, state)
+        if not data:
+            return None
+        is_snapshot = (revision - 1) % interval == 0
+        if is_snapshot:
+            data = state
+    version = QuoteVersion(quote_id=quote.id, revision=revision, is_snapshot=is_snapshot,
+                           data=json.dumps(data), created_by=user_id)
+    db.add(version)
+    quote.revision = revision
+    return version
+
+
+def list_quote_versions(db: Session, quote_id: int) -> List[QuoteVersion]:
+    return db.query(QuoteVersion).filter(QuoteVersion.quote_id == quote_id).order_by(QuoteVersion.revision).all()
@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.refresh_token import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class RevocationSet:
+    """
+    In-memory index of revoked refresh-token families and of used or revoked
+    refresh-token hashes that have not yet expired.
+
+    Loaded from the database at startup and updated by this process as it
+    rotates and revokes tokens, so a replayed token or an access token from a
+    logged-out session is rejected with a set lookup. Revocations made by
+    other workers are picked up by sync() at most every
+    REVOCATION_SYNC_SECONDS; until then their access tokens still pass here.
+    Refresh always decides on the database row.
+    """
+
+    # Overlap between syncs, for revocations committed just after the previous one read
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self._families: Set[str] = set()
+        self._tokens: Dict[str, str] = {}  # token hash -> family id
+        self._lock = threading.Lock()
+        self._synced_at: Optional[datetime] = None
+        self._next_sync = 0.0
+
+    def load(self, db: Session) -> None:
+        now = datetime.utcnow()
+        rows = db.query(RefreshToken.token_hash, RefreshToken.family_id, RefreshToken.revoked_at).filter(
+            RefreshToken.expires_at > now,
+            or_(RefreshToken.used_at.isnot(None), RefreshToken.revoked_at.isnot(None))
+        ).all()
+        with self._lock:
+            self._tokens = {row.token_hash: row.family_id for row in rows}
+            self._families = {row.family_id for row in rows if row.revoked_at is not None}
+            self._synced_at = now
+            self._next_sync = time.monotonic() + settings.REVOCATION_SYNC_SECONDS
+        logger.info(f"Loaded {len(self._tokens)} spent refresh tokens and {len(self._families)} revoked sessions")
+
+    def sync(self, db: Session) -> None:
+        """Add sessions revoked by other workers since the last sync, if it is due"""
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            # Claim this sync so concurrent requests do not all query
+            self._next_sync = time.monotonic() + settings.REVOCATION_SYNC_SECONDS
+            since = self._synced_at
+        now = datetime.utcnow()
+        query = db.query(RefreshToken.family_id).filter(RefreshToken.revoked_at.isnot(None))
+        if since is not None:
+            query = query.filter(RefreshToken.revoked_at >= since - self.SYNC_OVERLAP)
+        else:
+            query = query.filter(RefreshToken.expires_at > now)
+        families = {family_id for (family_id,) in query.distinct()}
+        with self._lock:
+            self._families.update(families)
+            self._synced_at = now
+
+    def add_token(self, token_hash: str, family_id: str) -> None:
+        with self._lock:
+            self._tokens[token_hash] = family_id
+
+    def revoke_family(self, family_id: str) -> None:
+        with self._lock:
+            self._families.add(family_id)
+
+    def token_family(self, token_hash: str) -> Optional[str]:
+        """Family of a spent token, or None if the token was never spent"""
+        return self._tokens.get(token_hash)
+
+    def is_family_revoked(self, family_id: Optional[str]) -> bool:
+        return family_id is not None and family_id in self._families
+
+
+revocations = RevocationSet()
+
+
+class RefreshTokenService:
+    """Issues, rotates and revokes mobile refresh tokens"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def issue(self, user_id: int, device_id: str, family_id: Optional[str] = None) -> Tuple[str, RefreshToken]:
+        """
+        Create a refresh token for a device, starting a new session family
+        unless one is given
+
+        Returns:
+            (opaque token to hand to the client, stored row)
+        """
+        token = secrets.token_urlsafe(32)
+        row = RefreshToken(
+            token_hash=hash_token(token),
+            family_id=family_id or str(uuid.uuid4()),
+            user_id=user_id,
+            device_id=device_id,
+            expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+        self.db.add(row)
+        return token, row
+
+    def rotate(self, token: str, device_id: str) -> Tuple[str, RefreshToken]:
+        """
+        Exchange a refresh token for a new one in the same family
+
+        A token that was already used, or is presented from another device,
+        is treated as stolen: its whole family is revoked.
+
+        Returns:
+            (new opaque token, new row)
+        """
+        token_hash = hash_token(token)
+
+        # Fast path: replay of a token this process already rotated or revoked
+        spent_family = revocations.token_family(token_hash)
+        if spent_family is not None:
+            if not revocations.is_family_revoked(spent_family):
+                self.revoke_family(spent_family, reason="refresh token reuse")
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+        row = self.db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
+        if row is None or revocations.is_family_revoked(row.family_id):
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+        if row.revoked_at is not None or row.used_at is not None:
+            self.revoke_family(row.family_id, reason="refresh token reuse")
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+        if row.device_id != device_id:
+            self.revoke_family(row.family_id, reason="refresh token used from another device")
+            raise HTTPException(status_code=401, detail="Invalid device")
+
+        if row.expires_at.replace(tzinfo=None) <= datetime.utcnow():
+            raise HTTPException(status_code=401, detail="Refresh token expired")
+
+        # Spend the token with a guarded UPDATE: of two concurrent refreshes
+        # with the same token only one matches, and the other is reuse
+        spent = self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None), RefreshToken.revoked_at.is_(None))
+            .values(used_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if spent == 0:
+            self.revoke_family(row.family_id, reason="refresh token reuse")
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        new_token, new_row = self.issue(row.user_id, row.device_id, row.family_id)
+        self.db.commit()
+        revocations.add_token(token_hash, row.family_id)
+        return new_token, new_row
+
+    def revoke_family(self, family_id: str, reason: str = "logout") -> None:
+        """Revoke every refresh token of a session, and its access tokens"""
+        self.db.query(RefreshToken).filter(
+            RefreshToken.family_id == family_id,
+            RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+        revocations.revoke_family(family_id)
+        logger.info(f"Revoked session {family_id}: {reason}")
+
+    def revoke(self, token: str, device_id: str) -> None:
+        """Log out the session a refresh token belongs to"""
+        token_hash = hash_token(token)
+        family_id = revocations.token_family(token_hash)
+        if family_id is None:
+            row = self.db.query(RefreshToken.family_id, RefreshToken.device_id).filter(
+                RefreshToken.token_hash == token_hash
+            ).first()
+            if row is None or row.device_id != device_id:
+                raise HTTPException(status_code=401, detail="Invalid refresh token")
+            family_id = row.family_id
+        if not revocations.is_family_revoked(family_id):
+            self.revoke_family(family_id)
+
+    def purge_expired(self) -> int:
+        """Delete expired refresh tokens"""
+        deleted = self.db.query(RefreshToken).filter(
+            RefreshToken.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
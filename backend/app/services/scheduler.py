@@ -0,0 +1,218 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.scheduled_job import JobRun, JobRunStatus, ScheduledJob
+from app.utils.cron import CronSchedule
+
+logger = logging.getLogger(__name__)
+
+# Longest result / error text kept in job_runs
+MAX_RESULT_LENGTH = 2000
+
+
+class JobDefinition:
+    def __init__(self, name: str, schedule: str, func: Callable[[Session], Any],
+                 lease_seconds: Optional[int] = None):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.func = func
+        self.lease_seconds = lease_seconds or settings.SCHEDULER_LEASE_SECONDS
+
+
+class JobScheduler:
+    """
+    In-process cron scheduler that every uvicorn worker runs.
+
+    Each worker polls the scheduled_jobs table every SCHEDULER_POLL_SECONDS.
+    A due job is claimed with one conditional UPDATE (due, and not leased by
+    a live worker) that also leases it and advances next_run_at, so across N
+    workers exactly one runs each occurrence. While the job runs the lease is
+    renewed in the background, and it is released when the run ends; if the
+    worker dies, the job becomes claimable again once locked_until passes.
+    Runs are recorded in job_runs.
+    """
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, worker_id: Optional[str] = None):
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, JobDefinition] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, schedule: Optional[str], func: Callable[[Session], Any],
+                 lease_seconds: Optional[int] = None) -> None:
+        """Add a job; an empty schedule leaves it disabled"""
+        if schedule:
+            self.jobs[name] = JobDefinition(name, schedule, func, lease_seconds)
+
+    def sync(self, db: Session, now: Optional[datetime] = None) -> None:
+        """Create rows for new jobs and reschedule jobs whose cron expression changed"""
+        now = now or datetime.utcnow()
+        try:
+            self._sync(db, now)
+        except IntegrityError:
+            # Another worker starting at the same time created some of the rows; the retry keeps theirs
+            db.rollback()
+            self._sync(db, now)
+
+    def _sync(self, db: Session, now: datetime) -> None:
+        rows = {row.name: row for row in db.query(ScheduledJob).filter(ScheduledJob.name.in_(list(self.jobs)))}
+        for job in self.jobs.values():
+            row = rows.get(job.name)
+            if row is None:
+                db.add(ScheduledJob(name=job.name, schedule=job.schedule.expression,
+                                    next_run_at=job.schedule.next_after(now)))
+            elif row.schedule != job.schedule.expression:
+                row.schedule = job.schedule.expression
+                row.next_run_at = job.schedule.next_after(now)
+        db.commit()
+
+    def start(self) -> None:
+        if not self.jobs or self._thread is not None:
+            return
+        db = self.session_factory()
+        try:
+            self.sync(db)
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Job scheduler started on {self.worker_id} with {len(self.jobs)} jobs")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Job scheduler poll failed: {e}")
+            self._stop.wait(settings.SCHEDULER_POLL_SECONDS)
+
+    def run_pending(self, now: Optional[datetime] = None) -> List[str]:
+        """Run every due job this worker manages to claim; returns their names"""
+        ran = []
+        for job in self.jobs.values():
+            if self._stop.is_set():
+                break
+            db = self.session_factory()
+            try:
+                if self._claim(db, job, now or datetime.utcnow()):
+                    self._run(db, job)
+                    ran.append(job.name)
+            finally:
+                db.close()
+        return ran
+
+    def _claim(self, db: Session, job: JobDefinition, now: datetime) -> bool:
+        claimed = db.execute(
+            update(ScheduledJob)
+            .where(
+                ScheduledJob.name == job.name,
+                ScheduledJob.next_run_at <= now,
+                or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until < now)
+            )
+            .values(
+                locked_by=self.worker_id,
+                locked_until=now + timedelta(seconds=job.lease_seconds),
+                next_run_at=job.schedule.next_after(now)
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.commit()
+        return claimed
+
+    def _run(self, db: Session, job: JobDefinition) -> JobRun:
+        run = JobRun(job_name=job.name, worker=self.worker_id, started_at=datetime.utcnow())
+        db.add(run)
+        db.commit()
+
+        started = time.perf_counter()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = job.func(db)
+            run.status = JobRunStatus.SUCCEEDED
+            run.result = None if result is None else str(result)[:MAX_RESULT_LENGTH]
+        except Exception as e:
+            db.rollback()
+            logger.exception(f"Scheduled job {job.name} failed")
+            run.status = JobRunStatus.FAILED
+            run.error = f"{type(e).__name__}: {e}"[:MAX_RESULT_LENGTH]
+        finally:
+            done.set()
+        run.finished_at = datetime.utcnow()
+        run.duration_ms = int((time.perf_counter() - started) * 1000)
+
+        db.execute(
+            update(ScheduledJob)
+            .where(ScheduledJob.name == job.name, ScheduledJob.locked_by == self.worker_id)
+            .values(locked_by=None, locked_until=None, last_run_at=run.started_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        logger.info(f"Scheduled job {job.name} {run.status.value} in {run.duration_ms} ms")
+        return run
+
+    def _heartbeat(self, job: JobDefinition, done: threading.Event) -> None:
+        """Renew a running job's lease so a run longer than lease_seconds is not claimed again"""
+        while not done.wait(job.lease_seconds / 3):
+            db = self.session_factory()
+            try:
+                db.execute(
+                    update(ScheduledJob)
+                    .where(ScheduledJob.name == job.name, ScheduledJob.locked_by == self.worker_id)
+                    .values(locked_until=datetime.utcnow() + timedelta(seconds=job.lease_seconds))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Lease renewal for scheduled job {job.name} failed: {e}")
+            finally:
+                db.close()
+
+
+def request_run(db: Session, name: str) -> bool:
+    """
+    Make a job due now; the next worker to poll runs it
+
+    Returns:
+        False if there is no such job
+    """
+    updated = db.query(ScheduledJob).filter(ScheduledJob.name == name).update(
+        {ScheduledJob.next_run_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.commit()
+    return updated == 1
+
+
+def purge_job_runs(db: Session) -> int:
+    """Delete run history older than JOB_RUN_RETENTION_DAYS"""
+    cutoff = datetime.utcnow() - timedelta(days=settings.JOB_RUN_RETENTION_DAYS)
+    deleted = db.query(JobRun).filter(JobRun.started_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+scheduler = JobScheduler()
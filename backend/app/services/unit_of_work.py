@@ -0,0 +1,31 @@
+from types import TracebackType
+from typing import Optional, Type
+
+from sqlalchemy.orm import Session
+
+
+class UnitOfWork:
+    """
+    Runs a multi-step operation on one session, so on one pooled
+    connection, and ends it with a single commit. The services used inside
+    must be given uow.db and must flush rather than commit; if any step
+    raises, everything they wrote is rolled back together.
+
+        with UnitOfWork(db) as uow:
+            OffertCreator(uow.db).generate_offert_text(quote_id)
+            KPIService(uow.db).log_event(...)
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> bool:
+        if exc_type is None:
+            self.db.commit()
+        else:
+            self.db.rollback()
+        return False
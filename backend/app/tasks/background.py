@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from app.models.notification import Notification
+from app.schemas.pricing import RepriceRequest
+from app.services.job_queue import JobContext, JobFile, job_handler
+from app.services.pricing_engine import reprice_quotes
+from app.utils.accounting import AccountingIntegrationService
+from app.utils.analytics import AnalyticsService
+from app.utils.kpi import calculate_metrics
+from app.utils.notification_service import EmailNotificationService
+
+
+@job_handler("accounting.sync_customers")
+def sync_customers(ctx: JobContext):
+    return AccountingIntegrationService(ctx.db).sync_customers()
+
+
+@job_handler("accounting.sync_invoices")
+def sync_invoices(ctx: JobContext):
+    return AccountingIntegrationService(ctx.db).sync_invoices()
+
+
+@job_handler("kpi.calculate_metrics")
+def calculate_kpi_metrics(ctx: JobContext):
+    return {"message": calculate_metrics(ctx.db)}
+
+
+@job_handler("analytics.export")
+def export_analytics(ctx: JobContext):
+    ctx.report(0, f"Exporting {ctx.params['entity_type']}")
+    content = AnalyticsService(ctx.db).export_data(
+        ctx.params["entity_type"],
+        datetime.fromisoformat(ctx.params["start_date"]),
+        datetime.fromisoformat(ctx.params["end_date"])
+    )
+    return JobFile(content, "application/json")
+
+
+@job_handler("pricing.reprice_quotes")
+def reprice(ctx: JobContext):
+    request = RepriceRequest.parse_obj(ctx.params)
+    return reprice_quotes(
+        ctx.db, request.commission_rate, request.discount_rate, request.apply_discount,
+        unit_prices={(price.tree_species, price.operation_type): price.unit_price for price in request.unit_prices},
+        statuses=request.statuses, partner_id=request.partner_id, quote_ids=request.quote_ids
+    )
+
+
+@job_handler("notifications.send_email")
+def send_notification_email(ctx: JobContext):
+    # Queued in the same transaction as the notification (an outbox), so this only runs for committed ones
+    notification = ctx.db.get(Notification, ctx.params["notification_id"])
+    if notification is None or notification.sent:
+        return {"sent": False}
+    to_email = notification.customer_email or (notification.user.email if notification.user else None)
+    if not to_email:
+        raise ValueError(f"Notification {notification.id} has no recipient")
+    if not EmailNotificationService(ctx.db).send_email(
+        to_email, notification.title, notification.content.replace("\n", "<br>"), notification.content,
+        notification.tracking_id, notification.id
+    ):
+        raise RuntimeError(f"Sending notification {notification.id} failed")  # retried with backoff
+    return {"sent": True}
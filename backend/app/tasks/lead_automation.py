@@ -1,18 +1,165 @@
+import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, insert, select, update
 from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.change_log import ChangeEntity
+from app.models.kpi import KPIEvent
 from app.models.lead import Lead, LeadStatus
-from app.services.kpi_service import KPIService
+from app.models.notification import Notification, NotificationChannel, NotificationType
+from app.services.change_tracking import record_changes, record_entity_changes
+from app.services.lead_state_machine import SYSTEM, allowed_sources
+from app.services.partner_locator import record_partner_assignment
+
+logger = logging.getLogger(__name__)
+
+# Leads nobody has accepted yet; they expire at Lead.expires_at
+EXPIRABLE_LEAD_STATUSES = tuple(allowed_sources(LeadStatus.EXPIRED, SYSTEM))
+
 
 class LeadAutomation:
+    """
+    Set-based lead expiry. Each chunk is one UPDATE ... RETURNING over the
+    ix_leads_status_expires_at index plus bulk KPI event and change_log
+    inserts, committed on its own so a large backlog never holds one long
+    transaction.
+    """
+
     def __init__(self, db: Session):
         self.db = db
 
-    def expire_old_leads(self, hours_threshold: int = 48):
-        expiry_time = datetime.utcnow() - timedelta(hours=hours_threshold)
-        leads_to_expire = self.db.query(Lead).filter(Lead.status == LeadStatus.NEW, Lead.created_at < expiry_time).all()
-        for lead in leads_to_expire:
-            lead.status = LeadStatus.EXPIRED
-            lead.expires_at = datetime.utcnow()
-            self.db.add(lead)
-            KPIService(self.db).log_event("LeadExpired", lead_id=lead.id)
-        self.db.commit()
\ No newline at end of file
+    def expire_old_leads(self, hours_threshold: Optional[int] = None, now: Optional[datetime] = None,
+                         chunk_size: Optional[int] = None) -> int:
+        """
+        Expire unaccepted leads whose expires_at has passed. Leads created
+        without an expires_at expire hours_threshold (LEAD_EXPIRY_HOURS)
+        after creation.
+
+        Returns:
+            Number of leads expired
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(hours=hours_threshold or settings.LEAD_EXPIRY_HOURS)
+        chunk_size = chunk_size or settings.LEAD_EXPIRY_CHUNK_SIZE
+        due = (
+            Lead.expires_at < now,
+            and_(Lead.expires_at.is_(None), Lead.created_at < cutoff),
+        )
+        expired = 0
+        for condition in due:
+            while True:
+                count = self._expire_chunk(condition, now, chunk_size)
+                expired += count
+                if count < chunk_size:
+                    break
+        if expired:
+            logger.info(f"Expired {expired} leads")
+        return expired
+
+    def _expire_chunk(self, condition, now: datetime, chunk_size: int) -> int:
+        chunk = select(Lead.id).where(
+            Lead.status.in_(EXPIRABLE_LEAD_STATUSES), condition
+        ).limit(chunk_size).with_for_update(skip_locked=True)
+        rows = self.db.execute(
+            update(Lead)
+            .where(Lead.id.in_(chunk.scalar_subquery()), Lead.status.in_(EXPIRABLE_LEAD_STATUSES))
+            .values(status=LeadStatus.EXPIRED, version=Lead.version + 1, updated_at=now)
+            .returning(Lead.id, Lead.assigned_partner_id, Lead.version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if not rows:
+            self.db.commit()
+            return 0
+
+        by_partner: Dict[int, List[int]] = defaultdict(list)
+        for lead_id, partner_id, _ in rows:
+            if partner_id is not None:
+                by_partner[partner_id].append(lead_id)
+        for partner_id, lead_ids in by_partner.items():
+            record_changes(self.db, partner_id, ChangeEntity.LEAD, lead_ids)
+        record_entity_changes(self.db, ChangeEntity.LEAD, [
+            (lead_id, version, {"status": LeadStatus.EXPIRED}) for lead_id, _, version in rows
+        ])
+
+        self.db.execute(insert(KPIEvent), [
+            {"event_type": "LeadExpired", "lead_id": lead_id, "user_id": partner_id}
+            for lead_id, partner_id, _ in rows
+        ])
+        self.db.commit()
+
+        # Expired leads no longer count against partner capacity
+        for partner_id, lead_ids in by_partner.items():
+            record_partner_assignment(partner_id, -len(lead_ids))
+        return len(rows)
+
+    def warn_expiring_leads(self, within_hours: Optional[int] = None, now: Optional[datetime] = None,
+                            chunk_size: Optional[int] = None) -> int:
+        """
+        Send each partner one LEAD_EXPIRING in-app notification per assigned
+        lead that expires within within_hours (LEAD_EXPIRY_WARNING_HOURS).
+        Leads are marked with expiry_warned_at so they are warned once.
+
+        Returns:
+            Number of notifications created
+        """
+        now = now or datetime.utcnow()
+        horizon = now + timedelta(hours=within_hours or settings.LEAD_EXPIRY_WARNING_HOURS)
+        chunk_size = chunk_size or settings.LEAD_EXPIRY_CHUNK_SIZE
+        warned = 0
+        while True:
+            chunk = select(Lead.id).where(
+                Lead.status == LeadStatus.ASSIGNED,
+                Lead.assigned_partner_id.isnot(None),
+                Lead.expires_at >= now,
+                Lead.expires_at < horizon,
+                Lead.expiry_warned_at.is_(None)
+            ).limit(chunk_size).with_for_update(skip_locked=True)
+            rows = self.db.execute(
+                update(Lead)
+                .where(Lead.id.in_(chunk.scalar_subquery()), Lead.expiry_warned_at.is_(None))
+                .values(expiry_warned_at=now)
+                .returning(Lead.id, Lead.assigned_partner_id, Lead.city, Lead.expires_at, Lead.version)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if not rows:
+                self.db.commit()
+                break
+            record_entity_changes(self.db, ChangeEntity.LEAD, [
+                (lead_id, version, {"expiry_warned_at": now}) for lead_id, _, _, _, version in rows
+            ])
+
+            values = [
+                {
+                    "user_id": partner_id,
+                    "type": NotificationType.LEAD_EXPIRING,
+                    "channel": NotificationChannel.IN_APP,
+                    "title": "Lead expiring soon",
+                    "content": f"Your lead in {city} expires at {expires_at:%Y-%m-%d %H:%M} UTC unless accepted",
+                    "lead_id": lead_id,
+                }
+                for lead_id, partner_id, city, expires_at, _ in rows
+            ]
+            notifications = self.db.execute(
+                insert(Notification).returning(Notification.id, Notification.user_id, sort_by_parameter_order=True),
+                values
+            ).all()
+            by_user: Dict[int, List[int]] = defaultdict(list)
+            for notification_id, user_id in notifications:
+                by_user[user_id].append(notification_id)
+            for user_id, notification_ids in by_user.items():
+                record_changes(self.db, user_id, ChangeEntity.NOTIFICATION, notification_ids)
+            record_entity_changes(self.db, ChangeEntity.NOTIFICATION, [
+                (notification_id, None, row) for (notification_id, _), row in zip(notifications, values)
+            ])
+            self.db.commit()
+
+            warned += len(rows)
+            if len(rows) < chunk_size:
+                break
+        if warned:
+            logger.info(f"Sent {warned} lead expiry warnings")
+        return warned
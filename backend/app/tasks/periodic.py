@@ -0,0 +1,51 @@
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.services.batch_assignment import batch_assign_leads
+from app.services.change_feed import purge_entity_changes
+from app.services.customer_access_tokens import CustomerAccessTokenService
+from app.services.job_queue import purge_finished_jobs
+from app.services.price_catalogue import refresh_quote_item_stats
+from app.services.refresh_tokens import RefreshTokenService
+from app.services.scheduler import JobScheduler, purge_job_runs
+from app.tasks.kpi_tasks import KPITasks
+from app.tasks.lead_automation import LeadAutomation
+
+
+def expire_leads(db: Session) -> str:
+    return f"{LeadAutomation(db).expire_old_leads()} leads expired"
+
+
+def warn_expiring_leads(db: Session) -> str:
+    return f"{LeadAutomation(db).warn_expiring_leads()} expiry warnings sent"
+
+
+def calculate_kpi_metrics(db: Session) -> str:
+    return KPITasks(db).run_daily_kpi_aggregation()
+
+
+def purge_expired(db: Session) -> str:
+    refresh_tokens = RefreshTokenService(db).purge_expired()
+    CustomerAccessTokenService(db).purge_expired()
+    job_runs = purge_job_runs(db)
+    jobs = purge_finished_jobs(db)
+    changes = purge_entity_changes(db)
+    return f"{refresh_tokens} refresh tokens, {job_runs} job runs, {jobs} background jobs and {changes} changes deleted"
+
+
+def batch_assign(db: Session) -> str:
+    result = batch_assign_leads(db)
+    return f"{result.assigned} of {result.considered} leads assigned"
+
+
+def refresh_stats(db: Session) -> str:
+    return f"{refresh_quote_item_stats(db)} quote item stats rows rebuilt"
+
+
+def register_periodic_jobs(scheduler: JobScheduler) -> None:
+    scheduler.register("expire_leads", settings.SCHEDULE_EXPIRE_LEADS, expire_leads)
+    scheduler.register("warn_expiring_leads", settings.SCHEDULE_WARN_EXPIRING_LEADS, warn_expiring_leads)
+    scheduler.register("calculate_kpi_metrics", settings.SCHEDULE_KPI_METRICS, calculate_kpi_metrics)
+    scheduler.register("purge_expired", settings.SCHEDULE_PURGE_EXPIRED, purge_expired)
+    scheduler.register("batch_assign_leads", settings.SCHEDULE_BATCH_ASSIGN, batch_assign)
+    scheduler.register("refresh_quote_item_stats", settings.SCHEDULE_QUOTE_ITEM_STATS, refresh_stats)
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, BackgroundTasks
+from sqlalchemy import String, cast, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from collections import defaultdict
 from datetime import datetime, timedelta
 import json
 import logging
@@ -11,7 +14,19 @@ from app.database import get_db
 from app.models.lead import Lead, LeadStatus
 from app.models.quote import Quote, QuoteStatus, QuoteItem
 from app.models.user import User, UserRole
+from app.models.customer import normalize_email
+from app.models.accounting_invoice import AccountingInvoice, AccountingInvoiceStatus
+from app.models.change_log import ChangeEntity
 from app.config import settings
+from app.services.accounting_transport import (
+    AccountingResult,
+    AccountingTransport,
+    get_accounting_transport,
+    send_concurrently,
+)
+from app.services.change_feed import ChangeFeed
+from app.services.job_queue import enqueue, job_accepted
+from app.utils.auth import Principal, get_current_user
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +35,15 @@ logger = logging.getLogger(__name__)
 # Define API router
 router = APIRouter()
 
+# Idempotency keys of quote invoices are this prefix plus the quote id
+INVOICE_KEY_PREFIX = "t24-quote-"
+
+# Invoices are due this many days after they are sent
+INVOICE_DUE_DAYS = 30
+
+# Change feed consumer that sync_invoices reads quote changes with
+ACCOUNTING_CHANGE_CONSUMER = "accounting"
+
 # Define Pydantic models for accounting integration
 class AccountingSettings(BaseModel):
     accounting_system: str = "quickbooks"  # quickbooks, xero, fortnox, visma
@@ -64,10 +88,10 @@ class AccountingIntegrationService:
         # In a real implementation, this would retrieve settings from the database
         # For this example, we'll return default settings
         return AccountingSettings(
-            accounting_system="quickbooks",
-            api_key=settings.ACCOUNTING_API_KEY if hasattr(settings, 'ACCOUNTING_API_KEY') else None,
-            api_secret=settings.ACCOUNTING_API_SECRET if hasattr(settings, 'ACCOUNTING_API_SECRET') else None,
-            tenant_id=settings.ACCOUNTING_TENANT_ID if hasattr(settings, 'ACCOUNTING_TENANT_ID') else None,
+            accounting_system=settings.ACCOUNTING_SYSTEM,
+            api_key=settings.ACCOUNTING_API_KEY or None,
+            api_secret=settings.ACCOUNTING_API_SECRET or None,
+            tenant_id=settings.ACCOUNTING_TENANT_ID or None,
             auto_sync=True,
             sync_frequency="daily",
             sync_invoices=True,
@@ -76,9 +100,17 @@ class AccountingIntegrationService:
             sync_expenses=False
         )
     
+    def _get_transport(self) -> AccountingTransport:
+        try:
+            return get_accounting_transport(self.settings.accounting_system.lower())
+        except ValueError:
+            logger.error(f"Unknown accounting system: {self.settings.accounting_system}")
+            raise HTTPException(status_code=400, detail=f"Unsupported accounting system: {self.settings.accounting_system}")
+    
     def create_invoice(self, quote_id: int) -> Dict[str, Any]:
         """
-        Create an invoice in the accounting system for an approved quote
+        Create an invoice in the accounting system for an approved quote.
+        Idempotent: a quote that was already invoiced returns its existing invoice.
         
         Args:
             quote_id: Quote ID
@@ -100,42 +132,23 @@ class AccountingIntegrationService:
         if not lead:
             raise HTTPException(status_code=404, detail="Lead not found")
         
-        # Get quote items
-        items = self.db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).all()
-        
-        # Format items for invoice
-        formatted_items = []
-        for item in items:
-            formatted_items.append({
-                "description": f"{item.quantity} x {item.tree_species} - {item.operation_type}",
-                "quantity": item.quantity,
-                "unit_price": item.cost / item.quantity,
-                "amount": item.cost,
-                "tax_rate": 0.25  # 25% VAT in Sweden
-            })
-        
-        # Set due date (30 days from now)
-        due_date = datetime.utcnow() + timedelta(days=30)
-        
-        # Create invoice data
-        invoice_data = InvoiceData(
-            quote_id=quote.id,
-            lead_id=lead.id,
-            customer_name=lead.customer_name,
-            customer_email=lead.customer_email,
-            customer_address=f"{lead.address}, {lead.city}, {lead.postal_code}",
-            total_amount=quote.total_amount,
-            items=formatted_items,
-            due_date=due_date
-        )
-        
-        # Create invoice in accounting system
-        invoice_id = self._create_invoice_in_accounting_system(invoice_data)
-        
-        # Store invoice reference in database
-        # In a real implementation, this would update a field in the Quote model
-        # For this example, we'll just log it
-        logger.info(f"Created invoice {invoice_id} for quote {quote_id}")
+        self._open_ledger_entries([quote_id])
+        entry = self.db.query(AccountingInvoice).filter(AccountingInvoice.quote_id == quote_id).one()
+        transport = self._get_transport()
+        if entry.status != AccountingInvoiceStatus.SENT and transport.simulated:
+            # Not a real invoice: the ledger row stays pending for when an accounting system is configured
+            result = transport.create_invoices(
+                self._invoice_records([(entry.id, entry.quote_id, entry.idempotency_key)])
+            )[0]
+            self.db.commit()
+            invoice_id, created_at = result.external_id, datetime.utcnow()
+        else:
+            if entry.status != AccountingInvoiceStatus.SENT:
+                self._send_ledger_entries([(entry.id, entry.quote_id, entry.idempotency_key)])
+                self.db.refresh(entry)
+            if entry.status != AccountingInvoiceStatus.SENT:
+                raise HTTPException(status_code=502, detail=f"Accounting system rejected invoice: {entry.error}")
+            invoice_id, created_at = entry.external_id, entry.sent_at
         
         # Return invoice details
         return {
@@ -144,55 +157,133 @@ class AccountingIntegrationService:
             "lead_id": lead.id,
             "customer_name": lead.customer_name,
             "total_amount": quote.total_amount,
-            "due_date": due_date,
-            "created_at": datetime.utcnow()
+            "due_date": created_at + timedelta(days=INVOICE_DUE_DAYS),
+            "created_at": created_at,
+            "simulated": transport.simulated
         }
     
-    def _create_invoice_in_accounting_system(self, invoice_data: InvoiceData) -> str:
+    def _open_ledger_entries(self, quote_ids: Optional[List[int]] = None) -> int:
         """
-        Create an invoice in the external accounting system
+        Add a pending ledger row, with its idempotency key, for every approved
+        quote (or every one of quote_ids) that has none. One INSERT ... SELECT.
         
-        Args:
-            invoice_data: Invoice data
-            
         Returns:
-            Invoice ID from accounting system
+            Number of rows added
         """
-        # In a real implementation, this would make API calls to the accounting system
-        # For this example, we'll simulate the API call
+        not_invoiced = self.db.query(AccountingInvoice.id).filter(
+            AccountingInvoice.quote_id == Quote.id
+        ).exists()
+        quotes = select(
+            Quote.id,
+            literal(INVOICE_KEY_PREFIX) + cast(Quote.id, String),
+            literal(self.settings.accounting_system.lower()),
+            literal(AccountingInvoiceStatus.PENDING, AccountingInvoice.__table__.c.status.type),
+            Quote.total_amount,
+            literal(0)
+        ).where(Quote.status == QuoteStatus.APPROVED, ~not_invoiced)
+        if quote_ids is not None:
+            quotes = quotes.where(Quote.id.in_(quote_ids))
+        statement = insert(AccountingInvoice).from_select(
+            ["quote_id", "idempotency_key", "accounting_system", "status", "amount", "attempts"], quotes
+        )
+        try:
+            added = self.db.execute(statement).rowcount
+            self.db.commit()
+        except IntegrityError:
+            # A concurrent sync opened some of the same quotes; the retry skips them
+            self.db.rollback()
+            added = self.db.execute(statement).rowcount
+            self.db.commit()
+        return added
+    
+    def _open_changed_quotes(self) -> int:
+        """Open ledger rows for quotes approved since the last sync, via the change feed"""
+        feed = ChangeFeed(self.db, ACCOUNTING_CHANGE_CONSUMER)
+        if feed.position == 0:
+            # Never synced: take the offset first, then scan every approved quote
+            head = feed.head()
+            opened = self._open_ledger_entries()
+            feed.acknowledge(head)
+            return opened
+        
+        opened = 0
+        for batch in feed.batches(entity_types=[ChangeEntity.QUOTE]):
+            quote_ids = list({change["entity_id"] for change in batch.changes})
+            if quote_ids:
+                opened += self._open_ledger_entries(quote_ids)
+            feed.acknowledge(batch.position)
+        return opened
+    
+    def _invoice_records(self, entries: List[Tuple[int, int, str]]) -> List[Dict[str, Any]]:
+        """Build invoice payloads for ledger entries with two queries"""
+        quote_ids = [quote_id for _, quote_id, _ in entries]
+        quotes = {
+            row.id: row for row in self.db.query(
+                Quote.id, Quote.total_amount, Lead.customer_name, Lead.customer_email,
+                Lead.address, Lead.city, Lead.postal_code
+            ).join(Lead, Lead.id == Quote.lead_id).filter(Quote.id.in_(quote_ids))
+        }
+        items = defaultdict(list)
+        for item in self.db.query(QuoteItem).filter(QuoteItem.quote_id.in_(quote_ids)).order_by(QuoteItem.id):
+            items[item.quote_id].append({
+                "description": f"{item.quantity} x {item.tree_species} - {item.operation_type}",
+                "quantity": item.quantity,
+                "unit_price": float(item.cost / item.quantity),
+                "amount": float(item.cost),
+                "tax_rate": 0.25  # 25% VAT in Sweden
+            })
         
-        accounting_system = self.settings.accounting_system.lower()
+        due_date = (datetime.utcnow() + timedelta(days=INVOICE_DUE_DAYS)).date().isoformat()
+        records = []
+        for _, quote_id, key in entries:
+            quote = quotes[quote_id]
+            records.append({
+                "key": key,
+                "quote_id": quote_id,
+                "customer_name": quote.customer_name,
+                "customer_email": quote.customer_email,
+                "customer_address": f"{quote.address}, {quote.city}, {quote.postal_code}",
+                "total_amount": float(quote.total_amount),
+                "items": items[quote_id],
+                "due_date": due_date
+            })
+        return records
+    
+    def _send_ledger_entries(self, entries: List[Tuple[int, int, str]]) -> Tuple[int, int]:
+        """
+        Send invoices for ledger entries (id, quote_id, idempotency_key)
+        concurrently and record the outcome on each row
         
-        if accounting_system == "quickbooks":
-            # Simulate QuickBooks API call
-            logger.info(f"Would create invoice in QuickBooks for {invoice_data.customer_name}")
-            # Generate a fake invoice ID
-            invoice_id = f"QB-INV-{invoice_data.quote_id}-{int(datetime.utcnow().timestamp())}"
-            
-        elif accounting_system == "xero":
-            # Simulate Xero API call
-            logger.info(f"Would create invoice in Xero for {invoice_data.customer_name}")
-            # Generate a fake invoice ID
-            invoice_id = f"XR-INV-{invoice_data.quote_id}-{int(datetime.utcnow().timestamp())}"
-            
-        elif accounting_system == "fortnox":
-            # Simulate Fortnox API call
-            logger.info(f"Would create invoice in Fortnox for {invoice_data.customer_name}")
-            # Generate a fake invoice ID
-            invoice_id = f"FN-INV-{invoice_data.quote_id}-{int(datetime.utcnow().timestamp())}"
-            
-        elif accounting_system == "visma":
-            # Simulate Visma API call
-            logger.info(f"Would create invoice in Visma for {invoice_data.customer_name}")
-            # Generate a fake invoice ID
-            invoice_id = f"VS-INV-{invoice_data.quote_id}-{int(datetime.utcnow().timestamp())}"
-            
-        else:
-            # Unknown accounting system
-            logger.error(f"Unknown accounting system: {accounting_system}")
-            raise HTTPException(status_code=400, detail=f"Unsupported accounting system: {accounting_system}")
+        Returns:
+            (sent, failed)
+        """
+        transport = self._get_transport()
+        results = {
+            result.key: result
+            for result in send_concurrently(transport, "create_invoices", self._invoice_records(entries))
+        }
         
-        return invoice_id
+        now = datetime.utcnow()
+        updates = []
+        for entry_id, quote_id, key in entries:
+            result = results.get(key) or AccountingResult(key=key, error="No result returned")
+            if result.error is None:
+                updates.append({"id": entry_id, "status": AccountingInvoiceStatus.SENT,
+                                "external_id": result.external_id, "error": None, "sent_at": now})
+                logger.info(f"Created invoice {result.external_id} for quote {quote_id}")
+            else:
+                updates.append({"id": entry_id, "status": AccountingInvoiceStatus.FAILED, "error": result.error})
+        self.db.execute(update(AccountingInvoice), updates)
+        self.db.execute(
+            update(AccountingInvoice)
+            .where(AccountingInvoice.id.in_([entry_id for entry_id, _, _ in entries]))
+            .values(attempts=AccountingInvoice.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        
+        sent = sum(1 for row in updates if row["status"] == AccountingInvoiceStatus.SENT)
+        return sent, len(updates) - sent
     
     def record_payment(self, invoice_id: str, payment_data: PaymentData) -> Dict[str, Any]:
         """
@@ -271,102 +362,102 @@ class AccountingIntegrationService:
     
     def sync_customers(self) -> Dict[str, Any]:
         """
-        Sync customers between the lead system and accounting system
+        Sync customers between the lead system and accounting system.
+        Each distinct customer email is sent once, with the details of its
+        first lead.
         
         Returns:
             Dict with sync results
         """
-        # Get all leads with unique customer emails
-        leads = self.db.query(Lead).all()
-        
-        # Extract unique customers
-        customers = {}
-        for lead in leads:
-            if lead.customer_email not in customers:
-                customers[lead.customer_email] = {
-                    "name": lead.customer_name,
-                    "email": lead.customer_email,
-                    "phone": lead.customer_phone,
-                    "address": lead.address,
-                    "city": lead.city,
-                    "postal_code": lead.postal_code,
-                    "region": lead.region
-                }
+        # Oldest lead per customer email, deduplicated in the database
+        first_leads = select(func.min(Lead.id)).group_by(func.lower(Lead.customer_email))
+        customers = [
+            {
+                "key": normalize_email(row.customer_email),
+                "name": row.customer_name,
+                "email": row.customer_email,
+                "phone": row.customer_phone,
+                "address": row.address,
+                "city": row.city,
+                "postal_code": row.postal_code,
+                "region": row.region
+            }
+            for row in self.db.query(
+                Lead.customer_name, Lead.customer_email, Lead.customer_phone,
+                Lead.address, Lead.city, Lead.postal_code, Lead.region
+            ).filter(Lead.id.in_(first_leads))
+        ]
         
         # Sync customers with accounting system
-        synced_count = self._sync_customers_with_accounting_system(list(customers.values()))
+        results = send_concurrently(self._get_transport(), "upsert_customers", customers)
+        failed = [result for result in results if result.error is not None]
+        for result in failed[:10]:
+            logger.error(f"Customer {result.key} not synced: {result.error}")
         
         return {
             "total_customers": len(customers),
-            "synced_customers": synced_count,
+            "synced_customers": len(results) - len(failed),
+            "failed_customers": len(failed),
             "synced_at": datetime.utcnow()
         }
     
-    def _sync_customers_with_accounting_system(self, customers: List[Dict[str, Any]]) -> int:
-        """
-        Sync customers with the external accounting system
-        
-        Args:
-            customers: List of customer data
-            
-        Returns:
-            Number of customers synced
-        """
-        # In a real implementation, this would make API calls to the accounting system
-        # For this example, we'll simulate the API call
-        
-        accounting_system = self.settings.accounting_system.lower()
-        
-        if accounting_system == "quickbooks":
-            # Simulate QuickBooks API call
-            logger.info(f"Would sync {len(customers)} customers with QuickBooks")
-            
-        elif accounting_system == "xero":
-            # Simulate Xero API call
-            logger.info(f"Would sync {len(customers)} customers with Xero")
-            
-        elif accounting_system == "fortnox":
-            # Simulate Fortnox API call
-            logger.info(f"Would sync {len(customers)} customers with Fortnox")
-            
-        elif accounting_system == "visma":
-            # Simulate Visma API call
-            logger.info(f"Would sync {len(customers)} customers with Visma")
-            
-        else:
-            # Unknown accounting system
-            logger.error(f"Unknown accounting system: {accounting_system}")
-            raise HTTPException(status_code=400, detail=f"Unsupported accounting system: {accounting_system}")
-        
-        # Return number of customers synced
-        return len(customers)
-    
     def sync_invoices(self) -> Dict[str, Any]:
         """
-        Sync invoices between the lead system and accounting system
+        Invoice every approved quote that has not been invoiced yet.
+        
+        Quotes changed since the last sync are read from the change feed and
+        the approved ones get a pending ledger row (the first sync scans all
+        approved quotes instead). Pending rows, and failed ones below
+        ACCOUNTING_MAX_ATTEMPTS, are then sent in chunks of
+        ACCOUNTING_SYNC_CHUNK_SIZE. Invoiced quotes are never sent again.
+        Without a real accounting system (simulated transport) nothing is
+        sent and the rows stay pending.
         
         Returns:
             Dict with sync results
         """
-        # Get all approved quotes that need invoicing
-        quotes = self.db.query(Quote).filter(
-            Quote.status == QuoteStatus.APPROVED,
-            # In a real implementation, this would check if the quote has already been invoiced
-            # For this example, we'll just get all approved quotes
-        ).all()
-        
-        # Create invoices for each quote
-        created_invoices = []
-        for quote in quotes:
-            try:
-                invoice = self.create_invoice(quote.id)
-                created_invoices.append(invoice)
-            except Exception as e:
-                logger.error(f"Error creating invoice for quote {quote.id}: {e}")
+        opened = self._open_changed_quotes()
+        if self._get_transport().simulated:
+            pending = self.db.query(func.count(AccountingInvoice.id)).filter(
+                AccountingInvoice.status.in_((AccountingInvoiceStatus.PENDING, AccountingInvoiceStatus.FAILED))
+            ).scalar()
+            logger.info(f"No accounting system configured; {pending} invoices left pending")
+            return {
+                "total_quotes": pending,
+                "new_quotes": opened,
+                "created_invoices": 0,
+                "failed_invoices": 0,
+                "simulated": True,
+                "synced_at": datetime.utcnow()
+            }
+
+        total = sent = failed = 0
+        last_id = 0
+        while True:
+            entries = self.db.query(
+                AccountingInvoice.id, AccountingInvoice.quote_id, AccountingInvoice.idempotency_key
+            ).filter(
+                AccountingInvoice.status.in_((AccountingInvoiceStatus.PENDING, AccountingInvoiceStatus.FAILED)),
+                AccountingInvoice.attempts < settings.ACCOUNTING_MAX_ATTEMPTS,
+                AccountingInvoice.id > last_id
+            ).order_by(AccountingInvoice.id).limit(settings.ACCOUNTING_SYNC_CHUNK_SIZE).with_for_update(
+                skip_locked=True
+            ).all()
+            if not entries:
+                self.db.commit()
+                break
+            chunk_sent, chunk_failed = self._send_ledger_entries([tuple(entry) for entry in entries])
+            total += len(entries)
+            sent += chunk_sent
+            failed += chunk_failed
+            last_id = entries[-1].id
         
         return {
-            "total_quotes": len(quotes),
-            "created_invoices": len(created_invoices),
+            "total_quotes": total,
+            "new_quotes": opened,
+            "created_invoices": sent,
+            "failed_invoices": failed,
+            "simulated": False,
             "synced_at": datetime.utcnow()
         }
     
@@ -517,21 +608,23 @@ def record_payment(
     service = AccountingIntegrationService(db)
     return service.record_payment(invoice_id, payment_data)
 
-@router.post("/accounting/sync/customers", response_model=Dict[str, Any])
+@router.post("/accounting/sync/customers", status_code=status.HTTP_202_ACCEPTED, response_model=Dict[str, Any])
 def sync_customers(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Sync customers with accounting system"""
-    service = AccountingIntegrationService(db)
-    return service.sync_customers()
+    """Queue a customer sync with the accounting system; poll the returned job for the result"""
+    job = enqueue(db, "accounting.sync_customers", submitted_by=current_user.id)
+    return job_accepted(job)
 
-@router.post("/accounting/sync/invoices", response_model=Dict[str, Any])
+@router.post("/accounting/sync/invoices", status_code=status.HTTP_202_ACCEPTED, response_model=Dict[str, Any])
 def sync_invoices(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Sync invoices with accounting system"""
-    service = AccountingIntegrationService(db)
-    return service.sync_invoices()
+    """Queue an invoice sync with the accounting system; poll the returned job for the result"""
+    job = enqueue(db, "accounting.sync_invoices", submitted_by=current_user.id)
+    return job_accepted(job)
 
 @router.get("/accounting/accounts", response_model=List[Dict[str, Any]])
 def get_financial_accounts(
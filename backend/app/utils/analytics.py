@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, and_, or_, extract, cast, Date
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator
 from datetime import datetime, timedelta
+from decimal import Decimal
 import pandas as pd
 import numpy as np
 import json
@@ -13,6 +15,13 @@ from app.database import get_db
 from app.models.lead import Lead, LeadStatus
 from app.models.quote import Quote, QuoteStatus, QuoteItem
 from app.models.user import User, UserRole
+from app.config import settings
+from app.services.job_queue import enqueue, job_accepted
+from app.services.price_catalogue import quote_item_stats_matrix
+from app.services.pricing_engine import OPERATIONS, SPECIES, from_ore, money
+from app.utils.auth import Principal, get_current_user
+from app.utils.http_cache import CACHE_CONTROL_ANALYTICS, cached_aggregate
+from app.utils.responses import dumps, iter_json_array
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +30,9 @@ logger = logging.getLogger(__name__)
 # Define API router
 router = APIRouter()
 
+# Rows read and serialized per chunk when streaming exports
+EXPORT_BATCH_SIZE = 500
+
 # Define Pydantic models for analytics API
 class DateRangeParams(BaseModel):
     start_date: Optional[datetime] = None
@@ -38,10 +50,10 @@ class PerformanceMetrics(BaseModel):
     conversion_rate: float
     avg_response_time: float
     avg_quote_time: float
-    avg_quote_value: float
-    total_revenue: float
-    lead_fees: float
-    commissions: float
+    avg_quote_value: Decimal
+    total_revenue: Decimal
+    lead_fees: Decimal
+    commissions: Decimal
 
 class AnalyticsService:
     """
@@ -156,10 +168,10 @@ class AnalyticsService:
             conversion_rate=round(conversion_rate, 2),
             avg_response_time=round(response_time_query.avg_response_time or 0, 2),
             avg_quote_time=round(quote_time_query.avg_quote_time or 0, 2),
-            avg_quote_value=round(quote_results.avg_quote_value or 0, 2),
-            total_revenue=round((quote_results.total_quote_value or 0) + lead_fees, 2),
+            avg_quote_value=money(quote_results.avg_quote_value),
+            total_revenue=money((quote_results.total_quote_value or 0) + lead_fees),
             lead_fees=lead_fees,
-            commissions=round(quote_results.total_commission or 0, 2)
+            commissions=money(quote_results.total_commission)
         )
     
     def get_time_series_data(self, metric: str, start_date: datetime, end_date: datetime,
@@ -396,10 +408,10 @@ class AnalyticsService:
                 "declined_leads": region.declined_leads or 0,
                 "expired_leads": region.expired_leads or 0,
                 "conversion_rate": round(conversion_rate, 2),
-                "avg_quote_value": round(quote_query.avg_quote_value or 0, 2),
-                "total_revenue": round((quote_query.total_quote_value or 0) + lead_fees, 2),
+                "avg_quote_value": money(quote_query.avg_quote_value),
+                "total_revenue": money((quote_query.total_quote_value or 0) + lead_fees),
                 "lead_fees": lead_fees,
-                "commissions": round(quote_query.total_commission or 0, 2)
+                "commissions": money(quote_query.total_commission)
             })
         
         return results
@@ -508,10 +520,10 @@ class AnalyticsService:
                 "avg_response_time": round(response_time_query.avg_response_time or 0, 2),
                 "avg_quote_time": round(quote_time_query.avg_quote_time or 0, 2),
                 "total_quotes": quote_query.total_quotes or 0,
-                "avg_quote_value": round(quote_query.avg_quote_value or 0, 2),
-                "total_revenue": round((quote_query.total_quote_value or 0) + lead_fees, 2),
+                "avg_quote_value": money(quote_query.avg_quote_value),
+                "total_revenue": money((quote_query.total_quote_value or 0) + lead_fees),
                 "lead_fees": lead_fees,
-                "commissions": round(quote_query.total_commission or 0, 2)
+                "commissions": money(quote_query.total_commission)
             })
         
         return results
@@ -520,6 +532,9 @@ class AnalyticsService:
         """
         Analyze tree operations in quotes
         
+        Reads the daily species × operation rollup (quote_item_stats), so
+        the range is whole days and follows SCHEDULE_QUOTE_ITEM_STATS.
+        
         Args:
             start_date: Start date for analysis
             end_date: End date for analysis
@@ -527,74 +542,33 @@ class AnalyticsService:
         Returns:
             Dict with tree species and operation type analysis
         """
-        # Base query filters for quotes
-        date_filter = and_(Quote.created_at >= start_date, Quote.created_at <= end_date)
-        
-        # Analyze tree species
-        species_query = self.db.query(
-            QuoteItem.tree_species,
-            func.count(QuoteItem.id).label("count"),
-            func.sum(QuoteItem.cost).label("total_cost"),
-            func.avg(QuoteItem.cost).label("avg_cost")
-        ).join(Quote, QuoteItem.quote_id == Quote.id).filter(
-            date_filter
-        ).group_by(QuoteItem.tree_species).order_by(desc("count"))
-        
-        # Analyze operation types
-        operation_query = self.db.query(
-            QuoteItem.operation_type,
-            func.count(QuoteItem.id).label("count"),
-            func.sum(QuoteItem.cost).label("total_cost"),
-            func.avg(QuoteItem.cost).label("avg_cost")
-        ).join(Quote, QuoteItem.quote_id == Quote.id).filter(
-            date_filter
-        ).group_by(QuoteItem.operation_type).order_by(desc("count"))
-        
-        # Execute queries
-        species_results = species_query.all()
-        operation_results = operation_query.all()
-        
-        # Format results
-        species_data = []
-        for species in species_results:
-            species_data.append({
-                "species": species.tree_species,
-                "count": species.count,
-                "total_cost": round(species.total_cost, 2),
-                "avg_cost": round(species.avg_cost, 2)
-            })
-        
-        operation_data = []
-        for operation in operation_results:
-            operation_data.append({
-                "operation": operation.operation_type,
-                "count": operation.count,
-                "total_cost": round(operation.total_cost, 2),
-                "avg_cost": round(operation.avg_cost, 2)
-            })
-        
-        # Analyze species-operation combinations
-        combo_query = self.db.query(
-            QuoteItem.tree_species,
-            QuoteItem.operation_type,
-            func.count(QuoteItem.id).label("count"),
-            func.sum(QuoteItem.cost).label("total_cost"),
-            func.avg(QuoteItem.cost).label("avg_cost")
-        ).join(Quote, QuoteItem.quote_id == Quote.id).filter(
-            date_filter
-        ).group_by(QuoteItem.tree_species, QuoteItem.operation_type).order_by(desc("count"))
-        
-        combo_results = combo_query.all()
-        
-        combo_data = []
-        for combo in combo_results:
-            combo_data.append({
-                "species": combo.tree_species,
-                "operation": combo.operation_type,
-                "count": combo.count,
-                "total_cost": round(combo.total_cost, 2),
-                "avg_cost": round(combo.avg_cost, 2)
-            })
+        counts, totals = quote_item_stats_matrix(self.db, start_date.date(), end_date.date())
+        
+        def analysis(count, total):
+            return {
+                "count": int(count),
+                "total_cost": from_ore(total),
+                "avg_cost": money(from_ore(total) / int(count))
+            }
+        
+        # Species and operations are the row and column sums of the matrix
+        species_counts, species_totals = counts.sum(axis=1), totals.sum(axis=1)
+        species_data = [
+            {"species": SPECIES[s], **analysis(species_counts[s], species_totals[s])}
+            for s in np.argsort(-species_counts, kind="stable") if species_counts[s]
+        ]
+        
+        operation_counts, operation_totals = counts.sum(axis=0), totals.sum(axis=0)
+        operation_data = [
+            {"operation": OPERATIONS[o], **analysis(operation_counts[o], operation_totals[o])}
+            for o in np.argsort(-operation_counts, kind="stable") if operation_counts[o]
+        ]
+        
+        combo_data = [
+            {"species": SPECIES[s], "operation": OPERATIONS[o], **analysis(counts[s, o], totals[s, o])}
+            for s, o in zip(*np.unravel_index(np.argsort(-counts, axis=None, kind="stable"), counts.shape))
+            if counts[s, o]
+        ]
         
         return {
             "species_analysis": species_data,
@@ -634,7 +608,7 @@ class AnalyticsService:
             date_filter
         ).first()
         
-        commission_revenue = commission_query.total_commission or 0
+        commission_revenue = money(commission_query.total_commission)
         
         # Calculate total revenue
         total_revenue = lead_fees + commission_revenue
@@ -696,7 +670,121 @@ class AnalyticsService:
             "monthly_revenue": monthly_revenue
         }
     
-    def export_data(self, entity_type: str, start_date: datetime, end_date: datetime) -> str:
+    def _lead_export_batches(self, date_filter) -> Iterator[List[Dict[str, Any]]]:
+        """Yield exported leads in batches of EXPORT_BATCH_SIZE"""
+        leads_query = self.db.query(Lead).filter(date_filter).order_by(Lead.created_at)
+        
+        batch = []
+        for lead in leads_query.yield_per(EXPORT_BATCH_SIZE):
+            batch.append({
+                "id": lead.id,
+                "customer_name": lead.customer_name,
+                "customer_email": lead.customer_email,
+                "customer_phone": lead.customer_phone,
+                "address": lead.address,
+                "city": lead.city,
+                "postal_code": lead.postal_code,
+                "region": lead.region,
+                "summary": lead.summary,
+                "details": lead.details,
+                "status": lead.status,
+                "assigned_partner_id": lead.assigned_partner_id,
+                "assigned_at": lead.assigned_at.isoformat() if lead.assigned_at else None,
+                "accepted_at": lead.accepted_at.isoformat() if lead.accepted_at else None,
+                "quoted_at": lead.quoted_at.isoformat() if lead.quoted_at else None,
+                "customer_response_at": lead.customer_response_at.isoformat() if lead.customer_response_at else None,
+                "created_at": lead.created_at.isoformat(),
+                "updated_at": lead.updated_at.isoformat() if lead.updated_at else None,
+                "expires_at": lead.expires_at.isoformat() if lead.expires_at else None,
+                "lead_fee": lead.lead_fee,
+                "commission_percent": lead.commission_percent,
+                "billed": lead.billed
+            })
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+        
+        if batch:
+            yield batch
+    
+    def _quote_export_batches(self, date_filter) -> Iterator[List[Dict[str, Any]]]:
+        """Yield exported quotes with their items in batches of EXPORT_BATCH_SIZE"""
+        quotes_query = self.db.query(Quote).join(Lead, Quote.lead_id == Lead.id).filter(date_filter).order_by(Quote.created_at)
+        
+        quotes = []
+        for quote in quotes_query.yield_per(EXPORT_BATCH_SIZE):
+            quotes.append(quote)
+            if len(quotes) >= EXPORT_BATCH_SIZE:
+                yield self._quote_export_records(quotes)
+                quotes = []
+        
+        if quotes:
+            yield self._quote_export_records(quotes)
+    
+    def _quote_export_records(self, quotes: List[Quote]) -> List[Dict[str, Any]]:
+        # Get the items of this batch of quotes
+        quote_ids = [quote.id for quote in quotes]
+        items = self.db.query(QuoteItem).filter(QuoteItem.quote_id.in_(quote_ids)).all()
+        
+        # Group items by quote
+        items_by_quote = {}
+        for item in items:
+            if item.quote_id not in items_by_quote:
+                items_by_quote[item.quote_id] = []
+            
+            items_by_quote[item.quote_id].append({
+                "id": item.id,
+                "quantity": item.quantity,
+                "tree_species": item.tree_species,
+                "operation_type": item.operation_type,
+                "custom_operation": item.custom_operation,
+                "cost": item.cost
+            })
+        
+        # Convert quotes to dict
+        quotes_data = []
+        for quote in quotes:
+            quotes_data.append({
+                "id": quote.id,
+                "lead_id": quote.lead_id,
+                "status": quote.status,
+                "total_amount": quote.total_amount,
+                "commission_amount": quote.commission_amount,
+                "sent_at": quote.sent_at.isoformat() if quote.sent_at else None,
+                "customer_response_at": quote.customer_response_at.isoformat() if quote.customer_response_at else None,
+                "created_at": quote.created_at.isoformat(),
+                "updated_at": quote.updated_at.isoformat() if quote.updated_at else None,
+                "items": items_by_quote.get(quote.id, [])
+            })
+        
+        return quotes_data
+    
+    def iter_export(self, entity_type: str, start_date: datetime, end_date: datetime) -> Iterator[bytes]:
+        """
+        Export data as a stream of JSON chunks
+        
+        Leads and quotes are read and serialized batch by batch, so large
+        exports are never held in memory as a whole; the other entity types
+        are small aggregates and are sent as one chunk.
+        
+        Args:
+            entity_type: Type of entity to export (leads, quotes, etc.)
+            start_date: Start date for export
+            end_date: End date for export
+            
+        Returns:
+            Iterator of JSON byte chunks
+        """
+        date_filter = and_(Lead.created_at >= start_date, Lead.created_at <= end_date)
+        
+        if entity_type == "leads":
+            yield from iter_json_array(self._lead_export_batches(date_filter))
+        elif entity_type == "quotes":
+            yield from iter_json_array(self._quote_export_batches(date_filter))
+        else:
+            yield self.export_data(entity_type, start_date, end_date)
+    
+    def export_data(self, entity_type: str, start_date: datetime, end_date: datetime) -> bytes:
         """
         Export data as JSON for the specified entity type and date range
         
@@ -706,112 +794,43 @@ class AnalyticsService:
             end_date: End date for export
             
         Returns:
-            JSON string with exported data
+            JSON document with exported data, as bytes
         """
         # Base query filters
         date_filter = and_(Lead.created_at >= start_date, Lead.created_at <= end_date)
         
         if entity_type == "leads":
-            # Export leads
-            leads_query = self.db.query(Lead).filter(date_filter).order_by(Lead.created_at)
-            leads = leads_query.all()
-            
-            # Convert to dict
-            leads_data = []
-            for lead in leads:
-                leads_data.append({
-                    "id": lead.id,
-                    "customer_name": lead.customer_name,
-                    "customer_email": lead.customer_email,
-                    "customer_phone": lead.customer_phone,
-                    "address": lead.address,
-                    "city": lead.city,
-                    "postal_code": lead.postal_code,
-                    "region": lead.region,
-                    "summary": lead.summary,
-                    "details": lead.details,
-                    "status": lead.status,
-                    "assigned_partner_id": lead.assigned_partner_id,
-                    "assigned_at": lead.assigned_at.isoformat() if lead.assigned_at else None,
-                    "accepted_at": lead.accepted_at.isoformat() if lead.accepted_at else None,
-                    "quoted_at": lead.quoted_at.isoformat() if lead.quoted_at else None,
-                    "customer_response_at": lead.customer_response_at.isoformat() if lead.customer_response_at else None,
-                    "created_at": lead.created_at.isoformat(),
-                    "updated_at": lead.updated_at.isoformat() if lead.updated_at else None,
-                    "expires_at": lead.expires_at.isoformat() if lead.expires_at else None,
-                    "lead_fee": lead.lead_fee,
-                    "commission_percent": lead.commission_percent,
-                    "billed": lead.billed
-                })
-            
-            return json.dumps(leads_data, indent=2)
+            leads_data = [lead for batch in self._lead_export_batches(date_filter) for lead in batch]
+            return dumps(leads_data, indent=True)
             
         elif entity_type == "quotes":
-            # Export quotes with items
-            quotes_query = self.db.query(Quote).join(Lead, Quote.lead_id == Lead.id).filter(date_filter).order_by(Quote.created_at)
-            quotes = quotes_query.all()
-            
-            # Get all quote items
-            quote_ids = [quote.id for quote in quotes]
-            items_query = self.db.query(QuoteItem).filter(QuoteItem.quote_id.in_(quote_ids))
-            items = items_query.all()
-            
-            # Group items by quote
-            items_by_quote = {}
-            for item in items:
-                if item.quote_id not in items_by_quote:
-                    items_by_quote[item.quote_id] = []
-                
-                items_by_quote[item.quote_id].append({
-                    "id": item.id,
-                    "quantity": item.quantity,
-                    "tree_species": item.tree_species,
-                    "operation_type": item.operation_type,
-                    "custom_operation": item.custom_operation,
-                    "cost": item.cost
-                })
-            
-            # Convert quotes to dict
-            quotes_data = []
-            for quote in quotes:
-                quotes_data.append({
-                    "id": quote.id,
-                    "lead_id": quote.lead_id,
-                    "status": quote.status,
-                    "total_amount": quote.total_amount,
-                    "commission_amount": quote.commission_amount,
-                    "sent_at": quote.sent_at.isoformat() if quote.sent_at else None,
-                    "customer_response_at": quote.customer_response_at.isoformat() if quote.customer_response_at else None,
-                    "created_at": quote.created_at.isoformat(),
-                    "updated_at": quote.updated_at.isoformat() if quote.updated_at else None,
-                    "items": items_by_quote.get(quote.id, [])
-                })
-            
-            return json.dumps(quotes_data, indent=2)
+            quotes_data = [quote for batch in self._quote_export_batches(date_filter) for quote in batch]
+            return dumps(quotes_data, indent=True)
             
         elif entity_type == "partners":
             # Export partner performance
             partners = self.get_partner_performance(start_date, end_date)
-            return json.dumps(partners, indent=2)
+            return dumps(partners, indent=True)
             
         elif entity_type == "regions":
             # Export regional performance
             regions = self.get_regional_performance(start_date, end_date)
-            return json.dumps(regions, indent=2)
+            return dumps(regions, indent=True)
             
         elif entity_type == "financial":
             # Export financial report
             financial = self.generate_financial_report(start_date, end_date)
-            return json.dumps(financial, indent=2)
+            return dumps(financial, indent=True)
             
         else:
             # Invalid entity type
-            return json.dumps({"error": "Invalid entity type"})
+            return dumps({"error": "Invalid entity type"})
 
 
 # API endpoints for analytics
 @router.get("/analytics/performance", response_model=PerformanceMetrics)
 def get_performance_metrics(
+    request: Request,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     partner_id: Optional[int] = None,
@@ -819,60 +838,71 @@ def get_performance_metrics(
 ):
     """Get key performance metrics"""
     service = AnalyticsService(db)
-    return service.get_performance_metrics(start_date, end_date, partner_id)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.get_performance_metrics(start_date, end_date, partner_id))
 
 @router.get("/analytics/timeseries/{metric}", response_model=List[Dict[str, Any]])
 def get_time_series(
     metric: str,
     start_date: datetime,
     end_date: datetime,
+    request: Request,
     time_unit: str = "day",
     partner_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """Get time series data for a specific metric"""
     service = AnalyticsService(db)
-    return service.get_time_series_data(metric, start_date, end_date, time_unit, partner_id)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.get_time_series_data(metric, start_date, end_date, time_unit, partner_id))
 
 @router.get("/analytics/regions", response_model=List[Dict[str, Any]])
 def get_regional_performance(
     start_date: datetime,
     end_date: datetime,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Get performance metrics by region"""
     service = AnalyticsService(db)
-    return service.get_regional_performance(start_date, end_date)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.get_regional_performance(start_date, end_date))
 
 @router.get("/analytics/partners", response_model=List[Dict[str, Any]])
 def get_partner_performance(
     start_date: datetime,
     end_date: datetime,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Get performance metrics by partner"""
     service = AnalyticsService(db)
-    return service.get_partner_performance(start_date, end_date)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.get_partner_performance(start_date, end_date))
 
 @router.get("/analytics/tree-operations", response_model=Dict[str, Any])
 def get_tree_operation_analysis(
     start_date: datetime,
     end_date: datetime,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Analyze tree operations in quotes"""
     service = AnalyticsService(db)
-    return service.get_tree_operation_analysis(start_date, end_date)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.get_tree_operation_analysis(start_date, end_date))
 
 @router.get("/analytics/financial", response_model=Dict[str, Any])
 def get_financial_report(
     start_date: datetime,
     end_date: datetime,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Generate a financial report"""
     service = AnalyticsService(db)
-    return service.generate_financial_report(start_date, end_date)
+    return cached_aggregate(request, settings.ANALYTICS_CACHE_TTL_SECONDS, CACHE_CONTROL_ANALYTICS,
+                            lambda: service.generate_financial_report(start_date, end_date))
 
 @router.get("/analytics/export/{entity_type}")
 def export_data(
@@ -883,11 +913,37 @@ def export_data(
 ):
     """Export data as JSON"""
     service = AnalyticsService(db)
-    data = service.export_data(entity_type, start_date, end_date)
     
-    # Return as JSON response
-    return Response(
-        content=data,
+    def stream():
+        # Dependencies are torn down before a streamed body is sent, so the
+        # session used while streaming is closed here instead
+        try:
+            yield from service.iter_export(entity_type, start_date, end_date)
+        finally:
+            db.close()
+    
+    # Stream as JSON response
+    return StreamingResponse(
+        stream(),
         media_type="application/json",
         headers={"Content-Disposition": f"attachment; filename={entity_type}_{start_date.date()}_{end_date.date()}.json"}
     )
+
+@router.post("/analytics/export/{entity_type}", status_code=status.HTTP_202_ACCEPTED, response_model=Dict[str, Any])
+def submit_export(
+    entity_type: str,
+    start_date: datetime,
+    end_date: datetime,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Queue an export; once the job has succeeded the JSON file is downloaded
+    from /background-jobs/{job_id}/result
+    """
+    job = enqueue(db, "analytics.export", {
+        "entity_type": entity_type,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat()
+    }, submitted_by=current_user.id)
+    return job_accepted(job)
@@ -1,39 +1,191 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
-from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import get_db
+from app.models.user import User, UserRole
+from app.services.refresh_tokens import revocations
+from app.utils.cache import TTLCache
+
+# Single auth stack for the API; routes/auth.py and routes/__init__.py
+# re-export these dependencies
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-class User(BaseModel):
+class Principal(BaseModel):
+    """The authenticated user, as seen by route handlers"""
     id: int
-    username: str
+    email: str
     role: str
+    is_active: bool = True
+    full_name: Optional[str] = None
+    region: Optional[str] = None
+
+
+# sha256(token) -> (user id, session id), for tokens whose signature and
+# claims were verified; entries live until the token's exp
+_token_cache = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE)
+
+# user id -> Principal, so role and active status are re-read from the
+# database at most every AUTH_USER_CACHE_TTL_SECONDS, and immediately after
+# an update or delete made by this process. Other workers only see a
+# deactivation or demotion when their entry expires, so a user keeps their
+# old access there for up to the TTL; admin access is always re-checked
+# against the database (see _confirm_admin).
+_user_cache = TTLCache(maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-SECRET_KEY = "YOUR_SECRET_KEY"
-ALGORITHM = "HS256"
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
+def invalidate_user(user_id: int) -> None:
+    """Drop a user's cached role and active status"""
+    _user_cache.pop(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User) -> None:
+    invalidate_user(target.id)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _verify_token(token: str, db: Session) -> int:
+    """Verify a token's signature and claims, returning the user id"""
+    revocations.sync(db)
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        user_id, session_id = cached
+        # Mobile access tokens die with their session on logout
+        if revocations.is_family_revoked(session_id):
+            raise _credentials_exception()
+        return user_id
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = int(payload.get("sub"))
-        username: str = payload.get("username")
-        role: str = payload.get("role")
-        if user_id is None or username is None or role is None:
-            raise credentials_exception
-        user = User(id=user_id, username=username, role=role)
-        return user
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+
+    # Refresh tokens are only accepted by the refresh endpoints
+    if payload.get("type") == "refresh":
+        raise _credentials_exception()
+
+    session_id = payload.get("sid")
+    if revocations.is_family_revoked(session_id):
+        raise _credentials_exception()
+
+    user_id = payload.get("id")
+    if user_id is None:
+        email = payload.get("sub")
+        if email is None:
+            raise _credentials_exception()
+        user_id = db.query(User.id).filter(User.email == email).scalar()
+        if user_id is None:
+            raise _credentials_exception()
+
+    # jose has already rejected expired tokens, so the TTL is positive
+    exp = payload.get("exp")
+    if exp is not None:
+        _token_cache.set(key, (int(user_id), session_id), ttl=exp - time.time())
+    return int(user_id)
+
+
+def load_principal(user_id: int, db: Session, fresh: bool = False) -> Optional[Principal]:
+    """Get a user's Principal, from the user cache when possible unless fresh"""
+    principal = None if fresh else _user_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    row = db.query(
+        User.id, User.email, User.role, User.is_active, User.full_name, User.region
+    ).filter(User.id == user_id).first()
+    if row is None:
+        return None
+
+    principal = Principal(
+        id=row.id,
+        email=row.email,
+        role=row.role.value if isinstance(row.role, UserRole) else row.role,
+        is_active=bool(row.is_active),
+        full_name=row.full_name,
+        region=row.region,
+    )
+    _user_cache.set(user_id, principal)
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    Authenticate the request's bearer token
+
+    Verified tokens and user status are cached in process, so a repeat
+    request with the same token needs no JWT decode and no database query.
+
+    Returns:
+        The authenticated, active user
+    """
+    principal = load_principal(_verify_token(token, db), db)
+    if principal is None or not principal.is_active:
+        raise _credentials_exception()
+    return principal
+
+
+def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    # Inactive users are already rejected by get_current_user
+    return current_user
+
+
+def _confirm_admin(current_user: Principal, db: Session) -> Principal:
+    """
+    Re-read a cached admin from the database, so a deactivation or demotion
+    made on another worker takes effect at once for admin powers
+    """
+    if current_user.role != UserRole.ADMIN:
+        return current_user
+    principal = load_principal(current_user.id, db, fresh=True)
+    if principal is None or not principal.is_active:
+        raise _credentials_exception()
+    return principal
+
+
+def get_current_admin_user(current_user: Principal = Depends(get_current_user),
+                           db: Session = Depends(get_db)) -> Principal:
+    current_user = _confirm_admin(current_user, db)
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    return current_user
+
+
+def get_current_partner_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if current_user.role != UserRole.PARTNER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    return current_user
+
 
 def require_roles(*allowed_roles: str):
-    def role_checker(current_user: User = Depends(get_current_user)):
+    def role_checker(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+        current_user = _confirm_admin(current_user, db)
         if current_user.role.lower() not in [r.lower() for r in allowed_roles]:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
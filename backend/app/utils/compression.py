@@ -0,0 +1,230 @@
+import logging
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Brotli and zstd are optional; without them the middleware falls back to gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on installed extras
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on installed extras
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.process(data) + self._obj.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.compress(data) + self._obj.flush()
+
+
+def available_encodings() -> List[str]:
+    """Encodings the installed libraries can produce"""
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: str, preferred: Iterable[str]) -> Optional[str]:
+    """
+    Pick the response encoding for an Accept-Encoding header
+
+    Args:
+        header: Accept-Encoding request header
+        preferred: Server-side preference order, e.g. ["br", "zstd", "gzip"]
+
+    Returns:
+        Chosen encoding, or None to send the response uncompressed
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in preferred:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with gzip, brotli or zstd.
+
+    Only responses whose content type is on the allow-list and whose body is
+    at least minimum_size bytes are compressed. Streaming responses are
+    compressed chunk by chunk with a flush after each chunk, so exports reach
+    the client while they are still being generated.
+
+    Strong ETags are weakened on compressed responses (as nginx does), since
+    the compressed bytes differ from the identity representation; If-None-Match
+    uses weak comparison so conditional GETs keep working.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        encodings: Iterable[str] = ("br", "zstd", "gzip"),
+        content_types: Iterable[str] = ("application/json",),
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        available = available_encodings()
+        self.encodings = [e for e in encodings if e in available]
+        self.content_types = tuple(content_types)
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+
+        skipped = [e for e in encodings if e not in available]
+        if skipped:
+            logger.info(f"Compression encodings not available, skipping: {', '.join(skipped)}")
+
+    def _compressor(self, encoding: str):
+        level = self.levels[encoding]
+        if encoding == "br":
+            return _BrotliCompressor(level)
+        if encoding == "zstd":
+            return _ZstdCompressor(level)
+        return _GzipCompressor(level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Per-request state: buffers the start message until the first body chunk"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.inner_send = send
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return content_type.startswith(self.middleware.content_types)
+
+    def _rewrite_headers(self, headers: MutableHeaders, length: Optional[int]) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.inner_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            small = not more_body and len(body) < self.middleware.minimum_size
+            if small or not self._should_compress(headers):
+                self.passthrough = True
+                await self.inner_send(self.start_message)
+                await self.inner_send(message)
+                return
+
+            self.compressor = self.middleware._compressor(self.encoding)
+            if not more_body:
+                # Whole body in one message: compress in one go with a real length
+                data = self.compressor.finish(body)
+                self._rewrite_headers(headers, len(data))
+                await self.inner_send(self.start_message)
+                await self.inner_send({"type": "http.response.body", "body": data})
+                return
+
+            self._rewrite_headers(headers, None)
+            await self.inner_send(self.start_message)
+
+        data = self.compressor.compress(body) if more_body else self.compressor.finish(body)
+        await self.inner_send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+def split_setting(value: str) -> Tuple[str, ...]:
+    """Split a comma separated setting into a tuple of lower-case values"""
+    return tuple(v.strip().lower() for v in value.split(",") if v.strip())
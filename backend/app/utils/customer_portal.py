@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import jwt
 import json
@@ -10,10 +10,21 @@ from pydantic import BaseModel
 import secrets
 import hashlib
 
+from app.config import settings
 from app.database import get_db
 from app.models.user import User, UserRole
 from app.models.lead import Lead, LeadStatus
 from app.models.quote import Quote, QuoteItem, QuoteStatus
+from app.models.customer import Customer, normalize_email
+from app.models.customer_access_token import CustomerAccessToken
+from app.models.notification import Notification, NotificationChannel, NotificationType
+from app.services.customer_access_tokens import CustomerAccessTokenService, invalidate_quote
+from app.services.customer_linking import link_leads_to_customer
+from app.services.job_queue import enqueue
+from app.services.lead_state_machine import CUSTOMER, transition
+from app.services.quote_renders import QuoteRenderService
+from app.utils.auth import require_roles
+from app.utils.http_cache import CACHE_CONTROL_DETAIL, cache_headers, etag_matches, not_modified
 from app.utils.notification_service import EmailNotificationService
 
 # Configure logging
@@ -60,10 +71,15 @@ class CustomerPortalService:
         """
         Generate a secure access token for customer to access their quote
         
+        Only sent quotes get links. The link points at the rendering made
+        when the quote was sent (JSON and HTML), so viewing the quote never
+        touches the lead and quote tables and always shows the prices the
+        customer answers to.
+        
         Args:
             lead_id: Lead ID
             quote_id: Quote ID
-            
+        
         Returns:
             Secure access token
         """
@@ -75,80 +91,45 @@ class CustomerPortalService:
         quote = self.db.query(Quote).filter(Quote.id == quote_id, Quote.lead_id == lead_id).first()
         if not quote:
             raise HTTPException(status_code=404, detail="Quote not found")
+        if quote.status != QuoteStatus.SENT:
+            raise HTTPException(status_code=400, detail="Only sent quotes can be shared with the customer")
         
-        # Generate token with expiration (30 days)
-        expires = datetime.utcnow() + timedelta(days=30)
-        
-        # Create token payload
-        payload = {
-            "sub": lead.customer_email,
-            "lead_id": lead.id,
-            "quote_id": quote.id,
-            "customer_name": lead.customer_name,
-            "exp": expires
-        }
-        
-        # Sign token
-        token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-        
-        # Store token hash in database for verification
-        token_hash = hashlib.sha256(token.encode()).hexdigest()
-        
-        # In a real implementation, this would store the token hash in a database table
-        # For this example, we'll just log it
-        logger.info(f"Generated customer access token for lead {lead_id}, quote {quote_id}: {token_hash}")
-        
+        if quote.render_hash is None:
+            # Sent before quotes were rendered on send; a sent quote no longer changes
+            quote.render_hash = self.render_quote(lead, quote)
+        token, _ = CustomerAccessTokenService(self.db).issue(lead.id, quote.id, lead.customer_email,
+                                                             quote.render_hash)
         return token
     
-    def verify_customer_access_token(self, token: str) -> Dict[str, Any]:
+    def render_quote(self, lead: Lead, quote: Quote) -> str:
+        """Render the customer page of a quote as it is now; does not commit"""
+        return QuoteRenderService(self.db).render(quote.id, self.build_quote_snapshot(lead, quote))
+    
+    def verify_customer_access_token(self, token: str) -> CustomerAccessToken:
         """
         Verify a customer access token
         
         Args:
             token: Access token
-            
+        
         Returns:
-            Dict with token payload if valid
+            The stored token if it is neither expired nor revoked
         """
-        try:
-            # Decode token
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            
-            # Check if token is expired
-            if "exp" in payload and datetime.fromtimestamp(payload["exp"]) < datetime.utcnow():
-                raise HTTPException(status_code=401, detail="Token expired")
-            
-            # In a real implementation, this would verify the token hash in the database
-            # For this example, we'll just return the payload
-            
-            return payload
-        except jwt.JWTError:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        return CustomerAccessTokenService(self.db).resolve(token)
     
-    def get_customer_quote(self, token_payload: Dict[str, Any]) -> Dict[str, Any]:
+    def build_quote_snapshot(self, lead: Lead, quote: Quote) -> Dict[str, Any]:
         """
         Get quote details for customer
         
         Args:
-            token_payload: Verified token payload
-            
+            lead: Lead the quote belongs to
+            quote: Quote
+        
         Returns:
             Dict with quote details
         """
-        lead_id = token_payload.get("lead_id")
-        quote_id = token_payload.get("quote_id")
-        
-        # Get lead and quote
-        lead = self.db.query(Lead).filter(Lead.id == lead_id).first()
-        if not lead:
-            raise HTTPException(status_code=404, detail="Lead not found")
-        
-        quote = self.db.query(Quote).filter(Quote.id == quote_id, Quote.lead_id == lead_id).first()
-        if not quote:
-            raise HTTPException(status_code=404, detail="Quote not found")
-        
         # Get quote items
-        items = self.db.query(QuoteItem).filter(QuoteItem.quote_id == quote_id).all()
+        items = self.db.query(QuoteItem).filter(QuoteItem.quote_id == quote.id).all()
         
         # Format items
         formatted_items = []
@@ -176,6 +157,7 @@ class CustomerPortalService:
             "created_at": quote.created_at,
             "sent_at": quote.sent_at,
             "expires_at": quote.sent_at + timedelta(days=30) if quote.sent_at else None,
+            "customer_response_at": quote.customer_response_at,
             "items": formatted_items,
             "customer": {
                 "name": lead.customer_name,
@@ -191,20 +173,36 @@ class CustomerPortalService:
             } if partner else None
         }
     
-    def process_customer_response(self, token_payload: Dict[str, Any], 
+    def get_customer_quote(self, token: str) -> Tuple[str, tuple]:
+        """
+        Get the pre-rendered quote for customer
+        
+        Args:
+            token: Access token
+        
+        Returns:
+            (content hash, (json body, html body))
+        """
+        return CustomerAccessTokenService(self.db).get_view(token)
+    
+    def process_customer_response(self, access_token: CustomerAccessToken,
                                  response: CustomerQuoteResponse) -> Dict[str, Any]:
         """
         Process customer response to quote (approve/decline)
         
         Args:
-            token_payload: Verified token payload
+            access_token: Verified access token
             response: Customer response
-            
+        
         Returns:
             Dict with updated quote status
         """
-        lead_id = token_payload.get("lead_id")
-        quote_id = token_payload.get("quote_id")
+        lead_id = access_token.lead_id
+        quote_id = access_token.quote_id
+        
+        # A quote is answered once, whichever of its links is used
+        if access_token.responded_at is not None:
+            raise HTTPException(status_code=409, detail="Quote has already been responded to")
         
         # Get lead and quote
         lead = self.db.query(Lead).filter(Lead.id == lead_id).first()
@@ -225,19 +223,22 @@ class CustomerPortalService:
         
         # Process response
         if response.decision.lower() == "approve":
-            # Update quote status
-            quote.status = QuoteStatus.APPROVED
-            lead.status = LeadStatus.APPROVED
+            quote_status, lead_status = QuoteStatus.APPROVED, LeadStatus.APPROVED
+            notification_type = NotificationType.QUOTE_APPROVED
         elif response.decision.lower() == "decline":
-            # Update quote status
-            quote.status = QuoteStatus.DECLINED
-            lead.status = LeadStatus.DECLINED
+            quote_status, lead_status = QuoteStatus.DECLINED, LeadStatus.DECLINED
+            notification_type = NotificationType.QUOTE_DECLINED
         else:
             raise HTTPException(status_code=400, detail="Invalid decision")
         
-        # Update response timestamp
-        quote.customer_response_at = datetime.utcnow()
-        lead.customer_response_at = datetime.utcnow()
+        # The lead's customer_response_at is set by the transition
+        now = datetime.utcnow()
+        try:
+            transition(lead, lead_status, CUSTOMER, now=now)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        quote.status = quote_status
+        quote.customer_response_at = now
         
         # Save feedback if provided
         if response.feedback:
@@ -249,15 +250,33 @@ class CustomerPortalService:
             # In a real implementation, this would store the modification request in a database table
             logger.info(f"Customer modification request for quote {quote_id}: {response.modification_request}")
         
-        # Save changes
+        # Save changes, closing the quote's links for further responses and
+        # re-rendering their page with the new status
         self.db.add(quote)
         self.db.add(lead)
+        self.db.flush()
+        quote.render_hash = self.render_quote(lead, quote)
+        CustomerAccessTokenService(self.db).mark_responded(quote.id, quote.render_hash)
+        
+        # Tell the partner by email, queued with the response so it is sent only if the response is saved
+        if lead.assigned_partner_id is not None:
+            decision = "approved" if quote_status == QuoteStatus.APPROVED else "declined"
+            notification = Notification(
+                user_id=lead.assigned_partner_id,
+                type=notification_type,
+                channel=NotificationChannel.EMAIL,
+                title=f"Quote {quote.id} {decision} by {lead.customer_name}",
+                content=f"{lead.customer_name} {decision} quote {quote.id} for lead {lead.id}."
+                        + (f"\n\nFeedback: {response.feedback}" if response.feedback else ""),
+                lead_id=lead.id,
+                quote_id=quote.id,
+                tracking_id=str(uuid.uuid4()),
+            )
+            self.db.add(notification)
+            self.db.flush()
+            enqueue(self.db, "notifications.send_email", {"notification_id": notification.id}, commit=False)
         self.db.commit()
-        
-        # Send notification to partner
-        if self.background_tasks:
-            notification_service = EmailNotificationService(self.db, self.background_tasks)
-            notification_service.send_quote_status_notification(quote_id, response.decision.lower())
+        invalidate_quote(quote.id)
         
         return {
             "quote_id": quote.id,
@@ -266,6 +285,19 @@ class CustomerPortalService:
             "response_at": quote.customer_response_at
         }
     
+    def revoke_quote_access_tokens(self, quote_id: int) -> Dict[str, Any]:
+        """
+        Revoke every customer link to a quote
+        
+        Args:
+            quote_id: Quote ID
+        
+        Returns:
+            Dict with the number of revoked tokens
+        """
+        revoked = CustomerAccessTokenService(self.db).revoke_for_quote(quote_id)
+        return {"quote_id": quote_id, "revoked": revoked}
+    
     def register_customer(self, registration: CustomerRegistration) -> Dict[str, Any]:
         """
         Register a new customer in the portal
@@ -276,8 +308,10 @@ class CustomerPortalService:
         Returns:
             Dict with registration status
         """
+        email = normalize_email(registration.email)
+        
         # Check if email already exists
-        existing_customer = self.db.query(Customer).filter(Customer.email == registration.email).first()
+        existing_customer = self.db.query(Customer.id).filter(Customer.email == email).first()
         if existing_customer:
             raise HTTPException(status_code=400, detail="Email already registered")
         
@@ -286,7 +320,7 @@ class CustomerPortalService:
         
         # Create customer record
         customer = Customer(
-            email=registration.email,
+            email=email,
             name=registration.name,
             phone=registration.phone,
             hashed_password=hash_password(registration.password),
@@ -331,8 +365,12 @@ class CustomerPortalService:
         customer.verification_token = None
         customer.verified_at = datetime.utcnow()
         
+        # Attach the leads the customer submitted before registering
+        linked = link_leads_to_customer(self.db, customer)
+        
         self.db.add(customer)
         self.db.commit()
+        logger.info(f"Verified customer {customer.id}, linked {linked} leads")
         
         return {
             "customer_id": customer.id,
@@ -351,7 +389,7 @@ class CustomerPortalService:
             Dict with authentication token
         """
         # Find customer by email
-        customer = self.db.query(Customer).filter(Customer.email == login.email).first()
+        customer = self.db.query(Customer).filter(Customer.email == normalize_email(login.email)).first()
         if not customer:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
@@ -388,39 +426,26 @@ class CustomerPortalService:
         Returns:
             List of quotes
         """
-        # Get customer
-        customer = self.db.query(Customer).filter(Customer.id == customer_id).first()
-        if not customer:
+        # One indexed query over the customer's leads (leads.customer_id)
+        # joined to their quotes
+        rows = self.db.query(
+            Quote.id.label("quote_id"),
+            Lead.id.label("lead_id"),
+            Quote.status,
+            Quote.total_amount,
+            Quote.created_at,
+            Quote.sent_at,
+            Quote.customer_response_at,
+            Lead.address,
+            Lead.city
+        ).join(Lead, Quote.lead_id == Lead.id).filter(
+            Lead.customer_id == customer_id
+        ).order_by(Quote.created_at.desc()).all()
+        
+        if not rows and self.db.query(Customer.id).filter(Customer.id == customer_id).first() is None:
             raise HTTPException(status_code=404, detail="Customer not found")
         
-        # Find leads with this customer's email
-        leads = self.db.query(Lead).filter(Lead.customer_email == customer.email).all()
-        if not leads:
-            return []
-        
-        lead_ids = [lead.id for lead in leads]
-        
-        # Get quotes for these leads
-        quotes = self.db.query(Quote).filter(Quote.lead_id.in_(lead_ids)).all()
-        
-        # Format quotes
-        result = []
-        for quote in quotes:
-            lead = next((l for l in leads if l.id == quote.lead_id), None)
-            if lead:
-                result.append({
-                    "quote_id": quote.id,
-                    "lead_id": lead.id,
-                    "status": quote.status,
-                    "total_amount": quote.total_amount,
-                    "created_at": quote.created_at,
-                    "sent_at": quote.sent_at,
-                    "customer_response_at": quote.customer_response_at,
-                    "address": lead.address,
-                    "city": lead.city
-                })
-        
-        return result
+        return [dict(row._mapping) for row in rows]
 
 
 # Helper functions for password hashing and token creation
@@ -443,25 +468,6 @@ def create_access_token(data: dict, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
-# Define Customer model (would be in models/customer.py in a real implementation)
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
-from app.database import Base
-
-class Customer(Base):
-    __tablename__ = "customers"
-
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True, nullable=False)
-    name = Column(String, nullable=False)
-    phone = Column(String, nullable=True)
-    hashed_password = Column(String, nullable=False)
-    is_verified = Column(Boolean, default=False)
-    verification_token = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False)
-    verified_at = Column(DateTime(timezone=True), nullable=True)
-    last_login = Column(DateTime(timezone=True), nullable=True)
-
-
 # API endpoints for customer portal
 @router.post("/customer/register", response_model=Dict[str, Any])
 def register_customer(
@@ -504,13 +510,25 @@ def get_customer_quotes(
     service = CustomerPortalService(db)
     return service.get_customer_quotes(customer_id)
 
+def _require_quote_owner(db: Session, quote_id: int, current_user) -> None:
+    """Only admins and the partner assigned to the quote's lead may manage its customer links"""
+    partner_id = db.query(Lead.assigned_partner_id).join(Quote, Quote.lead_id == Lead.id).filter(
+        Quote.id == quote_id
+    ).first()
+    if partner_id is None:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    if current_user.role != UserRole.ADMIN and partner_id[0] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to manage links to this quote")
+
 @router.post("/quotes/{quote_id}/access-token", response_model=Dict[str, Any])
 def generate_quote_access_token(
     quote_id: int,
     lead_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user=Depends(require_roles("admin", "partner"))
 ):
     """Generate an access token for a customer to view a quote"""
+    _require_quote_owner(db, quote_id, current_user)
     service = CustomerPortalService(db)
     token = service.generate_customer_access_token(lead_id, quote_id)
     
@@ -518,18 +536,43 @@ def generate_quote_access_token(
         "access_token": token,
         "quote_id": quote_id,
         "lead_id": lead_id,
-        "expires_in": 30 * 24 * 60 * 60  # 30 days in seconds
+        "expires_in": settings.CUSTOMER_ACCESS_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
     }
 
+@router.delete("/quotes/{quote_id}/access-tokens", response_model=Dict[str, Any])
+def revoke_quote_access_tokens(
+    quote_id: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(require_roles("admin", "partner"))
+):
+    """Revoke every customer access token for a quote"""
+    _require_quote_owner(db, quote_id, current_user)
+    service = CustomerPortalService(db)
+    return service.revoke_quote_access_tokens(quote_id)
+
 @router.get("/quotes/view", response_model=Dict[str, Any])
 def view_quote_with_token(
     token: str,
+    request: Request,
+    format: str = "json",
     db: Session = Depends(get_db)
 ):
-    """View a quote using an access token"""
+    """View a quote using an access token, as JSON or as an HTML page"""
+    if format not in ("json", "html"):
+        raise HTTPException(status_code=400, detail="format must be json or html")
+    
     service = CustomerPortalService(db)
-    payload = service.verify_customer_access_token(token)
-    return service.get_customer_quote(payload)
+    content_hash, (json_body, html_body) = service.get_customer_quote(token)
+    
+    # Renderings are content-addressed, so their hash is the ETag
+    etag = f'"{content_hash[:32]}-{format}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, CACHE_CONTROL_DETAIL)
+    if format == "html":
+        return Response(content=html_body, media_type="text/html",
+                        headers=cache_headers(etag, CACHE_CONTROL_DETAIL))
+    return Response(content=json_body, media_type="application/json",
+                    headers=cache_headers(etag, CACHE_CONTROL_DETAIL))
 
 @router.post("/quotes/respond", response_model=Dict[str, Any])
 def respond_to_quote(
@@ -540,8 +583,8 @@ def respond_to_quote(
 ):
     """Respond to a quote (approve/decline)"""
     service = CustomerPortalService(db, background_tasks)
-    payload = service.verify_customer_access_token(token)
-    return service.process_customer_response(payload, response)
+    access_token = service.verify_customer_access_token(token)
+    return service.process_customer_response(access_token, response)
 
 @router.get("/customer-portal/settings", response_model=CustomerPortalSettings)
 def get_customer_portal_settings(
@@ -0,0 +1,117 @@
+import hashlib
+from typing import Any, Callable, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.responses import T24JSONResponse, dumps
+
+# Cache-Control per route class. Entity reads must always revalidate, since
+# a partner may change them from another device; aggregates tolerate a short
+# max-age.
+CACHE_CONTROL_DETAIL = "private, no-cache"
+CACHE_CONTROL_ANALYTICS = f"private, max-age={settings.ANALYTICS_CACHE_TTL_SECONDS}"
+CACHE_CONTROL_KPI = f"private, max-age={settings.KPI_CACHE_TTL_SECONDS}"
+
+# Serialized aggregate payloads keyed by request, so repeat reads within the
+# TTL skip both the database and serialization
+_aggregate_cache = TTLCache(maxsize=settings.AGGREGATE_CACHE_SIZE)
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a strong ETag from validator values, e.g. ids, versions and
+    updated_at timestamps of the rows a response is built from
+    """
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def body_etag(body: bytes) -> str:
+    """Build a strong ETag from a serialized payload"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _normalize_tag(tag: str) -> str:
+    """Strip the weak prefix, since If-None-Match uses weak comparison"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the request's If-None-Match header matches an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_normalize_tag(tag) == etag for tag in header.split(","))
+
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
+
+
+def conditional_response(request: Request, etag: str, cache_control: str,
+                         build: Callable[[], Any]) -> Response:
+    """
+    Answer a conditional GET for an entity read
+
+    Args:
+        request: Incoming request
+        etag: ETag computed from cheap validator columns
+        cache_control: Cache-Control value for the route class
+        build: Loads and returns the full payload; only called on a miss
+
+    Returns:
+        304 response if the client's copy is current, else the payload
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return T24JSONResponse(build(), headers=cache_headers(etag, cache_control))
+
+
+def request_key(request: Request, *extra: Hashable) -> tuple:
+    """Cache key for a request: path plus sorted query parameters"""
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())), *extra)
+
+
+def cached_aggregate(request: Request, ttl: int, cache_control: str,
+                     build: Callable[[], Any], key: Optional[Hashable] = None) -> Response:
+    """
+    Serve an aggregate payload with a payload-hash ETag
+
+    The serialized body is kept in an in-process cache for ttl seconds.
+    Within that window repeat reads are served from memory, or answered
+    with 304 when the client already holds the same payload.
+
+    Args:
+        request: Incoming request
+        ttl: Seconds to keep the serialized payload
+        cache_control: Cache-Control value for the route class
+        build: Computes the payload on a cache miss
+        key: Cache key, defaults to the request path and query parameters
+
+    Returns:
+        304 response or JSON response with ETag and Cache-Control headers
+    """
+    key = key if key is not None else request_key(request)
+    entry = _aggregate_cache.get(key)
+    if entry is None:
+        body = dumps(build())
+        entry = (body_etag(body), body)
+        _aggregate_cache.set(key, entry, ttl)
+
+    etag, body = entry
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return Response(content=body, media_type="application/json",
+                    headers=cache_headers(etag, cache_control))
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-import jwt
 import json
 import logging
 import uuid
@@ -13,7 +13,17 @@ from app.models.user import User, UserRole
 from app.models.lead import Lead, LeadStatus
 from app.models.quote import Quote, QuoteItem, QuoteStatus
 from app.models.notification import Notification, NotificationType
+from app.models.change_log import ChangeLog, ChangeEntity, ChangeOperation
+from app.models.mobile_device import MobileDevice, PushProvider
 from app.config import settings
+from app.services.change_tracking import visibility_horizon
+from app.services.etag_service import ETagService
+from app.services.lead_state_machine import transition
+from app.services.refresh_tokens import RefreshTokenService
+from app.utils.auth import Principal, create_access_token, get_current_user, load_principal
+from app.utils.passwords import login_throttle, verify_and_update_sync
+from app.utils.http_cache import CACHE_CONTROL_DETAIL, conditional_response
+from app.utils.responses import T24JSONResponse, rows_response, schema_columns
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +39,7 @@ class MobileAuthRequest(BaseModel):
     device_id: str
     device_type: str
     push_token: Optional[str] = None
+    push_provider: PushProvider = PushProvider.FCM
 
 class MobileAuthResponse(BaseModel):
     access_token: str
@@ -45,6 +56,7 @@ class MobileDeviceInfo(BaseModel):
     device_id: str
     device_type: str
     push_token: Optional[str] = None
+    push_provider: PushProvider = PushProvider.FCM
     app_version: Optional[str] = None
     os_version: Optional[str] = None
 
@@ -75,6 +87,87 @@ class MobileNotification(BaseModel):
     lead_id: Optional[int] = None
     quote_id: Optional[int] = None
 
+# Projections for the summary shapes, so list endpoints never load full Lead
+# entities (summary/details text) or populate the identity map
+MOBILE_LEAD_COLUMNS = schema_columns(Lead, MobileLeadSummary)
+MOBILE_QUOTE_COLUMNS = [
+    Quote.id,
+    Quote.lead_id,
+    Lead.customer_name,
+    Quote.total_amount,
+    Quote.status,
+    Quote.created_at,
+    Quote.sent_at,
+]
+
+class MobileSyncResponse(BaseModel):
+    leads: List[Dict[str, Any]]
+    quotes: List[Dict[str, Any]]
+    quote_items: List[Dict[str, Any]]
+    notifications: List[Dict[str, Any]]
+    deleted: Dict[str, List[int]]
+    next_token: str
+    has_more: bool
+
+# Projections for delta sync, one per synced entity type
+SYNC_LEAD_COLUMNS = [
+    Lead.id,
+    Lead.customer_name,
+    Lead.customer_email,
+    Lead.customer_phone,
+    Lead.address,
+    Lead.city,
+    Lead.postal_code,
+    Lead.region,
+    Lead.summary,
+    Lead.details,
+    Lead.status,
+    Lead.assigned_at,
+    Lead.accepted_at,
+    Lead.quoted_at,
+    Lead.customer_response_at,
+    Lead.created_at,
+    Lead.updated_at,
+    Lead.expires_at,
+]
+SYNC_QUOTE_COLUMNS = [
+    Quote.id,
+    Quote.lead_id,
+    Quote.status,
+    Quote.total_amount,
+    Quote.commission_amount,
+    Quote.sent_at,
+    Quote.customer_response_at,
+    Quote.created_at,
+    Quote.updated_at,
+]
+SYNC_QUOTE_ITEM_COLUMNS = [
+    QuoteItem.id,
+    QuoteItem.quote_id,
+    QuoteItem.quantity,
+    QuoteItem.tree_species,
+    QuoteItem.operation_type,
+    QuoteItem.custom_operation,
+    QuoteItem.cost,
+    QuoteItem.updated_at,
+]
+SYNC_NOTIFICATION_COLUMNS = schema_columns(Notification, MobileNotification)
+
+SYNC_COLUMNS = {
+    ChangeEntity.LEAD: SYNC_LEAD_COLUMNS,
+    ChangeEntity.QUOTE: SYNC_QUOTE_COLUMNS,
+    ChangeEntity.QUOTE_ITEM: SYNC_QUOTE_ITEM_COLUMNS,
+    ChangeEntity.NOTIFICATION: SYNC_NOTIFICATION_COLUMNS,
+}
+
+# Response key for each synced entity type
+SYNC_KEYS = {
+    ChangeEntity.LEAD: "leads",
+    ChangeEntity.QUOTE: "quotes",
+    ChangeEntity.QUOTE_ITEM: "quote_items",
+    ChangeEntity.NOTIFICATION: "notifications",
+}
+
 class MobileApiService:
     """
     Service for handling mobile API functionality for the T24 Arborist Lead System.
@@ -98,32 +191,20 @@ class MobileApiService:
         """
         # Find user by email
         user = self.db.query(User).filter(User.email == email).first()
-        if not user:
+        if not user or not verify_and_update_sync(self.db, user, password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        # Verify password (in a real system, this would use bcrypt or similar)
-        # For this example, we'll assume the password verification logic is implemented elsewhere
-        # and just check if the user exists
-        
-        # Generate tokens
-        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        refresh_token_expires = timedelta(days=30)  # Refresh token valid for 30 days
+        if not user.is_active:
+            raise HTTPException(status_code=401, detail="User not found or inactive")
         
-        access_token = self._create_access_token(
-            data={"sub": user.email, "id": user.id, "role": user.role},
-            expires_delta=access_token_expires
-        )
+        # Start a new session for this device
+        refresh_token, session = RefreshTokenService(self.db).issue(user.id, device_info.device_id)
         
-        refresh_token = self._create_refresh_token(
-            data={"sub": user.email, "id": user.id, "device_id": device_info.device_id},
-            expires_delta=refresh_token_expires
-        )
-        
-        # Store device info and push token
-        self._update_device_info(user.id, device_info)
+        # Store device info and push token (commits the refresh token too)
+        self.register_device(user.id, device_info)
         
         return {
-            "access_token": access_token,
+            "access_token": self._create_access_token(user.id, user.email, user.role, session.family_id),
             "refresh_token": refresh_token,
             "user_id": user.id,
             "role": user.role,
@@ -132,96 +213,136 @@ class MobileApiService:
     
     def refresh_token(self, refresh_token: str, device_id: str) -> Dict[str, Any]:
         """
-        Refresh an access token using a refresh token
+        Rotate a refresh token and issue a new access token
         
         Args:
             refresh_token: The refresh token
-            device_id: The device ID that was used to generate the original token
+            device_id: The device ID the refresh token was issued to
             
         Returns:
-            Dict containing new access token and expiration
+            Dict containing new access and refresh tokens and expiration
         """
-        try:
-            payload = jwt.decode(
-                refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-            )
-            email = payload.get("sub")
-            user_id = payload.get("id")
-            token_device_id = payload.get("device_id")
-            
-            if email is None or user_id is None:
-                raise HTTPException(status_code=401, detail="Invalid refresh token")
-            
-            # Verify device ID matches
-            if token_device_id != device_id:
-                raise HTTPException(status_code=401, detail="Invalid device")
-            
-            # Get user
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if not user or not user.is_active:
-                raise HTTPException(status_code=401, detail="User not found or inactive")
-            
-            # Generate new access token
-            access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = self._create_access_token(
-                data={"sub": user.email, "id": user.id, "role": user.role},
-                expires_delta=access_token_expires
-            )
-            
-            return {
-                "access_token": access_token,
-                "user_id": user.id,
-                "role": user.role,
-                "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
-            }
+        new_refresh_token, session = RefreshTokenService(self.db).rotate(refresh_token, device_id)
+        
+        user = load_principal(session.user_id, self.db)
+        if not user or not user.is_active:
+            raise HTTPException(status_code=401, detail="User not found or inactive")
+        
+        return {
+            "access_token": self._create_access_token(user.id, user.email, user.role, session.family_id),
+            "refresh_token": new_refresh_token,
+            "user_id": user.id,
+            "role": user.role,
+            "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        }
+    
+    def logout(self, refresh_token: str, device_id: str) -> Dict[str, Any]:
+        """
+        Revoke the session of a refresh token, including its access tokens
+        
+        Args:
+            refresh_token: The refresh token
+            device_id: The device ID the refresh token was issued to
             
-        except jwt.JWTError:
-            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        Returns:
+            Dict containing status
+        """
+        RefreshTokenService(self.db).revoke(refresh_token, device_id)
+        return {"status": "success"}
     
-    def _create_access_token(self, data: dict, expires_delta: timedelta) -> str:
-        """Create a new access token"""
-        to_encode = data.copy()
-        expire = datetime.utcnow() + expires_delta
-        to_encode.update({"exp": expire, "type": "access"})
-        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-        return encoded_jwt
+    def _create_access_token(self, user_id: int, email: str, role: str, session_id: str) -> str:
+        """Create a new access token bound to a mobile session"""
+        return create_access_token(
+            data={"sub": email, "id": user_id, "role": role, "sid": session_id, "type": "access"},
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+    
+    def register_device(self, user_id: int, device_info: MobileDeviceInfo) -> MobileDevice:
+        """Register a device, or update it and its push token if already known"""
+        device = self.db.query(MobileDevice).filter(
+            MobileDevice.user_id == user_id,
+            MobileDevice.device_id == device_info.device_id
+        ).first()
+        
+        if not device:
+            device = MobileDevice(user_id=user_id, device_id=device_info.device_id)
+        
+        device.device_type = device_info.device_type
+        device.app_version = device_info.app_version
+        device.os_version = device_info.os_version
+        device.last_active = datetime.utcnow()
+        
+        if device_info.push_token:
+            # A token belongs to one app install; drop it from any other row
+            # (e.g. another partner previously logged in on this device)
+            stale = self.db.query(MobileDevice).filter(MobileDevice.push_token == device_info.push_token)
+            if device.id:
+                stale = stale.filter(MobileDevice.id != device.id)
+            stale.update({MobileDevice.push_token: None}, synchronize_session=False)
+            device.push_token = device_info.push_token
+            device.push_provider = device_info.push_provider
+        
+        self.db.add(device)
+        self.db.commit()
+        return device
+    
+    def _require_partner(self, user_id: int) -> None:
+        """Raise 403 unless the user is a partner"""
+        role = self.db.query(User.role).filter(User.id == user_id).scalar()
+        if role != UserRole.PARTNER:
+            raise HTTPException(status_code=403, detail="Not authorized")
+    
+    def _check_view_access(self, assigned_partner_id: Optional[int], user_id: int, detail: str) -> None:
+        """Raise 403 unless the user may view an entity of the given lead"""
+        role = self.db.query(User.role).filter(User.id == user_id).scalar()
+        if role is None:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        
+        if role == UserRole.PARTNER and assigned_partner_id != user_id:
+            raise HTTPException(status_code=403, detail=detail)
     
-    def _create_refresh_token(self, data: dict, expires_delta: timedelta) -> str:
-        """Create a new refresh token"""
-        to_encode = data.copy()
-        expire = datetime.utcnow() + expires_delta
-        to_encode.update({"exp": expire, "type": "refresh"})
-        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-        return encoded_jwt
+    def get_lead_etag(self, lead_id: int, user_id: int) -> str:
+        """
+        Get the ETag of a lead's details after checking access, without
+        loading the lead or its quotes
+        
+        Args:
+            lead_id: Lead ID
+            user_id: User ID requesting the details
+            
+        Returns:
+            ETag string
+        """
+        validators = ETagService(self.db).lead_details(lead_id)
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        
+        etag, assigned_partner_id = validators
+        self._check_view_access(assigned_partner_id, user_id, "Not authorized to view this lead")
+        return etag
     
-    def _update_device_info(self, user_id: int, device_info: MobileDeviceInfo) -> None:
-        """Update or store device information for push notifications"""
-        # In a real implementation, this would store the device info in a database table
-        # For this example, we'll just log it
-        logger.info(f"Updating device info for user {user_id}: {device_info.dict()}")
-        
-        # This would typically update a MobileDevice table in the database
-        # Example:
-        # device = db.query(MobileDevice).filter(
-        #     MobileDevice.user_id == user_id,
-        #     MobileDevice.device_id == device_info.device_id
-        # ).first()
-        # 
-        # if not device:
-        #     device = MobileDevice(user_id=user_id)
-        # 
-        # device.device_id = device_info.device_id
-        # device.device_type = device_info.device_type
-        # device.push_token = device_info.push_token
-        # device.app_version = device_info.app_version
-        # device.os_version = device_info.os_version
-        # device.last_active = datetime.utcnow()
-        # 
-        # db.add(device)
-        # db.commit()
+    def get_quote_etag(self, quote_id: int, user_id: int) -> str:
+        """
+        Get the ETag of a quote's details after checking access, without
+        loading the quote or its items
+        
+        Args:
+            quote_id: Quote ID
+            user_id: User ID requesting the details
+            
+        Returns:
+            ETag string
+        """
+        validators = ETagService(self.db).quote_details(quote_id)
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Quote not found")
+        
+        etag, assigned_partner_id = validators
+        self._check_view_access(assigned_partner_id, user_id, "Not authorized to view this quote")
+        return etag
     
     def get_partner_leads(self, user_id: int, status: Optional[str] = None, 
-                         limit: int = 50, offset: int = 0) -> List[MobileLeadSummary]:
+                         limit: int = 50, offset: int = 0) -> List[Any]:
         """
         Get leads assigned to a partner
         
@@ -232,15 +353,12 @@ class MobileApiService:
             offset: Offset for pagination
             
         Returns:
-            List of lead summaries
+            List of row tuples shaped like MobileLeadSummary
         """
-        # Verify user is a partner
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or user.role != UserRole.PARTNER:
-            raise HTTPException(status_code=403, detail="Not authorized")
+        self._require_partner(user_id)
         
         # Build query
-        query = self.db.query(Lead).filter(Lead.assigned_partner_id == user_id)
+        query = self.db.query(*MOBILE_LEAD_COLUMNS).filter(Lead.assigned_partner_id == user_id)
         
         # Apply status filter if provided
         if status:
@@ -252,21 +370,7 @@ class MobileApiService:
                 pass
         
         # Get leads with pagination
-        leads = query.order_by(Lead.created_at.desc()).offset(offset).limit(limit).all()
-        
-        # Convert to response model
-        result = []
-        for lead in leads:
-            result.append(MobileLeadSummary(
-                id=lead.id,
-                customer_name=lead.customer_name,
-                city=lead.city,
-                status=lead.status,
-                created_at=lead.created_at,
-                expires_at=lead.expires_at
-            ))
-        
-        return result
+        return query.order_by(Lead.created_at.desc()).offset(offset).limit(limit).all()
     
     def get_lead_details(self, lead_id: int, user_id: int) -> Dict[str, Any]:
         """
@@ -353,24 +457,11 @@ class MobileApiService:
         if user.role == UserRole.PARTNER and lead.assigned_partner_id != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to update this lead")
         
-        # Validate status transition
+        # Validate the transition and set the status and its timestamp
         try:
-            new_status = LeadStatus(status)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid status")
-        
-        # Check if status transition is allowed
-        if not self._is_valid_status_transition(lead.status, new_status, user.role):
-            raise HTTPException(status_code=400, detail="Invalid status transition")
-        
-        # Update lead status
-        lead.status = new_status
-        
-        # Update timestamps based on status
-        if new_status == LeadStatus.ACCEPTED:
-            lead.accepted_at = datetime.utcnow()
-        elif new_status == LeadStatus.QUOTED:
-            lead.quoted_at = datetime.utcnow()
+            transition(lead, status, user.role)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         self.db.add(lead)
         self.db.commit()
@@ -382,27 +473,8 @@ class MobileApiService:
             "updated_at": lead.updated_at
         }
     
-    def _is_valid_status_transition(self, current_status: LeadStatus, new_status: LeadStatus, 
-                                   user_role: UserRole) -> bool:
-        """Check if a status transition is valid"""
-        # Define allowed transitions based on role and current status
-        if user_role == UserRole.ADMIN:
-            # Admins can make any transition
-            return True
-        
-        if user_role == UserRole.PARTNER:
-            # Partners can only make certain transitions
-            if current_status == LeadStatus.ASSIGNED:
-                return new_status in [LeadStatus.ACCEPTED, LeadStatus.REJECTED]
-            elif current_status == LeadStatus.ACCEPTED:
-                return new_status in [LeadStatus.QUOTED]
-            elif current_status == LeadStatus.QUOTED:
-                return new_status in [LeadStatus.COMPLETED]
-        
-        return False
-    
     def get_partner_quotes(self, user_id: int, status: Optional[str] = None,
-                          limit: int = 50, offset: int = 0) -> List[MobileQuoteSummary]:
+                          limit: int = 50, offset: int = 0) -> List[Any]:
         """
         Get quotes created by a partner
         
@@ -413,25 +485,14 @@ class MobileApiService:
             offset: Offset for pagination
             
         Returns:
-            List of quote summaries
+            List of row tuples shaped like MobileQuoteSummary
         """
-        # Verify user is a partner
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or user.role != UserRole.PARTNER:
-            raise HTTPException(status_code=403, detail="Not authorized")
-        
-        # Get leads assigned to this partner
-        lead_ids = [lead.id for lead in self.db.query(Lead).filter(
-            Lead.assigned_partner_id == user_id
-        ).all()]
-        
-        if not lead_ids:
-            return []
+        self._require_partner(user_id)
         
         # Build query
-        query = self.db.query(Quote, Lead).join(
+        query = self.db.query(*MOBILE_QUOTE_COLUMNS).join(
             Lead, Quote.lead_id == Lead.id
-        ).filter(Quote.lead_id.in_(lead_ids))
+        ).filter(Lead.assigned_partner_id == user_id)
         
         # Apply status filter if provided
         if status:
@@ -443,22 +504,7 @@ class MobileApiService:
                 pass
         
         # Get quotes with pagination
-        results = query.order_by(Quote.created_at.desc()).offset(offset).limit(limit).all()
-        
-        # Convert to response model
-        result = []
-        for quote, lead in results:
-            result.append(MobileQuoteSummary(
-                id=quote.id,
-                lead_id=quote.lead_id,
-                customer_name=lead.customer_name,
-                total_amount=quote.total_amount,
-                status=quote.status,
-                created_at=quote.created_at,
-                sent_at=quote.sent_at
-            ))
-        
-        return result
+        return query.order_by(Quote.created_at.desc()).offset(offset).limit(limit).all()
     
     def get_quote_details(self, quote_id: int, user_id: int) -> Dict[str, Any]:
         """
@@ -526,6 +572,126 @@ class MobileApiService:
             }
         }
     
+    def _sync_query(self, entity_type: ChangeEntity, user_id: int):
+        """Query for the entities of a type that are visible to a partner"""
+        if entity_type == ChangeEntity.LEAD:
+            return self.db.query(*SYNC_LEAD_COLUMNS).filter(Lead.assigned_partner_id == user_id)
+        if entity_type == ChangeEntity.QUOTE:
+            return self.db.query(*SYNC_QUOTE_COLUMNS).join(
+                Lead, Quote.lead_id == Lead.id
+            ).filter(Lead.assigned_partner_id == user_id)
+        if entity_type == ChangeEntity.QUOTE_ITEM:
+            return self.db.query(*SYNC_QUOTE_ITEM_COLUMNS).join(
+                Quote, QuoteItem.quote_id == Quote.id
+            ).join(
+                Lead, Quote.lead_id == Lead.id
+            ).filter(Lead.assigned_partner_id == user_id)
+        return self.db.query(*SYNC_NOTIFICATION_COLUMNS).filter(Notification.user_id == user_id)
+    
+    def sync(self, user_id: int, since: Optional[str] = None, limit: int = 500) -> Dict[str, Any]:
+        """
+        Get changes for offline use since a sync token
+        
+        Without a token, returns every entity visible to the partner plus a
+        token for the current end of the change log. With a token, reads
+        only the change log after it, so the cost is proportional to the
+        number of changes. Entities that were deleted or are no longer
+        visible (e.g. a reassigned lead) are returned as tombstones in
+        "deleted"; clients drop the quotes of a deleted lead with it.
+        
+        Args:
+            user_id: Partner user ID
+            since: Sync token from the previous response, if any
+            limit: Maximum number of changes to read
+            
+        Returns:
+            Dict with changed entities per type, tombstones, the next token
+            and whether more changes are pending
+        """
+        self._require_partner(user_id)
+        
+        result = {key: [] for key in SYNC_KEYS.values()}
+        result["deleted"] = {key: [] for key in SYNC_KEYS.values()}
+        
+        if since is None:
+            # Take the token first, so changes made while the snapshot is
+            # read are sent again on the next sync rather than lost
+            latest = self.db.query(func.max(ChangeLog.id)).filter(ChangeLog.user_id == user_id).scalar() or 0
+            settled = self._settled_head(user_id, 0)
+            if settled is not None:
+                latest = min(latest, settled)
+            for entity_type, key in SYNC_KEYS.items():
+                result[key] = [row._asdict() for row in self._sync_query(entity_type, user_id)]
+            result["next_token"] = str(latest)
+            result["has_more"] = False
+            return result
+        
+        try:
+            since_seq = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+        
+        query = self.db.query(
+            ChangeLog.id, ChangeLog.entity_type, ChangeLog.entity_id, ChangeLog.operation
+        ).filter(
+            ChangeLog.user_id == user_id,
+            ChangeLog.id > since_seq
+        )
+        settled = self._settled_head(user_id, since_seq)
+        if settled is not None:
+            query = query.filter(ChangeLog.id <= settled)
+        changes = query.order_by(ChangeLog.id).limit(limit + 1).all()
+        
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        
+        # Keep only the last operation per entity
+        latest_ops = {}
+        for change in changes:
+            latest_ops[(change.entity_type, change.entity_id)] = change.operation
+        
+        upserts = {entity_type: set() for entity_type in SYNC_KEYS}
+        for (entity_type, entity_id), operation in latest_ops.items():
+            key = SYNC_KEYS[entity_type]
+            if operation == ChangeOperation.DELETE:
+                result["deleted"][key].append(entity_id)
+            else:
+                upserts[entity_type].add(entity_id)
+        
+        for entity_type, ids in upserts.items():
+            if not ids:
+                continue
+            key = SYNC_KEYS[entity_type]
+            id_column = SYNC_COLUMNS[entity_type][0]
+            rows = self._sync_query(entity_type, user_id).filter(id_column.in_(ids)).all()
+            result[key] = [row._asdict() for row in rows]
+            
+            # Changed but no longer visible: send a tombstone instead
+            result["deleted"][key].extend(ids - {row.id for row in rows})
+        
+        result["next_token"] = str(changes[-1].id if changes else since_seq)
+        result["has_more"] = has_more
+        return result
+    
+    def _settled_head(self, user_id: int, after: int) -> Optional[int]:
+        """
+        Highest change_log id after which the user's rows may still be
+        committing, or None if all are settled. Ids are assigned at insert
+        but become visible at commit, so a sync token must stop short of
+        rows written by transactions that may still be running, as the
+        change feed does; otherwise a row committed late with a lower id
+        is skipped.
+        """
+        horizon = visibility_horizon(self.db)
+        if horizon is None:
+            return None
+        unsettled = self.db.query(func.min(ChangeLog.id)).filter(
+            ChangeLog.user_id == user_id,
+            ChangeLog.id > after,
+            ChangeLog.xid >= horizon
+        ).scalar()
+        return None if unsettled is None else unsettled - 1
+    
     def get_user_notifications(self, user_id: int, limit: int = 50, 
                               offset: int = 0) -> List[MobileNotification]:
         """
@@ -600,17 +766,27 @@ class MobileApiService:
 @router.post("/mobile/auth", response_model=MobileAuthResponse)
 def mobile_authenticate(
     auth_request: MobileAuthRequest,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Authenticate a mobile user and get tokens"""
+    client_ip = request.client.host if request.client else None
+    login_throttle.check(auth_request.email, client_ip)
+    
     service = MobileApiService(db)
     device_info = MobileDeviceInfo(
         device_id=auth_request.device_id,
         device_type=auth_request.device_type,
-        push_token=auth_request.push_token
+        push_token=auth_request.push_token,
+        push_provider=auth_request.push_provider
     )
     
-    result = service.authenticate_user(auth_request.email, auth_request.password, device_info)
+    try:
+        result = service.authenticate_user(auth_request.email, auth_request.password, device_info)
+    except HTTPException:
+        login_throttle.record_failure(auth_request.email, client_ip)
+        raise
+    login_throttle.reset(auth_request.email)
     return MobileAuthResponse(**result)
 
 @router.post("/mobile/refresh", response_model=Dict[str, Any])
@@ -623,45 +799,69 @@ def mobile_refresh_token(
     result = service.refresh_token(refresh_request.refresh_token, refresh_request.device_id)
     return result
 
+@router.post("/mobile/logout", response_model=Dict[str, Any])
+def mobile_logout(
+    refresh_request: MobileRefreshRequest,
+    db: Session = Depends(get_db)
+):
+    """Log out a device session"""
+    service = MobileApiService(db)
+    return service.logout(refresh_request.refresh_token, refresh_request.device_id)
+
+@router.post("/mobile/device-token", response_model=Dict[str, Any])
+def register_mobile_device(
+    device_info: MobileDeviceInfo,
+    request: Request = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Register or update a device and its push token"""
+    user_id = current_user.id
+    
+    service = MobileApiService(db)
+    device = service.register_device(user_id, device_info)
+    return {"status": "success", "device_id": device.device_id}
+
 @router.get("/mobile/leads", response_model=List[MobileLeadSummary])
 def get_mobile_leads(
     status: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get leads for a partner"""
-    # Extract user ID from token
-    # In a real implementation, this would use a proper authentication middleware
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
-    return service.get_partner_leads(user_id, status, limit, offset)
+    return rows_response(service.get_partner_leads(user_id, status, limit, offset))
 
 @router.get("/mobile/leads/{lead_id}", response_model=Dict[str, Any])
 def get_mobile_lead_details(
     lead_id: int,
-    request: Request = None,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get detailed information about a lead"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
-    return service.get_lead_details(lead_id, user_id)
+    etag = service.get_lead_etag(lead_id, user_id)
+    return conditional_response(request, etag, CACHE_CONTROL_DETAIL,
+                                lambda: service.get_lead_details(lead_id, user_id))
 
 @router.post("/mobile/leads/{lead_id}/status", response_model=Dict[str, Any])
 def update_mobile_lead_status(
     lead_id: int,
     status: str,
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Update the status of a lead"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
     return service.update_lead_status(lead_id, user_id, status)
@@ -672,38 +872,54 @@ def get_mobile_quotes(
     limit: int = 50,
     offset: int = 0,
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get quotes for a partner"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
-    return service.get_partner_quotes(user_id, status, limit, offset)
+    return rows_response(service.get_partner_quotes(user_id, status, limit, offset))
 
 @router.get("/mobile/quotes/{quote_id}", response_model=Dict[str, Any])
 def get_mobile_quote_details(
     quote_id: int,
-    request: Request = None,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get detailed information about a quote"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
+    
+    service = MobileApiService(db)
+    etag = service.get_quote_etag(quote_id, user_id)
+    return conditional_response(request, etag, CACHE_CONTROL_DETAIL,
+                                lambda: service.get_quote_details(quote_id, user_id))
+
+@router.get("/mobile/sync", response_model=MobileSyncResponse)
+def mobile_sync(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=2000),
+    request: Request = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get leads, quotes, quote items and notifications changed since a sync token"""
+    user_id = current_user.id
     
     service = MobileApiService(db)
-    return service.get_quote_details(quote_id, user_id)
+    return T24JSONResponse(service.sync(user_id, since, limit))
 
 @router.get("/mobile/notifications", response_model=List[MobileNotification])
 def get_mobile_notifications(
     limit: int = 50,
     offset: int = 0,
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get notifications for a user"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
     return service.get_user_notifications(user_id, limit, offset)
@@ -712,11 +928,11 @@ def get_mobile_notifications(
 def mark_mobile_notification_read(
     notification_id: int,
     request: Request = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Mark a notification as read"""
-    # Extract user ID from token
-    user_id = 1  # Placeholder, would be extracted from token
+    user_id = current_user.id
     
     service = MobileApiService(db)
     return service.mark_notification_read(notification_id, user_id)
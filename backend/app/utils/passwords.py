@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+import bcrypt
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Sample data credentials share one placeholder hash (see sample_data.py)
+_SAMPLE_HASH = "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW"
+_SAMPLE_PASSWORDS = {"admin123", "partner1"}
+
+_BCRYPT_COST = re.compile(r"^\$2[aby]\$(\d{2})\$")
+
+# bcrypt releases the GIL while hashing, so a small thread pool runs hashes
+# in parallel without blocking the event loop. Admission is bounded: at most
+# PASSWORD_HASH_MAX_PENDING hashes may be running or queued per process.
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """Hash a password with bcrypt at the configured cost"""
+    salt = bcrypt.gensalt(rounds or settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password against a hash.
+
+    This function handles both the special case of sample data credentials
+    and regular bcrypt password verification.
+    """
+    if hashed_password == _SAMPLE_HASH and plain_password in _SAMPLE_PASSWORDS:
+        return True
+
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Password verification error: {e}")
+        return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with a different cost than BCRYPT_ROUNDS"""
+    if hashed_password == _SAMPLE_HASH:
+        return False
+    match = _BCRYPT_COST.match(hashed_password or "")
+    return match is None or int(match.group(1)) != settings.BCRYPT_ROUNDS
+
+
+async def _run_bounded(fn: Callable[..., T], *args) -> T:
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password in the bounded bcrypt pool"""
+    return await _run_bounded(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the bounded bcrypt pool"""
+    return await _run_bounded(verify_password, plain_password, hashed_password)
+
+
+def verify_and_update_sync(db: Session, user, plain_password: str) -> bool:
+    """Same as verify_and_update, for sync routes already running in the threadpool"""
+    if not verify_password(plain_password, user.hashed_password):
+        return False
+
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = hash_password(plain_password)
+        db.commit()
+        logger.info(f"Rehashed password for user {user.id} at cost {settings.BCRYPT_ROUNDS}")
+    return True
+
+
+async def verify_and_update(db: Session, user, plain_password: str) -> bool:
+    """
+    Verify a user's password and, if its hash was made with an outdated
+    cost, store a new hash at the current cost
+
+    Args:
+        db: Database session
+        user: User (or Customer) with a hashed_password attribute
+        plain_password: Password from the login request
+
+    Returns:
+        Whether the password is valid
+    """
+    if not await verify_password_async(plain_password, user.hashed_password):
+        return False
+
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password_async(plain_password)
+        db.commit()
+        logger.info(f"Rehashed password for user {user.id} at cost {settings.BCRYPT_ROUNDS}")
+    return True
+
+
+class LoginThrottle:
+    """
+    Per-account and per-IP limit on failed logins.
+
+    Checked before any bcrypt work, so a credential-stuffing burst is turned
+    away cheaply. Counters are per process and reset after window_seconds
+    without a failure, or on a successful login for the account.
+    """
+
+    def __init__(self, max_failures_per_account: int, max_failures_per_ip: int, window_seconds: int):
+        self.max_failures_per_account = max_failures_per_account
+        self.max_failures_per_ip = max_failures_per_ip
+        self.window_seconds = window_seconds
+        self._failures = TTLCache(maxsize=100_000, ttl=window_seconds)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(account: str, ip: Optional[str]):
+        return ("account", account.strip().lower()), ("ip", ip or "unknown")
+
+    def check(self, account: str, ip: Optional[str]) -> None:
+        """Raise 429 if the account or IP has too many recent failures"""
+        account_key, ip_key = self._keys(account, ip)
+        if (self._failures.get(account_key, 0) >= self.max_failures_per_account
+                or self._failures.get(ip_key, 0) >= self.max_failures_per_ip):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many failed login attempts, try again later",
+                headers={"Retry-After": str(self.window_seconds)},
+            )
+
+    def record_failure(self, account: str, ip: Optional[str]) -> None:
+        with self._lock:
+            for key in self._keys(account, ip):
+                self._failures.set(key, self._failures.get(key, 0) + 1)
+
+    def reset(self, account: str) -> None:
+        account_key, _ = self._keys(account, None)
+        self._failures.pop(account_key)
+
+
+login_throttle = LoginThrottle(
+    max_failures_per_account=settings.LOGIN_MAX_FAILURES_PER_ACCOUNT,
+    max_failures_per_ip=settings.LOGIN_MAX_FAILURES_PER_IP,
+    window_seconds=settings.LOGIN_THROTTLE_WINDOW_SECONDS,
+)
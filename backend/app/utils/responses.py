@@ -0,0 +1,93 @@
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Type
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+# Options shared by every orjson call in the API
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for types orjson does not serialize natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if hasattr(obj, "isoformat"):
+        # pandas.Timestamp and other datetime-likes
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any, indent: bool = False) -> bytes:
+    """Serialize content to JSON bytes using orjson"""
+    option = ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else ORJSON_OPTIONS
+    return orjson.dumps(content, default=_default, option=option)
+
+
+def iter_json_array(batches: Iterable[List[Any]]) -> Iterator[bytes]:
+    """
+    Serialize a JSON array incrementally, one chunk per batch of records,
+    for use with a StreamingResponse
+    """
+    yield b"["
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        chunk = b",".join(dumps(record) for record in batch)
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+class T24JSONResponse(ORJSONResponse):
+    """
+    Default response class for the API.
+
+    Extends FastAPI's ORJSONResponse with support for Decimal money values,
+    numpy scalars from the analytics module and non-string dict keys.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(model: Type, schema: Type[BaseModel]) -> List[Any]:
+    """
+    Get the mapped columns of a model that back the fields of a schema
+
+    Args:
+        model: SQLAlchemy model class
+        schema: Pydantic schema whose fields should be selected
+
+    Returns:
+        List of column attributes, in schema field order
+
+    Raises:
+        AttributeError: A schema field has no model attribute; called at
+            import, so a schema/model mismatch fails at startup
+    """
+    missing = [name for name in schema.__fields__ if not hasattr(model, name)]
+    if missing:
+        raise AttributeError(f"{schema.__name__} fields {missing} are not attributes of {model.__name__}")
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def rows_response(rows: Iterable[Any], status_code: int = 200) -> T24JSONResponse:
+    """
+    Serialize SQLAlchemy Row tuples straight to a JSON response.
+
+    Returning a Response instance makes FastAPI skip response_model
+    validation, so the rows never get copied into Pydantic models.
+
+    Args:
+        rows: Rows from a column-projected query
+        status_code: HTTP status code
+
+    Returns:
+        JSON response with one object per row
+    """
+    return T24JSONResponse([row._asdict() for row in rows], status_code=status_code)
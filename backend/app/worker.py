@@ -0,0 +1,21 @@
+"""
+Standalone background job worker.
+
+    python -m app.worker
+
+Runs queued jobs (exports, accounting syncs, KPI calculation) outside the
+API processes. Any number of workers can run side by side; set
+JOB_QUEUE_EMBEDDED_WORKER=false on the API when using them.
+"""
+import logging
+
+import app.models  # noqa: F401 - registers models and flush hooks
+import app.tasks.background  # noqa: F401 - registers job handlers
+from app.database import Base, engine
+from app.services.job_queue import worker
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    worker.run_forever()
@@ -0,0 +1,94 @@
+# Accounting Sync Benchmark
+# Invoices approved quotes against the local fake accounting server
+# (benchmarks/fake_accounting_server.py) with each adapter, comparing one
+# request at a time (what the old create_invoice loop amounted to) with the
+# adapter's batch size and ACCOUNTING_CONCURRENCY requests in flight. A
+# second sync checks that nothing is invoiced twice.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_accounting_sync [quotes] [latency_ms]
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401
+from app.config import settings
+from app.database import Base
+from app.models.lead import Lead, LeadStatus
+from app.models.quote import OperationType, Quote, QuoteItem, QuoteStatus, TreeSpecies
+from app.services.accounting_transport import HTTP_TRANSPORTS, set_accounting_transport
+from app.utils.accounting import AccountingIntegrationService
+from benchmarks.fake_accounting_server import FakeAccountingServer
+
+
+def fill(session, n: int) -> None:
+    now = datetime.utcnow()
+    session.execute(insert(Lead), [
+        {
+            "customer_name": f"C{i}", "customer_email": f"c{i % (n // 2 or 1)}@example.se", "customer_phone": "0",
+            "address": "a", "city": "Stockholm", "postal_code": "113 45", "region": "Stockholm",
+            "summary": "s", "status": LeadStatus.COMPLETED, "version": 1, "created_at": now,
+        }
+        for i in range(n)
+    ])
+    session.execute(insert(Quote), [
+        {"lead_id": i + 1, "status": QuoteStatus.APPROVED, "total_amount": 12500, "commission_amount": 0,
+         "version": 1}
+        for i in range(n)
+    ])
+    session.execute(insert(QuoteItem), [
+        {"quote_id": i // 2 + 1, "quantity": 2, "tree_species": TreeSpecies.OAK,
+         "operation_type": OperationType.FELLING, "cost": 6250}
+        for i in range(n * 2)
+    ])
+    session.commit()
+
+
+def run(system: str, n: int, server: FakeAccountingServer, batch_size: int, concurrency: int) -> tuple:
+    path = os.path.join(tempfile.mkdtemp(), "accounting.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    fill(session, n)
+
+    transport = HTTP_TRANSPORTS[system](server.url, tenant_id="bench", batch_size=batch_size,
+                                        requests_per_second=1000)
+    set_accounting_transport(transport)
+    settings.ACCOUNTING_CONCURRENCY = concurrency
+    service = AccountingIntegrationService(session)
+    service.settings.accounting_system = system
+
+    requests_before = server.requests
+    start = time.perf_counter()
+    first = service.sync_invoices()
+    elapsed = time.perf_counter() - start
+    second = service.sync_invoices()
+    session.close()
+    engine.dispose()
+    return elapsed, first["created_invoices"], second["created_invoices"], server.requests - requests_before
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    server = FakeAccountingServer(latency=latency).start()
+
+    print(f"{n} approved quotes, {latency * 1000:.0f} ms per request")
+    print(f"{'system':<11} {'path':<22} {'total s':>8} {'requests':>9} {'invoiced':>9} {'re-sync':>8}")
+    for system in HTTP_TRANSPORTS:
+        for label, batch_size, concurrency in (("serial, 1 per request", 1, 1),
+                                               ("batched + concurrent", None, settings.ACCOUNTING_CONCURRENCY)):
+            elapsed, created, again, requests = run(system, n, server, batch_size, concurrency)
+            print(f"{system:<11} {label:<22} {elapsed:>8.2f} {requests:>9} {created:>9} {again:>8}")
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
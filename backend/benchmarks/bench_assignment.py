@@ -0,0 +1,93 @@
+# Lead Assignment Benchmark
+# Assigns synthetic leads with random Swedish postcodes to synthetic
+# partners, comparing a per-lead scan-and-sort of the region's partners (what
+# PartnerRankingService.get_top_partners did against the database) with the
+# postcode index + per-region heap in app.services.lead_assignment.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_assignment [leads] [partners]
+#
+# The scan baseline is timed on a sample of leads and extrapolated, since it
+# is O(partners) per lead.
+
+import random
+import sys
+import time
+
+from app.services.geo_service import load_postcode_index
+from app.services.lead_assignment import AssignmentEngine
+from app.services.partner_ranking_service import PartnerScore, score_partner
+
+BASELINE_SAMPLE = 5_000
+LOAD_PENALTY = 0.05
+
+
+def make_partners(n: int, regions: list) -> list:
+    rng = random.Random(1)
+    partners = []
+    for i in range(n):
+        assigned = rng.randint(0, 200)
+        accepted = rng.randint(0, assigned)
+        hours = rng.uniform(0.5, 72) if accepted else None
+        partners.append(PartnerScore(
+            partner_id=i + 1,
+            region=rng.choice(regions),
+            assigned=assigned,
+            accepted=accepted,
+            avg_response_hours=hours,
+            open_leads=rng.randint(0, 10),
+            score=score_partner(assigned, accepted, hours),
+        ))
+    return partners
+
+
+def make_postcodes(n: int) -> list:
+    rng = random.Random(2)
+    return [f"{rng.randint(100, 989)} {rng.randint(10, 99)}" for _ in range(n)]
+
+
+def scan_assign(postcodes: list, partners: list, index) -> float:
+    """Per lead: map postcode, filter the region's partners, sort, take the best"""
+    open_leads = {p.partner_id: p.open_leads for p in partners}
+    start = time.perf_counter()
+    for postcode in postcodes:
+        region = index.lookup(postcode)
+        candidates = [p for p in partners if p.region == region]
+        if not candidates:
+            continue
+        ranked = sorted(candidates, key=lambda p: p.score - LOAD_PENALTY * open_leads[p.partner_id], reverse=True)
+        open_leads[ranked[0].partner_id] += 1
+    return time.perf_counter() - start
+
+
+def engine_assign(postcodes: list, partners: list, index) -> tuple:
+    start = time.perf_counter()
+    engine = AssignmentEngine(index, partners, load_penalty=LOAD_PENALTY)
+    built = time.perf_counter()
+    assigned = sum(1 for postcode in postcodes if engine.choose(postcode) is not None)
+    return built - start, time.perf_counter() - built, assigned
+
+
+def main():
+    leads = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_partners = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    index = load_postcode_index()
+    regions = sorted(set(index.values))
+    partners = make_partners(n_partners, regions)
+    postcodes = make_postcodes(leads)
+
+    sample = postcodes[:min(BASELINE_SAMPLE, leads)]
+    scan_s = scan_assign(sample, partners, index) * leads / len(sample)
+    build_s, engine_s, assigned = engine_assign(postcodes, partners, index)
+
+    print(f"{leads} leads, {n_partners} partners, {len(index)} postcode ranges, {len(regions)} regions")
+    print(f"{'path':<22} {'total s':>9} {'us/lead':>9}")
+    print(f"{'scan + sort (extrap.)':<22} {scan_s:>9.2f} {scan_s / leads * 1e6:>9.1f}")
+    print(f"{'index + heap':<22} {engine_s:>9.2f} {engine_s / leads * 1e6:>9.1f}")
+    print(f"index build {build_s * 1000:.1f} ms, {assigned} leads assigned, speedup {scan_s / engine_s:.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
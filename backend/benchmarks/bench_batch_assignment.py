@@ -0,0 +1,108 @@
+# Batch Assignment Benchmark
+# Matches a backlog of synthetic leads to synthetic partners with limited
+# capacity, comparing one-at-a-time greedy assignment (each lead takes the
+# best partner that still has room, as dispatchers do by hand) with the
+# capacitated auction matching in app.services.batch_assignment.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_batch_assignment [leads] [partners]
+
+import random
+import sys
+import time
+
+from app.services.batch_assignment import auction_match
+from app.services.geo_service import load_centroid_index
+from app.services.partner_locator import PartnerLocation, PartnerLocator
+
+CANDIDATES = 10
+RADIUS_KM = 50.0
+PROXIMITY_WEIGHT = 0.5
+LOAD_PENALTY = 0.05
+
+
+def jitter(rng: random.Random, point: tuple, km: float) -> tuple:
+    lat, lon = point
+    return lat + rng.uniform(-km, km) / 111.2, lon + rng.uniform(-km, km) / 55.0
+
+
+def make_problem(n_leads: int, n_partners: int) -> tuple:
+    rng = random.Random(1)
+    centroids = sorted(set(load_centroid_index().values))
+    partners = []
+    for i in range(n_partners):
+        lat, lon = jitter(rng, rng.choice(centroids), 40)
+        partners.append(PartnerLocation(
+            partner_id=i + 1, latitude=lat, longitude=lon, service_radius_km=RADIUS_KM,
+            max_open_leads=rng.choice([5, 10, 15]), open_leads=rng.randint(0, 4),
+        ))
+    locator = PartnerLocator(partners, cell_degrees=0.5)
+    scores = {p.partner_id: rng.uniform(0.2, 0.9) for p in partners}
+
+    edges, capacity, open_leads = {}, {}, {}
+    for lead_id in range(1, n_leads + 1):
+        lat, lon = jitter(rng, rng.choice(centroids), 20)
+        nearby = locator.nearest(lat, lon, limit=CANDIDATES, radius_km=RADIUS_KM)
+        if not nearby:
+            continue
+        edges[lead_id] = [
+            (p.partner_id, scores[p.partner_id] + PROXIMITY_WEIGHT * (1 - p.distance_km / RADIUS_KM))
+            for p in nearby
+        ]
+        for p in nearby:
+            capacity[p.partner_id] = p.max_open_leads - p.open_leads
+            open_leads[p.partner_id] = p.open_leads
+    return edges, capacity, open_leads
+
+
+def greedy_match(edges: dict, capacity: dict, open_leads: dict) -> dict:
+    load = dict(open_leads)
+    room = dict(capacity)
+    matched = {}
+    for lead_id, candidates in edges.items():
+        options = [(w - LOAD_PENALTY * load[p], p) for p, w in candidates if room[p] > 0]
+        if not options:
+            continue
+        value, partner_id = max(options)
+        if value <= 0:
+            continue
+        matched[lead_id] = partner_id
+        load[partner_id] += 1
+        room[partner_id] -= 1
+    return matched
+
+
+def objective(matched: dict, edges: dict, open_leads: dict) -> float:
+    weights = {(lead_id, p): w for lead_id, candidates in edges.items() for p, w in candidates}
+    load = dict(open_leads)
+    total = 0.0
+    for lead_id, partner_id in sorted(matched.items()):
+        total += weights[lead_id, partner_id] - LOAD_PENALTY * load[partner_id]
+        load[partner_id] += 1
+    return total
+
+
+def main():
+    n_leads = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    n_partners = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    edges, capacity, open_leads = make_problem(n_leads, n_partners)
+
+    start = time.perf_counter()
+    greedy = greedy_match(edges, capacity, open_leads)
+    greedy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    auction = auction_match(edges, capacity, open_leads, LOAD_PENALTY)
+    auction_s = time.perf_counter() - start
+
+    print(f"{n_leads} leads ({len(edges)} with candidates), {n_partners} partners, "
+          f"{sum(capacity.values())} free slots")
+    print(f"{'path':<8} {'ms':>9} {'assigned':>9} {'total weight':>13}")
+    print(f"{'greedy':<8} {greedy_s * 1000:>9.1f} {len(greedy):>9} {objective(greedy, edges, open_leads):>13.1f}")
+    print(f"{'auction':<8} {auction_s * 1000:>9.1f} {len(auction):>9} {objective(auction, edges, open_leads):>13.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Compression Benchmark
+# Measures CPU cost versus bytes saved for gzip, brotli and zstd at the
+# levels used by CompressionMiddleware, on payloads shaped like the large
+# analytics and export endpoints. The streamed export is compressed the way
+# the middleware does it: one flush per chunk of EXPORT_BATCH_SIZE records.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_compression
+
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from app.config import settings
+from app.utils.analytics import EXPORT_BATCH_SIZE
+from app.utils.compression import CompressionMiddleware, available_encodings
+from app.utils.responses import dumps, iter_json_array
+from benchmarks.bench_serialization import lead_fields, partner_performance, tree_operations
+
+ROUNDS = 10
+
+
+def payloads() -> List[tuple]:
+    """(name, chunks) for each endpoint; single-body responses have one chunk"""
+    export = [lead_fields(i) for i in range(1, 5001)]
+    batches = [export[i:i + EXPORT_BATCH_SIZE] for i in range(0, len(export), EXPORT_BATCH_SIZE)]
+    return [
+        ("GET /analytics/tree-operations", [dumps(tree_operations())]),
+        ("GET /analytics/partners (200)", [dumps([partner_performance(i) for i in range(1, 201)])]),
+        ("GET /analytics/export/leads (5k)", list(iter_json_array(batches))),
+    ]
+
+
+def compress_all(middleware: CompressionMiddleware, encoding: str, chunks: List[bytes]) -> int:
+    compressor = middleware._compressor(encoding)
+    size = 0
+    for chunk in chunks[:-1]:
+        size += len(compressor.compress(chunk))
+    size += len(compressor.finish(chunks[-1]))
+    return size
+
+
+def measure(fn: Callable[[], int]):
+    size = fn()
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.process_time()
+        fn()
+        timings.append(time.process_time() - start)
+    return size, statistics.median(timings) * 1000
+
+
+def main():
+    middleware = CompressionMiddleware(
+        app=None,
+        gzip_level=settings.GZIP_COMPRESSION_LEVEL,
+        brotli_quality=settings.BROTLI_QUALITY,
+        zstd_level=settings.ZSTD_COMPRESSION_LEVEL,
+    )
+    encodings = available_encodings()
+    print(f"encodings available: {', '.join(encodings)}")
+    print(f"{'endpoint':<34} {'encoding':<9} {'bytes':>10} {'ratio':>7} {'cpu ms':>8} {'saved KiB/cpu ms':>17}")
+    for name, chunks in payloads():
+        raw = sum(len(c) for c in chunks)
+        print(f"{name:<34} {'identity':<9} {raw:>10} {1.0:>7.2f} {0.0:>8.2f} {'-':>17}")
+        for encoding in encodings:
+            size, ms = measure(lambda: compress_all(middleware, encoding, chunks))
+            saved = (raw - size) / 1024 / ms if ms else float("inf")
+            print(f"{name:<34} {encoding:<9} {size:>10} {raw / size:>7.2f} {ms:>8.2f} {saved:>17.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# Lead Expiry Benchmark
+# Fills a scratch SQLite database with overdue leads and expires them,
+# comparing the old per-row loop (load every lead, set its status, add a KPI
+# event, commit) with the chunked UPDATE ... RETURNING in
+# app.tasks.lead_automation.LeadAutomation.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_lead_expiry [leads]
+#
+# The per-row baseline is timed on a sample and extrapolated.
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401
+from app.database import Base
+from app.models.kpi import KPIEvent
+from app.models.lead import Lead, LeadStatus
+from app.tasks.lead_automation import LeadAutomation
+
+BASELINE_SAMPLE = 500
+
+
+def fill(session, n: int, now: datetime) -> None:
+    rows = [
+        {
+            "customer_name": "C", "customer_email": f"c{i}@example.se", "customer_phone": "0",
+            "address": "a", "city": "Stockholm", "postal_code": "113 45", "region": "Stockholm",
+            "summary": "s", "status": LeadStatus.NEW, "version": 1,
+            "created_at": now - timedelta(days=3), "expires_at": now - timedelta(hours=1 + i % 48),
+        }
+        for i in range(n)
+    ]
+    session.execute(insert(Lead), rows)
+    session.commit()
+
+
+def per_row_expire(session, now: datetime) -> int:
+    leads = session.query(Lead).filter(Lead.status == LeadStatus.NEW, Lead.expires_at < now).all()
+    for lead in leads:
+        lead.status = LeadStatus.EXPIRED
+        session.add(KPIEvent(event_type="LeadExpired", lead_id=lead.id))
+        session.commit()
+    return len(leads)
+
+
+def run(n: int, fn) -> tuple:
+    path = os.path.join(tempfile.mkdtemp(), "expiry.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    fill(session, n, now)
+    start = time.perf_counter()
+    expired = fn(session, now)
+    elapsed = time.perf_counter() - start
+    session.close()
+    engine.dispose()
+    return elapsed, expired
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    sample = min(BASELINE_SAMPLE, n)
+
+    loop_s, _ = run(sample, per_row_expire)
+    loop_s *= n / sample
+    set_s, expired = run(n, lambda session, now: LeadAutomation(session).expire_old_leads(now=now))
+
+    print(f"{n} overdue leads, {expired} expired")
+    print(f"{'path':<26} {'total s':>9} {'leads/min':>12}")
+    print(f"{'per-row loop (extrap.)':<26} {loop_s:>9.2f} {n / loop_s * 60:>12,.0f}")
+    print(f"{'chunked UPDATE RETURNING':<26} {set_s:>9.2f} {n / set_s * 60:>12,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# Login Burst Benchmark
+# Fires a burst of concurrent logins at one event loop and measures how
+# late a 10 ms heartbeat task runs (event-loop lag), comparing bcrypt called
+# inline in the coroutine (the old login_for_access_token) with the bounded
+# thread pool in app.utils.passwords.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_login_burst [logins] [bcrypt rounds]
+#
+# Rounds default to 10 so the inline case finishes in reasonable time; lag
+# scales by 2x per extra round (cost 12 is ~4x the numbers shown).
+
+import asyncio
+import statistics
+import sys
+import time
+
+import bcrypt
+
+from app.utils.passwords import verify_password, verify_password_async
+
+HEARTBEAT_SECONDS = 0.01
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        lags.append(time.perf_counter() - start - HEARTBEAT_SECONDS)
+
+
+async def inline_login(password: str, hashed: str) -> bool:
+    return verify_password(password, hashed)
+
+
+async def pooled_login(password: str, hashed: str) -> bool:
+    return await verify_password_async(password, hashed)
+
+
+async def burst(login, logins: int, hashed: str):
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(HEARTBEAT_SECONDS * 3)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login("partner-password", hashed) for _ in range(logins)),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await beat
+    ok = sum(1 for r in results if r is True)
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "elapsed_s": elapsed,
+        "ok": ok,
+        "rejected": logins - ok,
+        "lag_p50_ms": statistics.median(lags_ms),
+        "lag_p99_ms": lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))],
+        "lag_max_ms": lags_ms[-1],
+        "beats": len(lags),
+    }
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    hashed = bcrypt.hashpw(b"partner-password", bcrypt.gensalt(rounds)).decode("utf-8")
+
+    print(f"{logins} logins, bcrypt cost {rounds}")
+    print(f"{'path':<8} {'total s':>8} {'ok':>5} {'503':>5} {'beats':>6} {'lag p50 ms':>11} "
+          f"{'lag p99 ms':>11} {'lag max ms':>11}")
+    for name, login in (("inline", inline_login), ("pooled", pooled_login)):
+        r = asyncio.run(burst(login, logins, hashed))
+        print(f"{name:<8} {r['elapsed_s']:>8.2f} {r['ok']:>5} {r['rejected']:>5} {r['beats']:>6} "
+              f"{r['lag_p50_ms']:>11.2f} {r['lag_p99_ms']:>11.2f} {r['lag_max_ms']:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# Nearest Partner Benchmark
+# Places synthetic partners at random bases around the bundled postcode
+# centroids and answers "k nearest partners with capacity within R km" for
+# synthetic leads, comparing a haversine scan over every partner with the
+# grid in app.services.partner_locator.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_nearest_partner [partners] [queries]
+
+import heapq
+import random
+import statistics
+import sys
+import time
+
+from app.services.geo_service import haversine_km, load_centroid_index
+from app.services.partner_locator import PartnerLocation, PartnerLocator
+
+LIMIT = 5
+RADIUS_KM = 50.0
+
+
+def jitter(rng: random.Random, point: tuple, km: float) -> tuple:
+    lat, lon = point
+    return lat + rng.uniform(-km, km) / 111.2, lon + rng.uniform(-km, km) / 55.0
+
+
+def make_partners(n: int, centroids: list) -> list:
+    rng = random.Random(1)
+    partners = []
+    for i in range(n):
+        lat, lon = jitter(rng, rng.choice(centroids), 40)
+        max_open = rng.choice([None, 5, 10, 20])
+        partners.append(PartnerLocation(
+            partner_id=i + 1,
+            latitude=lat,
+            longitude=lon,
+            service_radius_km=rng.choice([20.0, 30.0, 50.0, 80.0]),
+            max_open_leads=max_open,
+            open_leads=rng.randint(0, max_open or 20),
+        ))
+    return partners
+
+
+def make_queries(n: int, centroids: list) -> list:
+    rng = random.Random(2)
+    return [jitter(rng, rng.choice(centroids), 20) for _ in range(n)]
+
+
+def scan_nearest(partners: list, lat: float, lon: float) -> list:
+    candidates = []
+    for p in partners:
+        if not p.has_capacity():
+            continue
+        distance = haversine_km(lat, lon, p.latitude, p.longitude)
+        if distance <= RADIUS_KM and distance <= p.service_radius_km:
+            candidates.append((distance, p.partner_id))
+    return [(round(d, 2), pid) for d, pid in heapq.nsmallest(LIMIT, candidates)]
+
+
+def timed(fn, queries: list) -> tuple:
+    latencies, results = [], []
+    for lat, lon in queries:
+        start = time.perf_counter()
+        results.append(fn(lat, lon))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def report(name: str, latencies: list) -> None:
+    us = sorted(t * 1e6 for t in latencies)
+    p99 = us[min(len(us) - 1, int(len(us) * 0.99))]
+    print(f"{name:<10} {statistics.median(us):>10.1f} {p99:>10.1f} {sum(us) / len(us):>10.1f}")
+
+
+def main():
+    n_partners = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+
+    centroids = sorted(set(load_centroid_index().values))
+    partners = make_partners(n_partners, centroids)
+    queries = make_queries(n_queries, centroids)
+
+    start = time.perf_counter()
+    locator = PartnerLocator(partners, cell_degrees=0.5)
+    build_s = time.perf_counter() - start
+
+    scan_lat, scan_results = timed(lambda lat, lon: scan_nearest(partners, lat, lon), queries)
+    grid_lat, grid_results = timed(
+        lambda lat, lon: [(p.distance_km, p.partner_id) for p in locator.nearest(lat, lon, LIMIT, RADIUS_KM)],
+        queries
+    )
+    mismatches = sum(1 for a, b in zip(scan_results, grid_results) if a != b)
+
+    print(f"{n_partners} partners, {n_queries} queries, k={LIMIT}, R={RADIUS_KM:.0f} km")
+    print(f"{'path':<10} {'p50 us':>10} {'p99 us':>10} {'mean us':>10}")
+    report("scan", scan_lat)
+    report("grid", grid_lat)
+    print(f"grid build {build_s * 1000:.1f} ms, {mismatches} result mismatches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# Pricing Engine Benchmark
+# Prices 1M quote items (about 250k quotes) with the int64 öre engine in
+# app.services.pricing_engine and with the per-item Decimal QuoteCalculator,
+# checks that every quote comes out identical to the öre, and runs a
+# commission what-if over the same quotes. A second part reprices stored
+# draft quotes after a price-list change through reprice_quotes.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_pricing_engine [items] [stored_items]
+
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401
+from app.database import Base
+from app.models.lead import Lead, LeadStatus
+from app.models.quote import Quote, QuoteItem, QuoteStatus
+from app.services.pricing_engine import (
+    OPERATIONS, SPECIES, commission_scenarios, from_ore, price_items, reprice_quotes,
+)
+from app.services.quote_logic import QuoteCalculator, QuoteItem as QuoteItemLogic
+
+COMMISSION_RATE = Decimal("0.15")
+DISCOUNT_RATE = Decimal("0.05")
+
+
+def generate(n: int, seed: int = 24):
+    rng = np.random.default_rng(seed)
+    quote_ids = np.sort(rng.integers(1, n // 4 + 1, n))
+    unit_prices = rng.integers(1, 2_000_000, n)  # öre, up to 20k SEK
+    quantities = rng.integers(1, 5, n)
+    return quote_ids, unit_prices, quantities
+
+
+def decimal_prices(quote_ids, unit_prices, quantities) -> dict:
+    calculator = QuoteCalculator(commission_rate=COMMISSION_RATE, discount_rate=DISCOUNT_RATE)
+    items = {}
+    for quote_id, price, quantity in zip(quote_ids.tolist(), unit_prices.tolist(), quantities.tolist()):
+        items.setdefault(quote_id, []).append(
+            QuoteItemLogic("", "", quantity, Decimal(price).scaleb(-2))
+        )
+    return {quote_id: calculator.calculate_quote(quote_items, apply_discount=True)
+            for quote_id, quote_items in items.items()}
+
+
+def bench_engine(n: int) -> None:
+    quote_ids, unit_prices, quantities = generate(n)
+
+    start = time.perf_counter()
+    priced = price_items(quote_ids, unit_prices, COMMISSION_RATE, DISCOUNT_RATE, apply_discount=True,
+                         quantities=quantities)
+    engine_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = decimal_prices(quote_ids, unit_prices, quantities)
+    decimal_s = time.perf_counter() - start
+
+    mismatches = sum(priced.result(i) != expected[quote_id] for i, quote_id in enumerate(priced.quote_ids.tolist()))
+
+    rates = [Decimal(r) / 100 for r in range(5, 26)]
+    start = time.perf_counter()
+    scenarios = commission_scenarios(priced.subtotal, rates, DISCOUNT_RATE, apply_discount=True)
+    what_if_s = time.perf_counter() - start
+
+    print(f"{n} items in {len(priced)} quotes")
+    print(f"{'path':<34} {'total s':>8} {'items/s':>12}")
+    print(f"{'Decimal QuoteCalculator':<34} {decimal_s:>8.3f} {n / decimal_s:>12,.0f}")
+    print(f"{'int64 öre engine':<34} {engine_s:>8.3f} {n / engine_s:>12,.0f}")
+    print(f"{f'what-if, {len(rates)} commission rates':<34} {what_if_s:>8.3f}")
+    print(f"speedup {decimal_s / engine_s:.0f}x, mismatching quotes: {mismatches}")
+    print(f"commission at 15%: {priced.totals()['commission']} SEK "
+          f"(what-if: {scenarios[10]['commission']} SEK), at 25%: {scenarios[-1]['commission']} SEK")
+
+
+def bench_reprice(n: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "pricing.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    quote_ids, unit_prices, quantities = generate(n)
+    quotes = int(quote_ids.max())
+    session.execute(insert(Lead), [
+        {"customer_name": f"C{i}", "customer_email": f"c{i}@example.se", "customer_phone": "0", "address": "a",
+         "city": "Stockholm", "postal_code": "113 45", "region": "Stockholm", "summary": "s",
+         "status": LeadStatus.ACCEPTED, "version": 1}
+        for i in range(quotes)
+    ])
+    session.execute(insert(Quote), [
+        {"lead_id": i + 1, "status": QuoteStatus.DRAFT, "total_amount": 0, "commission_amount": 0, "version": 1}
+        for i in range(quotes)
+    ])
+    session.execute(insert(QuoteItem), [
+        {"quote_id": quote_id, "quantity": quantity, "tree_species": SPECIES[i % len(SPECIES)],
+         "operation_type": OPERATIONS[i % len(OPERATIONS)], "cost": from_ore(price * quantity)}
+        for i, (quote_id, price, quantity) in enumerate(zip(quote_ids.tolist(), unit_prices.tolist(),
+                                                            quantities.tolist()))
+    ])
+    session.commit()
+
+    start = time.perf_counter()
+    first = reprice_quotes(session, COMMISSION_RATE)
+    first_s = time.perf_counter() - start
+    price_list = {(species, operation): Decimal("1250.00") for species in SPECIES[:4] for operation in OPERATIONS}
+    start = time.perf_counter()
+    second = reprice_quotes(session, COMMISSION_RATE, unit_prices=price_list)
+    second_s = time.perf_counter() - start
+    session.close()
+    engine.dispose()
+
+    print(f"\n{n} stored items in {quotes} draft quotes (SQLite)")
+    print(f"reprice at 15%:          {first_s:>7.2f} s, {first['repriced_quotes']} quotes written")
+    print(f"price-list change:       {second_s:>7.2f} s, {second['repriced_items']} items and "
+          f"{second['repriced_quotes']} quotes written")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    stored = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    bench_engine(n)
+    if stored:
+        bench_reprice(stored)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
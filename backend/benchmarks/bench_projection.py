@@ -0,0 +1,129 @@
+# Projection Memory Benchmark
+# Measures per-request allocations for a 500-lead page of the partner preview
+# and mobile summary endpoints, loading full Lead entities versus the
+# column-projected row tuples the endpoints use now.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_projection
+
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.lead import Lead, LeadStatus
+from app.models.user import User, UserRole
+from app.schemas.lead import LeadPreview
+from app.utils.mobile_api import MOBILE_LEAD_COLUMNS, MobileLeadSummary
+from app.utils.responses import dumps, schema_columns
+
+PAGE_SIZE = 500
+ROUNDS = 10
+
+# Same projection as app.routes.partner.LEAD_PREVIEW_COLUMNS
+LEAD_PREVIEW_COLUMNS = schema_columns(Lead, LeadPreview)
+
+
+def seed(session: Session) -> int:
+    partner = User(email="partner@t24leads.se", hashed_password="x", full_name="Partner",
+                   role=UserRole.PARTNER, region="Stockholm")
+    session.add(partner)
+    session.flush()
+
+    now = datetime.utcnow()
+    session.add_all([
+        Lead(
+            customer_name=f"Kund {i}",
+            customer_email=f"kund{i}@example.se",
+            customer_phone="+46 70 000 00 00",
+            address=f"Storgatan {i}",
+            city="Stockholm",
+            postal_code="11122",
+            region="Stockholm",
+            summary="Två stora björkar nära huset behöver fällas. " * 10,
+            details="Kunden vill ha stubbfräsning och bortforsling av allt ris. " * 40,
+            status=LeadStatus.ASSIGNED,
+            assigned_partner_id=partner.id,
+            created_at=now - timedelta(minutes=i),
+            expires_at=now + timedelta(hours=48),
+        )
+        for i in range(PAGE_SIZE)
+    ])
+    session.commit()
+    return partner.id
+
+
+def full_entities_preview(session: Session, partner_id: int) -> bytes:
+    leads = session.query(Lead).filter(Lead.assigned_partner_id == partner_id) \
+        .order_by(Lead.created_at.desc()).limit(PAGE_SIZE).all()
+    return dumps([LeadPreview.from_orm(lead).dict() for lead in leads])
+
+
+def projected_preview(session: Session, partner_id: int) -> bytes:
+    rows = session.query(*LEAD_PREVIEW_COLUMNS).filter(Lead.assigned_partner_id == partner_id) \
+        .order_by(Lead.created_at.desc()).limit(PAGE_SIZE).all()
+    return dumps([row._asdict() for row in rows])
+
+
+def full_entities_mobile(session: Session, partner_id: int) -> bytes:
+    leads = session.query(Lead).filter(Lead.assigned_partner_id == partner_id) \
+        .order_by(Lead.created_at.desc()).limit(PAGE_SIZE).all()
+    return dumps([
+        MobileLeadSummary(id=lead.id, customer_name=lead.customer_name, city=lead.city,
+                          status=lead.status, created_at=lead.created_at,
+                          expires_at=lead.expires_at).dict()
+        for lead in leads
+    ])
+
+
+def projected_mobile(session: Session, partner_id: int) -> bytes:
+    rows = session.query(*MOBILE_LEAD_COLUMNS).filter(Lead.assigned_partner_id == partner_id) \
+        .order_by(Lead.created_at.desc()).limit(PAGE_SIZE).all()
+    return dumps([row._asdict() for row in rows])
+
+
+def measure(engine, fn, partner_id: int):
+    """Run fn in a fresh session per request, like get_db does"""
+    timings = []
+    for _ in range(ROUNDS):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            fn(session, partner_id)
+            timings.append(time.perf_counter() - start)
+
+    with Session(engine) as session:
+        tracemalloc.start()
+        fn(session, partner_id)
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+
+    return statistics.median(timings) * 1000, peak / 1024, blocks
+
+
+def main():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        partner_id = seed(session)
+
+    print(f"{'endpoint':<22} {'query':<10} {'ms':>8} {'peak KiB':>10} {'live blocks':>12}")
+    cases = [
+        ("GET /partner/leads", "entities", full_entities_preview),
+        ("GET /partner/leads", "columns", projected_preview),
+        ("GET /mobile/leads", "entities", full_entities_mobile),
+        ("GET /mobile/leads", "columns", projected_mobile),
+    ]
+    for name, label, fn in cases:
+        ms, peak_kib, blocks = measure(engine, fn, partner_id)
+        print(f"{name:<22} {label:<10} {ms:>8.2f} {peak_kib:>10.1f} {blocks:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
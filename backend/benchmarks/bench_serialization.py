@@ -0,0 +1,212 @@
+# Serialization Benchmark
+# Compares FastAPI's default response path (response_model validation +
+# jsonable_encoder + json.dumps) with the orjson Row fast path used by the
+# bulk list endpoints, for payloads shaped like our ten largest endpoints.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_serialization
+
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas.kpi import KPIEvent as KPIEventSchema, KPIMetric as KPIMetricSchema
+from app.schemas.lead import Lead as LeadSchema, LeadPreview
+from app.schemas.quote import Quote as QuoteSchema
+from app.utils.responses import dumps
+
+ROUNDS = 20
+NOW = datetime(2025, 5, 1, 12, 0, 0)
+SPECIES = ["Tall (Pine)", "Gran (Spruce)", "Ek (Oak)", "Bok (Beech)", "Lönn (Maple)", "Ask (Ash)",
+           "Al (Alder)", "Björk (Birch)", "Lind (Linden)", "Hägg (Bird Cherry)", "Rönn (Rowan)",
+           "Körsbär (Cherry)", "Valnöt (Walnut)", "Poppel (Poplar)", "Platan (Plane)", "Pil (Willow)"]
+OPERATIONS = ["Död veds beskärning", "Trädfällning", "Sektionsfällning", "Avancerad sektionsfällning",
+              "Kronreducering", "Underhållsbeskäring", "Utrymmesbeskärning", "Kronlyft", "Hamling",
+              "Annat", "Bortförsling", "Urglesing", "Stubbfräsning", "Kronstabilisering", "Jour"]
+
+
+def lead_fields(i: int) -> Dict[str, Any]:
+    return {
+        "id": i,
+        "customer_name": f"Kund {i}",
+        "customer_email": f"kund{i}@example.se",
+        "customer_phone": f"+46 70 {i:07d}",
+        "address": f"Storgatan {i % 200}",
+        "city": "Stockholm",
+        "postal_code": f"1{i % 10000:04d}",
+        "region": "Stockholm",
+        "summary": "Två stora björkar nära huset behöver fällas. " * 3,
+        "details": "Kunden vill ha stubbfräsning och bortforsling av allt ris. " * 5,
+        "status": "assigned",
+        "assigned_partner_id": i % 50,
+        "assigned_at": NOW,
+        "accepted_at": None,
+        "quoted_at": None,
+        "customer_response_at": None,
+        "created_at": NOW - timedelta(hours=i % 48),
+        "updated_at": NOW,
+        "expires_at": NOW + timedelta(hours=48),
+        "lead_fee": 500.0,
+        "commission_percent": 10.0,
+        "billed": False,
+        "viewed_details": False,
+        "view_count": 0,
+    }
+
+
+def quote_fields(i: int) -> Dict[str, Any]:
+    items = [
+        SimpleNamespace(
+            id=i * 10 + j, quote_id=i, quantity=1 + j, tree_species=SPECIES[j % 16],
+            operation_type=OPERATIONS[j % 15], custom_operation=None, cost=1500.0 * (j + 1),
+            created_at=NOW, updated_at=NOW,
+        )
+        for j in range(5)
+    ]
+    return {
+        "id": i, "lead_id": i, "total_amount": 22500.0, "commission_amount": 2250.0,
+        "status": "sent", "sent_at": NOW, "customer_response_at": None,
+        "created_at": NOW, "updated_at": NOW, "items": items,
+    }
+
+
+def kpi_event_fields(i: int) -> Dict[str, Any]:
+    return {"id": i, "event_type": "lead_assigned", "lead_id": i, "user_id": i % 50,
+            "quote_id": None, "data": f"Lead assigned to partner Partner {i % 50}", "created_at": NOW}
+
+
+def kpi_metric_fields(i: int) -> Dict[str, Any]:
+    return {"id": i, "metric_name": "partner_acceptance_rate", "metric_value": 73.5, "time_period": "daily",
+            "period_start": NOW, "period_end": NOW, "user_id": i % 50, "region": "Stockholm",
+            "created_at": NOW, "updated_at": None}
+
+
+def partner_performance(i: int) -> Dict[str, Any]:
+    return {
+        "partner_id": i, "partner_name": f"Partner {i}", "partner_email": f"partner{i}@t24leads.se",
+        "total_leads": 120, "accepted_leads": 90, "rejected_leads": 10, "quoted_leads": 70,
+        "approved_leads": 40, "declined_leads": 20, "expired_leads": 10, "acceptance_rate": 75.0,
+        "conversion_rate": 44.44, "avg_response_time": 3.25, "avg_quote_time": 26.5, "total_quotes": 70,
+        "avg_quote_value": 18250.5, "total_revenue": 1337535.0, "lead_fees": 60000, "commissions": 127753.5,
+    }
+
+
+def tree_operations() -> Dict[str, Any]:
+    return {
+        "species_analysis": [{"species": s, "count": 40, "total_cost": 80000.0, "avg_cost": 2000.0}
+                             for s in SPECIES],
+        "operation_analysis": [{"operation": o, "count": 42, "total_cost": 84000.0, "avg_cost": 2000.0}
+                               for o in OPERATIONS],
+        "combination_analysis": [{"species": s, "operation": o, "count": 3, "total_cost": 6000.0,
+                                  "avg_cost": 2000.0} for s in SPECIES for o in OPERATIONS],
+    }
+
+
+def as_rows(records: List[Dict[str, Any]]) -> List[Any]:
+    """Emulate SQLAlchemy Row tuples, which expose _asdict() the same way"""
+    Row = namedtuple("Row", records[0].keys())
+    return [Row(**record) for record in records]
+
+
+def default_path(schema, objects: List[Any]) -> Callable[[], bytes]:
+    """What FastAPI does for response_model=List[schema] with a JSONResponse"""
+    def run() -> bytes:
+        validated = [schema.from_orm(obj) for obj in objects]
+        content = jsonable_encoder(validated)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return run
+
+
+def default_dict_path(payload: Any) -> Callable[[], bytes]:
+    """What FastAPI does for response_model=List[Dict[str, Any]] / Dict[str, Any]"""
+    def run() -> bytes:
+        content = jsonable_encoder(payload)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return run
+
+
+def rows_path(rows: List[Any]) -> Callable[[], bytes]:
+    """The rows_response fast path"""
+    return lambda: dumps([row._asdict() for row in rows])
+
+
+def orjson_path(payload: Any) -> Callable[[], bytes]:
+    """T24JSONResponse rendering of an already built payload"""
+    return lambda: dumps(payload)
+
+
+def measure(fn: Callable[[], bytes]) -> Dict[str, float]:
+    """Measure median wall time, throughput and peak allocations of a serializer"""
+    body = fn()
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        "bytes": len(body),
+        "ms": median * 1000,
+        "mb_per_s": len(body) / median / 1e6,
+        "peak_kib": peak / 1024,
+    }
+
+
+def endpoints() -> List[Any]:
+    """The ten largest endpoints, with default and fast serializers"""
+    leads = [lead_fields(i) for i in range(1, 101)]
+    lead_objs = [SimpleNamespace(**lead) for lead in leads]
+    previews = [{k: lead[k] for k in LeadPreview.__fields__} for lead in leads]
+    mobile = [{k: lead[k] for k in ("id", "customer_name", "city", "status", "created_at", "expires_at")}
+              for lead in [lead_fields(i) for i in range(1, 501)]]
+    quotes = [quote_fields(i) for i in range(1, 101)]
+    events = [kpi_event_fields(i) for i in range(1, 101)]
+    metrics = [kpi_metric_fields(i) for i in range(1, 101)]
+    partners = [partner_performance(i) for i in range(1, 201)]
+    export = [lead_fields(i) for i in range(1, 2001)]
+
+    return [
+        ("GET /admin/leads", default_path(LeadSchema, lead_objs), rows_path(as_rows(leads))),
+        ("GET /leads/", default_path(LeadSchema, lead_objs), rows_path(as_rows(leads))),
+        ("GET /partner/leads", default_path(LeadPreview, [SimpleNamespace(**p) for p in previews]),
+         rows_path(as_rows(previews))),
+        ("GET /mobile/leads (500)", default_dict_path(mobile), rows_path(as_rows(mobile))),
+        ("GET /admin/quotes", default_path(QuoteSchema, [SimpleNamespace(**q) for q in quotes]),
+         orjson_path(jsonable_encoder([QuoteSchema.from_orm(SimpleNamespace(**q)) for q in quotes]))),
+        ("GET /kpi/events", default_path(KPIEventSchema, [SimpleNamespace(**e) for e in events]),
+         rows_path(as_rows(events))),
+        ("GET /kpi/metrics", default_path(KPIMetricSchema, [SimpleNamespace(**m) for m in metrics]),
+         rows_path(as_rows(metrics))),
+        ("GET /analytics/partners", default_dict_path(partners), orjson_path(partners)),
+        ("GET /analytics/tree-operations", default_dict_path(tree_operations()), orjson_path(tree_operations())),
+        ("GET /analytics/export/leads", lambda: json.dumps(jsonable_encoder(export), indent=2).encode("utf-8"),
+         lambda: dumps(export, indent=True)),
+    ]
+
+
+def main():
+    print(f"{'endpoint':<32} {'path':<8} {'bytes':>9} {'ms':>8} {'MB/s':>8} {'peak KiB':>10}")
+    for name, default_fn, fast_fn in endpoints():
+        for label, fn in (("default", default_fn), ("orjson", fast_fn)):
+            result = measure(fn)
+            print(f"{name:<32} {label:<8} {result['bytes']:>9} {result['ms']:>8.2f} "
+                  f"{result['mb_per_s']:>8.1f} {result['peak_kib']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# Fake Accounting Server
+# A local HTTP server speaking just enough of the QuickBooks batch, Xero,
+# Fortnox and Visma eAccounting APIs for the adapters in
+# app.services.accounting_transport. It assigns ids, replays the stored
+# response for a repeated Idempotency-Key / requestid, adds a fixed latency
+# per request and answers 429 when a client exceeds the rate limit.
+#
+# Used by bench_accounting_sync; can also be started on its own:
+#   python -m benchmarks.fake_accounting_server [port]
+
+import itertools
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeAccountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.02, rate_limit: float = 0.0):
+        super().__init__(("127.0.0.1", port), FakeAccountingHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit  # requests per second; 0 disables
+        self.ids = itertools.count(1000)
+        self.lock = threading.Lock()
+        self.replies: Dict[str, Any] = {}  # idempotency key -> response body
+        self.requests = 0
+        self.throttled = 0
+        self.created: Dict[str, int] = {"invoices": 0, "customers": 0}
+        self._window = (0.0, 0)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "FakeAccountingServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def admit(self) -> bool:
+        """Fixed one-second window rate limit"""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            started, count = self._window
+            now = time.monotonic()
+            if now - started >= 1.0:
+                started, count = now, 0
+            self._window = (started, count + 1)
+            return count < self.rate_limit
+
+    def new_id(self, kind: str) -> int:
+        with self.lock:
+            self.created[kind] += 1
+            return next(self.ids)
+
+
+class FakeAccountingHandler(BaseHTTPRequestHandler):
+    server: FakeAccountingServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+        if not self.server.admit():
+            with self.server.lock:
+                self.server.throttled += 1
+            self._reply(429, {"error": "rate limited"}, {"Retry-After": "1"})
+            return
+        time.sleep(self.server.latency)
+
+        key = self.headers.get("Idempotency-Key") or parse_qs(url.query).get("requestid", [None])[0]
+        if key is not None:
+            key = f"{url.path}:{key}"
+            with self.server.lock:
+                stored = self.server.replies.get(key)
+            if stored is not None:
+                self._reply(200, stored)
+                return
+
+        response = self._handle(url.path, body)
+        if response is None:
+            self._reply(404, {"error": f"unknown path {url.path}"})
+            return
+        if key is not None:
+            with self.server.lock:
+                self.server.replies[key] = response
+        self._reply(200, response)
+
+    def _handle(self, path: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        new_id = self.server.new_id
+        if path.endswith("/batch"):
+            return {"BatchItemResponse": [
+                {"bId": item["bId"], entity: {"Id": str(new_id("invoices" if entity == "Invoice" else "customers"))}}
+                for item in body["BatchItemRequest"]
+                for entity in ("Invoice", "Customer") if entity in item
+            ]}
+        if path == "/api.xro/2.0/Invoices":
+            return {"Invoices": [{"InvoiceID": str(new_id("invoices"))} for _ in body["Invoices"]]}
+        if path == "/api.xro/2.0/Contacts":
+            return {"Contacts": [{"ContactID": str(new_id("customers"))} for _ in body["Contacts"]]}
+        if path == "/3/invoices":
+            return {"Invoice": {"DocumentNumber": new_id("invoices")}}
+        if path == "/3/customers":
+            return {"Customer": {"CustomerNumber": new_id("customers")}}
+        if path == "/v2/customerinvoicedrafts":
+            return {"Id": str(new_id("invoices"))}
+        if path == "/v2/customers":
+            return {"Id": str(new_id("customers"))}
+        return None
+
+    def _reply(self, code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == "__main__":
+    server = FakeAccountingServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8099)
+    print(f"Fake accounting server on {server.url}")
+    server.serve_forever()